@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+# Benchmark suite for the market RPCs: listing, adding, purchasing, purchasing equivalent
+# offers and getting contracts. Results are written as JSON and/or CSV, and two JSON result
+# files can be compared to flag regressions.
+#
+#   ./experiments/benchmark.py run -n 100 --json new.json
+#   ./experiments/benchmark.py compare old.json new.json --threshold 0.1
+
+
+from util import benchmark
+from util import conversion
+from util.experiments import MarketClient
+from util.standalone import run_django, InProcessMarket
+
+import argparse
+import grpc
+import sys
+
+
+SERVICE_ADDRESS = "localhost:50051"
+
+
+def run_benchmarks(iterations: int, concurrency: int, service_address: str=SERVICE_ADDRESS):
+    seller = MarketClient("1-ff00:0:110", service_address)
+    buyer = MarketClient("1-ff00:0:111", service_address)
+    results = []
+
+    # adding: each iteration adds one big offer, later used by the purchase benchmarks
+    def add(i):
+        seller.sell_offer(seller.create_simplified_offer(str(iterations * 10)))
+    results.append(benchmark.measure("add", add, iterations, concurrency, grpc.RpcError))
+
+    def list_offers(i):
+        buyer.list()
+    results.append(benchmark.measure("list", list_offers, iterations, concurrency, grpc.RpcError))
+
+    # purchasing: buy from the currently available offer; only the purchase is measured.
+    # Concurrent buyers compete for the same offer and fail (and retry) as in production.
+    contracts = []
+    def purchase(offer):
+        contracts.append(buyer.buy_offer(
+            offer=offer,
+            bw_profile="1",
+            starting_on=conversion.time_from_pb_timestamp(offer.specs.notbefore),
+        ))
+    results.append(benchmark.measure(
+        "purchase", purchase, iterations, concurrency, grpc.RpcError,
+        prepare=lambda i: buyer.list()[0]))
+
+    # purchasing equivalent: always request the same offer, which is deprecated after the
+    # first purchase; the market has to find the derived available one
+    requested_offer = buyer.list()[-1]
+    def purchase_equivalent(i):
+        contracts.append(buyer.buy_equivalent_offer(
+            offer=requested_offer,
+            bw_profile="1",
+            starting_on=conversion.time_from_pb_timestamp(requested_offer.specs.notbefore),
+        ))
+    results.append(benchmark.measure(
+        "purchase_equivalent", purchase_equivalent, iterations, concurrency, grpc.RpcError))
+
+    if len(contracts) == 0:
+        print("skipping get_contract: all the purchases failed", file=sys.stderr)
+        return results
+    def get_contract(i):
+        buyer.get_contract(contracts[i % len(contracts)].contract_id)
+    results.append(benchmark.measure(
+        "get_contract", get_contract, iterations, concurrency, grpc.RpcError))
+    return results
+
+
+def _seconds(value) -> str:
+    return "-" if value is None else f"{value:.6f}"
+
+
+def run(args) -> int:
+    if args.in_process:
+        # the RSA counts include also those of the market
+        with InProcessMarket() as market:
+            results = run_benchmarks(args.iterations, args.concurrency, market.service_address)
+    else:
+        django = run_django(True)
+        try:
+            results = run_benchmarks(args.iterations, args.concurrency)
+        finally:
+            try:
+                django.terminate()
+            finally:
+                django.kill()
+    metadata = benchmark.environment_metadata()
+    metadata["iterations"] = args.iterations
+    metadata["concurrency"] = args.concurrency
+    metadata["in_process"] = args.in_process
+    if args.json:
+        benchmark.write_json(args.json, results, metadata)
+    if args.csv:
+        benchmark.write_csv(args.csv, results)
+    for r in results:
+        s = r.summary()
+        print(f"{s['name']:>20}: p50={_seconds(s['p50'])} p95={_seconds(s['p95'])} " +\
+            f"p99={_seconds(s['p99'])} " +\
+            f"throughput={s['throughput']:.2f}/s failed={s['failed_attempt_ratio']:.2%} " +\
+            f"rsa(sign/verify)={s['rsa_sign']}/{s['rsa_verify']}")
+    return 0
+
+
+def compare(args) -> int:
+    regressions = benchmark.compare(
+        benchmark.load_json(args.old),
+        benchmark.load_json(args.new),
+        args.threshold,
+    )
+    for r in regressions:
+        print(f"REGRESSION {r.name}.{r.metric}: {r.old:.6g} -> {r.new:.6g} ({r.change:+.1%})")
+    if len(regressions) == 0:
+        print("no regressions")
+    return 1 if len(regressions) > 0 else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="market benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="run the benchmarks")
+    p.add_argument("-n", "--iterations", type=int, default=100)
+    p.add_argument("-c", "--concurrency", type=int, default=1, help="number of client threads")
+    p.add_argument("--json", help="write the results as JSON to this file")
+    p.add_argument("--csv", help="write the results as CSV to this file")
+    p.add_argument("--in-process", action="store_true",
+                   help="run the market in this process instead of with manage.py subprocesses")
+    p.set_defaults(func=run)
+    p = sub.add_parser("compare", help="compare two JSON result files")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.1,
+                   help="relative change considered a regression (default 0.1 = 10%%)")
+    p.set_defaults(func=compare)
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+# Micro-benchmark of the address and IA parsing functions in util.conversion, with and without
+# their caches.
+#
+#   PYTHONPATH=. ./experiments/benchmark_conversion.py
+
+
+from util import conversion
+
+import argparse
+import sys
+import timeit
+
+
+def cases():
+    """ tuples of (name, function, argument) """
+    return [
+        ("ip_port_from_str v4", conversion.ip_port_from_str, "10.1.1.1:50000"),
+        ("ip_port_from_str v4 (uncached)", conversion.ip_port_from_str.__wrapped__,
+         "10.1.1.1:50000"),
+        ("ip_port_from_str v6", conversion.ip_port_from_str, "[fd00:f00d:cafe::7f00:4]:50000"),
+        ("ip_port_from_str v6 (uncached)", conversion.ip_port_from_str.__wrapped__,
+         "[fd00:f00d:cafe::7f00:4]:50000"),
+        ("ip_port_range_from_str", conversion.ip_port_range_from_str, "10.1.1.1:50000-50010"),
+        ("ip_port_range_from_str (uncached)", conversion.ip_port_range_from_str.__wrapped__,
+         "10.1.1.1:50000-50010"),
+        ("ia_str_to_int", conversion.ia_str_to_int, "1-ff00:0:111"),
+        ("ia_str_to_int (uncached)", conversion._ia_str_to_int_cached.__wrapped__,
+         "1-ff00:0:111"),
+        ("ia_str_to_int (complete parser)", conversion._ia_str_to_int_slow, "1-ff00:0:111"),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="util.conversion micro-benchmark")
+    parser.add_argument("-n", "--number", type=int, default=100000, help="calls per repetition")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for name, f, arg in cases():
+        best = min(timeit.repeat(lambda: f(arg), number=args.number, repeat=args.repeat))
+        print(f"{name:>36}: {best / args.number * 1e9:8.1f} ns/call")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
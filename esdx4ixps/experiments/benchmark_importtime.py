@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# Cold start benchmark: runs the start up of the gRPC server with the full and the minimal
+# settings, and the import of the reloader, in fresh interpreters with `python -X importtime`.
+# Reports the wall time, the total import time and the slowest top level imports of each.
+#
+#   PYTHONPATH=. ./experiments/benchmark_importtime.py
+#
+# The settings must be importable; e.g. to use SQLite instead of MySQL, pass modules that
+# override DATABASES with --settings and --grpc-settings.
+
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def targets(settings: str, grpc_settings: str) -> List[Tuple[str, List[str], Dict[str, str]]]:
+    """ tuples of (name, arguments for python, extra environment) """
+    server = [str(ROOT / "grpcserver.py"), "--no-serve"]
+    return [
+        ("grpc server (settings)", server, {"DJANGO_SETTINGS_MODULE": settings}),
+        ("grpc server (grpc settings)", server, {"DJANGO_SETTINGS_MODULE": grpc_settings}),
+        ("reloader", ["-c", "import reloader.daemon"], {}),
+    ]
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, int, str]]:
+    """ returns (self us, cumulative us, module) for each line; nested modules are indented """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # header
+        imports.append((int(self_us), int(cumulative), name[1:].rstrip()))
+    return imports
+
+
+def measure(args: List[str], env: Dict[str, str]) -> Tuple[float, List[Tuple[int, int, str]]]:
+    """ returns the wall time and the imports of one run in a fresh interpreter """
+    t0 = time.perf_counter()
+    p = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=ROOT,
+                       env={**os.environ, **env}, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if p.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{p.stderr[-2000:]}")
+    return elapsed, parse_importtime(p.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="start up and import time benchmark")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="show the N slowest top level imports")
+    parser.add_argument("--settings", default="market.settings")
+    parser.add_argument("--grpc-settings", default="market.settings_grpc")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+    results = {}
+    for name, target, env in targets(args.settings, args.grpc_settings):
+        env = {"PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])),
+               **env}
+        runs = [measure(target, env) for _ in range(args.repeat)]
+        walls = [w for w, _ in runs]
+        imports = min(runs)[1]  # those of the fastest run
+        top_level = [(cumulative, module) for _, cumulative, module in imports
+                     if not module.startswith(" ")]
+        results[name] = {
+            "wall_min": min(walls),
+            "wall_median": statistics.median(walls),
+            "import_total": sum(c for c, _ in top_level) / 1e6,
+            "modules": len(imports),
+            "slowest": sorted(top_level, reverse=True)[:args.top],
+        }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    for name, r in results.items():
+        print(f"{name}: wall {r['wall_min'] * 1e3:.0f} ms (median {r['wall_median'] * 1e3:.0f}), "
+              f"imports {r['import_total'] * 1e3:.0f} ms, {r['modules']} modules")
+        for cumulative, module in r["slowest"]:
+            print(f"    {cumulative / 1e3:8.1f} ms  {module}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+# Benchmarks of the topology reloader on a synthetic topology with many interfaces, built from
+# doc/topology-scion-example.json. Compares the stdlib json module with the codec in use
+# (orjson if installed), and activating contracts with a cold and a warm topology cache.
+#
+#   PYTHONPATH=. ./experiments/benchmark_topology.py --interfaces 10000 --json topo.json
+
+
+from market_pb2 import Contract, OfferSpecification
+from pathlib import Path
+from reloader import codec
+from reloader.topology import Topology
+from tempfile import TemporaryDirectory
+from util import benchmark
+from util import conversion
+
+import argparse
+import copy
+import json
+import sys
+
+
+EXAMPLE = Path(__file__).resolve().parent.parent.parent / "doc" / "topology-scion-example.json"
+INTERNAL_ADDR = "127.0.0.200:31000"
+
+
+def synthetic_topology(interfaces: int, per_br: int=100) -> dict:
+    """ the example topology with its BR replicated until it has that many interfaces """
+    with open(EXAMPLE) as f:
+        topo = json.load(f)
+    template_br = next(iter(topo["border_routers"].values()))
+    template_iface = next(iter(template_br["interfaces"].values()))
+    topo["border_routers"] = {}
+    for i in range(interfaces):
+        br_index = i // per_br
+        name = f"br{topo['isd_as'].replace(':', '_')}-{br_index + 1}"
+        br = topo["border_routers"].get(name)
+        if br is None:
+            br = copy.deepcopy(template_br)
+            br["internal_addr"] = f"127.0.{br_index // 250}.{br_index % 250 + 1}:31012"
+            br["interfaces"] = {}
+            topo["border_routers"][name] = br
+        iface = copy.deepcopy(template_iface)
+        iface["underlay"]["public"] = f"127.1.{i // 10000}.1:{40000 + i % 10000}"
+        iface["underlay"]["remote"] = f"127.2.{i // 10000}.1:{40000 + i % 10000}"
+        br["interfaces"][str(i + 1)] = iface
+    return topo
+
+
+def _contract(isd_as: str, i: int) -> Contract:
+    return Contract(
+        offer=OfferSpecification(
+            iaid="1-ff00:0:110",
+            br_mtu=1500,
+            br_link_to="PARENT",
+        ),
+        buyer_iaid=isd_as,
+        buyer_bw_profile="1",
+        buyer_starting_on=conversion.pb_timestamp_from_seconds(0),
+        br_address=f"10.0.{i // 250}.{i % 250 + 1}:50000",
+    )
+
+
+def run_benchmarks(interfaces: int, iterations: int, batch: int):
+    results = []
+    topo = synthetic_topology(interfaces)
+    raw = codec.stdlib_dumps(topo)
+    results.append(benchmark.measure(
+        "load_stdlib", lambda i: codec.stdlib_loads(raw), iterations))
+    results.append(benchmark.measure(
+        f"load_{codec.BACKEND}", lambda i: codec.loads(raw), iterations))
+    results.append(benchmark.measure(
+        "dump_stdlib", lambda i: codec.stdlib_dumps(topo), iterations))
+    results.append(benchmark.measure(
+        f"dump_{codec.BACKEND}", lambda i: codec.dumps(topo), iterations))
+
+    with TemporaryDirectory() as temp:
+        topofile = Path(temp, "topology.json")
+        topofile.write_bytes(raw)
+        results.append(benchmark.measure(
+            "construct", lambda i: Topology(topofile, INTERNAL_ADDR), iterations))
+        contracts = [_contract(topo["isd_as"], i) for i in range(batch)]
+        def activate_deactivate(t: Topology):
+            t.activate_many(contracts)
+            t.deactivate_many(contracts)
+        # cold: a new Topology each time, which parses the file and builds its model
+        results.append(benchmark.measure(
+            f"activate_deactivate_{batch}_cold",
+            activate_deactivate,
+            iterations,
+            prepare=lambda i: Topology(topofile, INTERNAL_ADDR)))
+        # warm: the same Topology, that keeps the parsed file across calls
+        t = Topology(topofile, INTERNAL_ADDR)
+        results.append(benchmark.measure(
+            f"activate_deactivate_{batch}_warm",
+            lambda i: activate_deactivate(t),
+            iterations))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="topology reloader benchmarks")
+    parser.add_argument("--interfaces", type=int, default=10000)
+    parser.add_argument("-n", "--iterations", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=100,
+                        help="contracts activated and deactivated per iteration")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    results = run_benchmarks(args.interfaces, args.iterations, args.batch)
+    if args.json:
+        metadata = benchmark.environment_metadata()
+        metadata["interfaces"] = args.interfaces
+        metadata["codec"] = codec.BACKEND
+        benchmark.write_json(args.json, results, metadata)
+    for r in results:
+        s = r.summary()
+        print(f"{s['name']:>32}: p50={s['p50']:.6f} p95={s['p95']:.6f} mean={s['mean']:.6f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,16 +7,18 @@
 
 from util import conversion
 from util.experiments import Runner, MarketClient
+from util.standalone import InProcessMarket
 from provider import provider
 
+import argparse
 import sys
 import time
 import grpc
 
 
 
-def client(ia: str, wait: int):
-    c = MarketClient(ia, "localhost:50051")
+def client(ia: str, wait: int, service_address: str="localhost:50051"):
+    c = MarketClient(ia, service_address)
     pb_contract = None
     for _ in range(1000):
         offers = c.list()
@@ -37,6 +39,7 @@ def client(ia: str, wait: int):
     if pb_contract is None:
         print(f"Client with ID: {ia} too many attempts")
         return 1
+    c.verifier.verify(pb_contract)
     # unnecessary, but check the contract obtained independently
     pb_contract2 = c.get_contract(pb_contract.contract_id)
     if pb_contract.contract_signature != pb_contract2.contract_signature:
@@ -46,26 +49,42 @@ def client(ia: str, wait: int):
     return 0
 
 
-def experiment1(N: int) -> float:
-    """ returns the elapsed time to run the experiment1 with N buyers """
+def experiment1(N: int, market: InProcessMarket=None) -> float:
+    """
+    returns the elapsed time to run the experiment1 with N buyers.
+    If market is None, the market is started in a subprocess.
+    """
+    address = market.service_address if market is not None else "localhost:50051"
     r = Runner(
         provider,
         [
-            ("1-ff00:0:110", ),
+            ("1-ff00:0:110", address),
         ],
         client,
-        [("1-ff00:0:111", 0,)] * N,
+        [("1-ff00:0:111", 0, address)] * N,
     )
-    ret = r.run(True)
+    ret = r.run(True, market)
     if ret != 0:
         raise RuntimeError(f"experiment1 failed with {ret} for N = {N}")
     return r.timings["after_execution"] - r.timings["before_execution"]
 
-def main():
+def _experiment1_all(market: InProcessMarket=None) -> dict:
     results = {}
     for i in range(0, 101, 10):
-        results[i] = experiment1(i)
+        results[i] = experiment1(i, market)
         print(f"-------------------------- done {i}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subprocess", action="store_true",
+                        help="run the market with manage.py subprocesses instead of in-process")
+    args = parser.parse_args()
+    if args.subprocess:
+        results = _experiment1_all()
+    else:
+        with InProcessMarket() as market:
+            results = _experiment1_all(market)
     print(f"done")
     print("========================================")
     print("========================================")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# Load test: one provider with a big offer, and many concurrent (asyncio) buyers arriving
+# following a Poisson or bursty process. Prints the latency histogram summary per RPC.
+
+
+from provider import provider
+from util.experiments_aio import AsyncRunner, RetryPolicy, buyer
+from util.experiments_aio import bursty_arrivals, poisson_arrivals, exponential_think_time
+from util.standalone import InProcessMarket
+
+import argparse
+import functools
+import random
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio load generator for the market")
+    parser.add_argument("-n", "--buyers", type=int, default=10000, help="number of buyers")
+    parser.add_argument("--arrivals", choices=["poisson", "bursty"], default="poisson")
+    parser.add_argument("--rate", type=float, default=500,
+                        help="poisson: mean arrivals per second")
+    parser.add_argument("--burst-size", type=int, default=1000, help="bursty: buyers per burst")
+    parser.add_argument("--burst-interval", type=float, default=1,
+                        help="bursty: seconds between bursts")
+    parser.add_argument("--attempts", type=int, default=10, help="purchase attempts per buyer")
+    parser.add_argument("--backoff", type=float, default=0.05,
+                        help="seconds before the first retry (doubles each time)")
+    parser.add_argument("--think-time", type=float, default=0,
+                        help="mean think time in seconds between listing and buying")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--in-process", action="store_true",
+                        help="run the market in this process instead of with manage.py subprocesses")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.arrivals == "poisson":
+        arrivals = poisson_arrivals(args.buyers, args.rate, rng)
+    else:
+        arrivals = bursty_arrivals(args.buyers, args.burst_size, args.burst_interval, rng=rng)
+    buyer_fcn = functools.partial(
+        buyer,
+        retry=RetryPolicy(attempts=args.attempts, backoff=args.backoff),
+        think_time=exponential_think_time(args.think_time),
+    )
+    market = InProcessMarket().start() if args.in_process else None
+    address = market.service_address if market is not None else "localhost:50051"
+    r = AsyncRunner(
+        provider,
+        [("1-ff00:0:110", address),],
+        buyer_fcn,
+        [("1-ff00:0:111", )] * args.buyers,
+        arrivals=arrivals,
+        service_address=address,
+        seed=args.seed,
+    )
+    try:
+        ret = r.run(True, market)
+    finally:
+        if market is not None:
+            market.stop()
+    print(f"elapsed: {r.timings['after_execution'] - r.timings['before_execution']}")
+    print(f"counters: {r.session.counters}")
+    for name, h in r.session.latencies.items():
+        s = h.summary()
+        print(f"{name}:\t" + ", ".join(f"{k}={v:.6g}" for k, v in s.items()))
+    return ret
+
+
+if __name__ == "__main__":
+    sys.exit(main())
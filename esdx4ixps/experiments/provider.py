@@ -4,16 +4,19 @@
 
 
 from util.experiments import Runner, MarketClient
+from util.seller import SellerAgent
 import sys
 
 
-def provider(ia: str):
-    p = MarketClient(ia, "localhost:50051")
-    for i in range(10):
-        o = p.create_simplified_offer("20000")
-        saved = p.sell_offer(o)
-        print(f"provider created offer with id {saved.id}")
-    return 0
+def provider(ia: str, service_address: str="localhost:50051"):
+    p = MarketClient(ia, service_address)
+    with SellerAgent(ia, p.key, service_address) as agent:
+        failures = agent.sell_many(p.create_simplified_offer("20000") for i in range(10))
+        for f in failures:
+            print(f"provider could not create offer: {f.error}")
+        for l in agent.active_lineages():
+            print(f"provider created offer with id {l.offer_id}")
+    return 0 if len(failures) == 0 else 1
 
 
 def main():
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Starts the gRPC server of the market, with the minimal settings of market.settings_grpc.
+Unlike `manage.py grpcrunserver`, it does not load the management commands nor the autoreloader.
+"""
+import argparse
+import os
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ESDX market gRPC server")
+    parser.add_argument("address", nargs="?", default="[::]:50051",
+                        help="address to listen on")
+    parser.add_argument("--max-workers", type=int, default=10,
+                        help="number of worker threads")
+    parser.add_argument("--no-serve", action="store_true",
+                        help="set up the server and exit, to measure the start up time")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "market.settings_grpc")
+    import django
+    django.setup()
+    from concurrent import futures
+    from django_grpc_framework.settings import grpc_settings
+    import grpc
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=args.max_workers),
+                         interceptors=grpc_settings.SERVER_INTERCEPTORS)
+    grpc_settings.ROOT_HANDLERS_HOOK(server)
+    if args.no_serve:
+        return 0
+    if server.add_insecure_port(args.address) == 0:
+        print(f"cannot listen on {args.address}", file=sys.stderr)
+        return 1
+    server.start()
+    print(f"Starting gRPC server at {args.address}")
+    try:
+        server.wait_for_termination()
+    except KeyboardInterrupt:
+        server.stop(None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -47,6 +47,7 @@ def client(ia: str, wait: int):
     if pb_contract is None:
         print(f"Client with ID: {ia} too many attempts")
         return 1
+    c.verifier.verify(pb_contract)
     # unnecessary, but check the contract obtained independently
     pb_contract2 = c.get_contract(pb_contract.contract_id)
     if pb_contract.contract_signature != pb_contract2.contract_signature:
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MarketConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'market'
+
+    def ready(self):
+        from util import metrics
+        enabled = getattr(settings, "METRICS_ENABLED", None)
+        if enabled is not None:
+            metrics.set_enabled(enabled)
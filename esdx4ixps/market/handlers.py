@@ -0,0 +1,12 @@
+from django.conf import settings
+from market.services import MarketService
+from util import metrics
+import market_pb2_grpc
+
+
+def grpc_handlers(server):
+    market_pb2_grpc.add_MarketControllerServicer_to_server(MarketService.as_servicer(), server)
+    # the gRPC process does not serve the URLs; serve the metrics on their own
+    address = getattr(settings, "METRICS_HTTP_ADDRESS", None)
+    if address is not None:
+        metrics.start_http_server(address)
@@ -0,0 +1,220 @@
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+from util import metrics
+
+import cProfile
+import grpc
+import itertools
+import threading
+import time
+
+
+metrics.registry.describe(
+    "esdx_grpc_server_handling_seconds", "Time spent handling each RPC, by method")
+metrics.registry.describe(
+    "esdx_grpc_server_handled_total", "Number of RPCs handled, by method and outcome")
+
+
+def _wrap_handler(handler: grpc.RpcMethodHandler, around: Callable) -> grpc.RpcMethodHandler:
+    """
+    Returns a copy of the handler whose behavior runs inside the context manager returned by
+    around(request). For streaming responses, the context spans the whole stream: it is
+    entered before the first message and exited after the last one, or when the stream fails
+    or is cancelled. The messages are still sent as they are produced.
+    """
+    if handler is None:
+        return None
+    if handler.unary_unary is not None:
+        behavior = handler.unary_unary
+        def _unary(request, context):
+            with around(request):
+                return behavior(request, context)
+        return grpc.unary_unary_rpc_method_handler(
+            _unary,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+    if handler.unary_stream is not None:
+        behavior = handler.unary_stream
+        def _streamed(request, context):
+            with around(request):
+                yield from behavior(request, context)
+        return grpc.unary_stream_rpc_method_handler(
+            _streamed,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+    return handler  # streaming requests are not used by the market
+
+
+def _method_name(handler_call_details) -> str:
+    """ "/market.MarketController/Purchase" -> "Purchase" """
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """ counts the RPCs per method and outcome, and observes their latency """
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if not metrics.is_enabled():
+            return handler
+        method = _method_name(handler_call_details)
+
+        @contextmanager
+        def _around(request):
+            t0 = time.perf_counter()
+            code = "OK"
+            try:
+                yield
+            except Exception:
+                code = "ERROR"
+                raise
+            finally:
+                metrics.registry.observe(
+                    "esdx_grpc_server_handling_seconds",
+                    time.perf_counter() - t0,
+                    (("method", method),),
+                )
+                metrics.registry.inc(
+                    "esdx_grpc_server_handled_total",
+                    1,
+                    (("method", method), ("code", code)),
+                )
+        return _wrap_handler(handler, _around)
+
+
+# instance referenced by the GRPC_FRAMEWORK["SERVER_INTERCEPTORS"] setting
+metrics_interceptor = MetricsInterceptor()
+
+
+class ProfilingInterceptor(grpc.ServerInterceptor):
+    """
+    Profiles a sample of the RPCs and writes one dump per profiled call.
+    A call is kept if it is the Nth one (every_n) or if it took longer than slower_than seconds.
+    With slower_than set, every call is profiled, as we don't know in advance which ones will
+    be slow. Only one call is profiled at a time; concurrent calls run unprofiled.
+    The dumps are named {timestamp}-{method}-{offer_id}.prof (pstats format) and only the
+    newest max_dumps are kept in the directory.
+    With profiler="pyinstrument", the dumps are pyinstrument text reports (.txt).
+    """
+    def __init__(
+        self,
+        directory: str,
+        every_n: int=0,
+        slower_than: Optional[float]=None,
+        max_dumps: int=100,
+        profiler: str="cprofile",
+    ):
+        if profiler not in ("cprofile", "pyinstrument"):
+            raise ValueError(f"unknown profiler {profiler}")
+        if profiler == "pyinstrument":
+            import pyinstrument  # fail early if not installed
+        self.directory = Path(directory)
+        self.every_n = every_n
+        self.slower_than = slower_than
+        self.max_dumps = max_dumps
+        self.profiler = profiler
+        self._calls = itertools.count(1)
+        self._busy = threading.Lock()
+        self._rotate_lock = threading.Lock()
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if self.every_n <= 0 and self.slower_than is None:
+            return handler
+        method = _method_name(handler_call_details)
+
+        @contextmanager
+        def _around(request):
+            sampled = self.every_n > 0 and next(self._calls) % self.every_n == 0
+            if not (sampled or self.slower_than is not None) or not self._busy.acquire(False):
+                yield
+                return
+            try:
+                profiler = self._start()
+                t0 = time.perf_counter()
+                try:
+                    yield
+                finally:
+                    elapsed = time.perf_counter() - t0
+                    self._stop(profiler)
+                    if sampled or elapsed > self.slower_than:
+                        self._dump(profiler, method, _offer_id(request))
+            finally:
+                self._busy.release()
+        return _wrap_handler(handler, _around)
+
+    def _start(self):
+        if self.profiler == "pyinstrument":
+            import pyinstrument
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def _stop(self, profiler):
+        if self.profiler == "pyinstrument":
+            profiler.stop()
+        else:
+            profiler.disable()
+
+    def _dump(self, profiler, method: str, offer_id: str):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S.%f")
+        if self.profiler == "pyinstrument":
+            filename = self.directory.joinpath(f"{timestamp}-{method}-{offer_id}.txt")
+            filename.write_text(profiler.output_text())
+        else:
+            filename = self.directory.joinpath(f"{timestamp}-{method}-{offer_id}.prof")
+            profiler.dump_stats(filename)
+        self._rotate()
+
+    def _rotate(self):
+        """ removes the oldest dumps, keeping at most max_dumps """
+        with self._rotate_lock:
+            dumps = sorted(p for p in self.directory.iterdir() if p.suffix in (".prof", ".txt"))
+            for p in dumps[:max(0, len(dumps) - self.max_dumps)]:
+                p.unlink(missing_ok=True)
+
+
+def _offer_id(request) -> str:
+    """ the ID of the offer the request refers to, or of the contract, or "none" """
+    offer = getattr(request, "offer", None)
+    if offer is not None and offer.id != 0:
+        return str(offer.id)
+    contract_id = getattr(request, "contract_id", 0)
+    if contract_id != 0:
+        return f"contract{contract_id}"
+    return "none"
+
+
+class _LazyProfilingInterceptor(grpc.ServerInterceptor):
+    """ builds the ProfilingInterceptor from settings.PROFILING the first time it is used """
+    def __init__(self):
+        self._configured = False
+        self._interceptor = None
+
+    def intercept_service(self, continuation, handler_call_details):
+        if not self._configured:
+            from django.conf import settings
+            config = getattr(settings, "PROFILING", {})
+            if config.get("ENABLED", False):
+                self._interceptor = ProfilingInterceptor(
+                    directory=config.get("DIRECTORY", "profiles"),
+                    every_n=config.get("EVERY_N", 0),
+                    slower_than=config.get("SLOWER_THAN", None),
+                    max_dumps=config.get("MAX_DUMPS", 100),
+                    profiler=config.get("PROFILER", "cprofile"),
+                )
+            self._configured = True
+        if self._interceptor is None:
+            return continuation(handler_call_details)
+        return self._interceptor.intercept_service(continuation, handler_call_details)
+
+
+# instance referenced by the GRPC_FRAMEWORK["SERVER_INTERCEPTORS"] setting
+profiling_interceptor = _LazyProfilingInterceptor()
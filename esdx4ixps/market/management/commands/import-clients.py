@@ -0,0 +1,104 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from market.models.ases import AS
+from pathlib import Path
+from typing import List, Optional, Tuple
+from util import conversion
+from util import crypto
+
+import os
+
+
+def _ia_from_filename(path: Path) -> str:
+    """ 1-ff00_0_111.crt -> 1-ff00:0:111 """
+    return path.stem.replace("_", ":")
+
+
+def _read_manifest(manifest: Path) -> List[Tuple[str, Path, Optional[str]]]:
+    """
+    One client per line: IA, certificate file and optionally a name, separated by blanks.
+    Relative paths are relative to the manifest. Empty lines and lines starting with # are skipped.
+    """
+    entries = []
+    for line in manifest.read_text().splitlines():
+        line = line.strip()
+        if len(line) == 0 or line.startswith("#"):
+            continue
+        fields = line.split(maxsplit=2)
+        if len(fields) < 2:
+            raise CommandError(f"bad manifest line, expected IA and certificate: {line}")
+        entries.append((fields[0], manifest.parent.joinpath(fields[1]),
+                        fields[2] if len(fields) == 3 else None))
+    return entries
+
+
+def _check_certificate(entry: Tuple[str, Path, Optional[str]]) -> Tuple[str, str]:
+    """
+    Runs in the worker processes. Returns (PEM certificate, "") or ("", reason of the rejection).
+    The checks are those of ASManager.create.
+    """
+    ia, path, _ = entry
+    try:
+        conversion.ia_str_to_int(ia)
+        cert = crypto.load_certificate(Path(path).read_bytes())
+        cn = crypto.get_common_name(cert)
+        if cn != ia:
+            raise ValueError(f"common name doesn't match iaid ({cn} != {ia})")
+        return crypto.certificate_to_pem(cert), ""
+    except Exception as ex:
+        return "", str(ex) or type(ex).__name__
+
+
+class Command(BaseCommand):
+    help = "Creates many clients/providers in this IXP from their certificates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", type=Path,
+                            help="A directory with IA.crt files, with \":\" replaced by \"_\" " +
+                            "(e.g. 1-ff00_0_111.crt), or a manifest file with lines " +
+                            "\"IA certificate [name]\"")
+        parser.add_argument("--force", required=False, action="store_true",
+                            help="If an IA exists, remove the previous one")
+        parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                            help="Number of processes checking the certificates")
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        if source.is_dir():
+            entries = [(_ia_from_filename(p), p, None) for p in sorted(source.glob("*.crt"))]
+        elif source.is_file():
+            entries = _read_manifest(source)
+        else:
+            raise CommandError(f"{source} does not exist")
+
+        jobs = max(1, options["jobs"] or 1)
+        if jobs == 1 or len(entries) < 2:
+            results = list(map(_check_certificate, entries))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                chunksize = max(1, len(entries) // (4 * jobs))
+                results = list(pool.map(_check_certificate, entries, chunksize=chunksize))
+
+        rejected = []
+        clients = {}  # IA -> (certificate file, AS)
+        for (ia, path, name), (pem, error) in zip(entries, results):
+            if error != "":
+                rejected.append((path, error))
+            elif ia in clients:
+                rejected.append((path, f"IA {ia} repeated"))
+            else:
+                clients[ia] = (path, AS(iaid=ia, certificate_pem=pem, name=name or ia))
+
+        with transaction.atomic():
+            existing = set(AS.objects.filter(iaid__in=clients.keys()).values_list("iaid", flat=True))
+            if options["force"]:
+                AS.objects.filter(iaid__in=existing).delete()
+            else:
+                for ia in sorted(existing):
+                    rejected.append((clients.pop(ia)[0], f"IA {ia} exists already. Use --force"))
+            AS.objects.bulk_create(a for _, a in clients.values())
+
+        for path, error in rejected:
+            self.stdout.write(f"rejected {path}: {error}")
+        self.stdout.write(f"imported {len(clients)} clients, rejected {len(rejected)} files")
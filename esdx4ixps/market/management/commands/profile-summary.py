@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pathlib import Path
+
+import pstats
+import sys
+
+
+class Command(BaseCommand):
+    help = "Summarizes the hottest functions across the profiling dumps of the RPCs. " +\
+        "The pyinstrument reports cannot be merged, and are listed instead"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", nargs="?", type=str,
+                            help="Directory with the .prof dumps and .txt pyinstrument reports. " +
+                            "Defaults to PROFILING['DIRECTORY']")
+        parser.add_argument("--method", type=str, required=False,
+                            help="Only use the dumps of this RPC method, e.g. Purchase")
+        parser.add_argument("--sort", type=str, default="cumulative",
+                            choices=["cumulative", "tottime", "ncalls"],
+                            help="Sort key for the functions")
+        parser.add_argument("-n", "--limit", type=int, default=30,
+                            help="Number of functions to show")
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        if directory is None:
+            directory = getattr(settings, "PROFILING", {}).get("DIRECTORY", "profiles")
+        dumps = sorted(Path(directory).glob("*.prof"))
+        reports = sorted(Path(directory).glob("*.txt"))
+        if options["method"] is not None:
+            # names are {timestamp}-{method}-{offer_id}.prof, or .txt
+            dumps = [p for p in dumps if p.stem.split("-")[1] == options["method"]]
+            reports = [p for p in reports if p.stem.split("-")[1] == options["method"]]
+        if len(reports) > 0:
+            self.stdout.write(f"{len(reports)} pyinstrument reports, not summarized:")
+            for p in reports[-options["limit"]:]:
+                self.stdout.write(f"  {p}")
+            if len(reports) > options["limit"]:
+                self.stdout.write(f"  ... and {len(reports) - options['limit']} older ones")
+        if len(dumps) == 0:
+            if len(reports) > 0:
+                return
+            print(f"no dumps found in {directory}")
+            sys.exit(1)
+        methods = {}
+        for p in dumps:
+            method = p.stem.split("-")[1]
+            methods[method] = methods.get(method, 0) + 1
+        self.stdout.write(f"{len(dumps)} dumps: " +
+                          ", ".join(f"{m}={n}" for m, n in sorted(methods.items())))
+        stats = pstats.Stats(str(dumps[0]), stream=self.stdout)
+        for p in dumps[1:]:
+            stats.add(str(p))
+        stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["limit"])
@@ -1,4 +1,3 @@
-from urllib import request
 from django.db import models
 from django.utils import timezone as tz
 
@@ -39,7 +38,7 @@ class Contract(models.Model):
         return serialize.contract_fields_serialize_to_bytes(
             self.purchase_order.serialize_to_bytes(requested_offer),
             self.purchase_order.signature,
-            int(self.timestamp.timestamp()),
+            conversion.epoch_from_time(self.timestamp),
             self.br_address,
         )
 
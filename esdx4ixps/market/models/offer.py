@@ -108,23 +108,26 @@ class Offer(models.Model):
         if self.notafter < self.notbefore:
             raise ValueError("notafter must happen after notbefore")
         # check that the lifespan of the offer is a multiple of BW_PERIOD
-        lifespan = self.notafter - self.notbefore
-        if lifespan.total_seconds() % BW_PERIOD != 0:
+        slots = None
+        if self.notafter.microsecond == self.notbefore.microsecond:
+            slots = conversion.bw_slot(conversion.epoch_from_time(self.notafter),
+                                       conversion.epoch_from_time(self.notbefore))
+        if slots is None:
             raise ValueError("the life span of the offer must be a multiple of BW_PERIOD "+
                              f"({BW_PERIOD} secs)")
         # check that there are enough values in the bw_profile
         profile = csv_to_intlist(self.bw_profile)
-        if len(profile) != lifespan.total_seconds() // BW_PERIOD:
+        if len(profile) != slots:
             raise ValueError(f"bw_profile should contain exactly "+
-                             f"{lifespan.total_seconds() // BW_PERIOD} values; contains {len(profile)}")
+                             f"{slots} values; contains {len(profile)}")
         # check the br_address_template is an IP:port-port
         conversion.ip_port_range_from_str(self.br_address_template) # will raise ValueError if bad format
 
     def serialize_to_bytes(self, include_signature: bool=False):
         return serialize.offer_fields_serialize_to_bytes(
             self.iaid,
-            int(self.notbefore.timestamp()),
-            int(self.notafter.timestamp()),
+            conversion.epoch_from_time(self.notbefore),
+            conversion.epoch_from_time(self.notafter),
             self.reachable_paths,
             self.qos_class,
             self.price_per_unit,
@@ -179,10 +182,13 @@ class Offer(models.Model):
         """
         that_prof = csv_to_intlist(bw_profile)
         orig_prof = csv_to_intlist(self.bw_profile)
-        offset = (starting - self.notbefore).total_seconds()
-        if offset % BW_PERIOD != 0 or offset < 0:
+        # whole seconds since the epoch, sub-second parts can only be aligned if equal
+        if starting.microsecond != self.notbefore.microsecond:
+            return None
+        offset = conversion.bw_slot(conversion.epoch_from_time(starting),
+                                    conversion.epoch_from_time(self.notbefore))
+        if offset is None:
             return None
-        offset = int(offset // BW_PERIOD)
         this_prof = orig_prof[offset:]
         if len(that_prof) > len(this_prof):
             return None
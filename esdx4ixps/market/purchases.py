@@ -1,6 +1,4 @@
 from datetime import datetime
-import traceback
-from urllib import request
 from django.db import transaction
 from typing import Tuple
 from cryptography.hazmat.primitives.asymmetric import rsa
@@ -10,9 +8,12 @@ from market.models.purchase_order import PurchaseOrder
 from market.models.contract import Contract
 from util import conversion
 from util import crypto
+from util import metrics
 from util import serialize
 
-import copy
+
+metrics.registry.describe(
+    "esdx_purchase_stage_seconds", "Time spent in each stage of a purchase")
 
 
 def find_available_br_address(offer: Offer) -> str:
@@ -46,40 +47,50 @@ def purchase_offer(
     requested_offer: the offer that was originally specified in the purchase order
     available_offer: the offer that being derived from the requested_offer is still available
     """
+    stage = "esdx_purchase_stage_seconds"
     with transaction.atomic():
         # find buyer
-        buyer = AS.objects.get(iaid=buyer_iaid)
+        with metrics.timer(stage, stage="db_get_buyer"):
+            buyer = AS.objects.get(iaid=buyer_iaid)
         new_profile = available_offer.purchase(buyer_bw_profile, buyer_starting_on)
         if new_profile is None:
             raise RuntimeError("offer does not contain the requested BW profile")
 
         # create purchase order will already validate the signature:
-        purchase_order = PurchaseOrder.objects.create(
-            offer_id=available_offer.id,
-            buyer=buyer,
-            signature=buyer_signature,
-            bw_profile=buyer_bw_profile,
-            starting_on=buyer_starting_on,
-        )
+        with metrics.timer(stage, stage="db_create_purchase_order"):
+            purchase_order = PurchaseOrder.objects.create(
+                offer_id=available_offer.id,
+                buyer=buyer,
+                signature=buyer_signature,
+                bw_profile=buyer_bw_profile,
+                starting_on=buyer_starting_on,
+            )
         # validate the purchase order signature with the original requested offer
-        purchase_order.validate_signature(requested_offer)
+        with metrics.timer(stage, stage="verify_purchase_order"):
+            purchase_order.validate_signature(requested_offer)
 
         # create contract
         contract = Contract(
             purchase_order=purchase_order,
         )
-        contract.br_address = find_available_br_address(available_offer)
-        contract.stamp_signature(requested_offer)
-        contract.save()
+        with metrics.timer(stage, stage="db_find_br_address"):
+            contract.br_address = find_available_br_address(available_offer)
+        with metrics.timer(stage, stage="sign_contract"):
+            contract.stamp_signature(requested_offer)
+        with metrics.timer(stage, stage="db_save_contract"):
+            contract.save()
         # validate the contract using the purchase order with the original requested offer:
-        contract.validate_signature(requested_offer)
+        with metrics.timer(stage, stage="verify_contract"):
+            contract.validate_signature(requested_offer)
         # create new offer
         new_offer = available_offer.clone()
         new_offer.id = None
         new_offer.deprecates = available_offer
         new_offer.bw_profile = new_profile
-        new_offer.sign_with_broker()
-        new_offer.save()
+        with metrics.timer(stage, stage="sign_new_offer"):
+            new_offer.sign_with_broker()
+        with metrics.timer(stage, stage="db_save_new_offer"):
+            new_offer.save()
     return contract, new_offer
 
 
@@ -94,7 +105,7 @@ def sign_purchase_order(
         offer_bytes=o.serialize_to_bytes(True),
         ia_id=buyer_ia,
         bw_profile=bw_profile,
-        starting_on=int(starting_on.timestamp())
+        starting_on=conversion.epoch_from_time(starting_on)
     )
     return crypto.signature_create(buyer_key, data)
 
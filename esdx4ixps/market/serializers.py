@@ -69,8 +69,8 @@ class OfferProtoSerializer(proto_serializers.ProtoSerializer):
     def serialize_to_bytes(self) -> bytes:
         return serialize.offer_fields_serialize_to_bytes(
             self.validated_data["iaid"],
-            int(self.validated_data["notbefore"].timestamp()),
-            int(self.validated_data["notafter"].timestamp()),
+            conversion.epoch_from_time(self.validated_data["notbefore"]),
+            conversion.epoch_from_time(self.validated_data["notafter"]),
             self.validated_data["reachable_paths"],
             self.validated_data["qos_class"],
             self.validated_data["price_per_unit"],
@@ -95,6 +95,15 @@ class ContractProtoSerializer(proto_serializers.ModelProtoSerializer):
     # def message_to_data(self, message: market_pb2.Contract) -> dict:
     #     return super().message_to_data(message)
 
+    @property
+    def message(self) -> market_pb2.Contract:
+        """ built directly from the instance, without the round trip through DRF strings """
+        if not isinstance(self.instance, Contract):
+            return super().message
+        if not hasattr(self, "_message"):
+            self._message = contract_to_message(self.instance)
+        return self._message
+
     def data_to_message(self, data: dict) -> market_pb2.Contract:
         """ dict of fields from the model Contract to the protobuf Contract """
         po = data["purchase_order"]
@@ -125,6 +134,35 @@ class ContractProtoSerializer(proto_serializers.ModelProtoSerializer):
         )
 
 
+def contract_to_message(contract: Contract) -> market_pb2.Contract:
+    """ same message as ContractProtoSerializer.data_to_message, from the model instances """
+    po = contract.purchase_order
+    offer = po.offer
+    return market_pb2.Contract(
+        contract_id=contract.id,
+        contract_timestamp=conversion.pb_timestamp_from_time(contract.timestamp),
+        contract_signature=bytes(contract.signature_broker),
+        offer=market_pb2.OfferSpecification(
+            iaid=offer.iaid,
+            notbefore=conversion.pb_timestamp_from_time(offer.notbefore),
+            notafter=conversion.pb_timestamp_from_time(offer.notafter),
+            reachable_paths=offer.reachable_paths,
+            qos_class=int(offer.qos_class),
+            price_per_unit=float(offer.price_per_unit),
+            bw_profile=offer.bw_profile,
+            br_address_template=offer.br_address_template,
+            br_mtu=int(offer.br_mtu),
+            br_link_to=offer.br_link_to,
+            signature=bytes(offer.signature),
+        ),
+        br_address=contract.br_address,
+        buyer_iaid=po.buyer.iaid,
+        buyer_starting_on=conversion.pb_timestamp_from_time(po.starting_on),
+        buyer_bw_profile=po.bw_profile,
+        buyer_signature=bytes(po.signature),
+    )
+
+
 def pb_compare_messages(msg1, msg2) -> bool:
     if type(msg1) != type(msg2):
         return False
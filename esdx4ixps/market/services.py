@@ -8,6 +8,7 @@ from market.purchases import purchase_offer
 from util.conversion import time_from_pb_timestamp
 from util import crypto
 from util import conversion
+from util import metrics
 from util import serialize
 
 import copy
@@ -67,24 +68,35 @@ class MarketService(Service):
         offers_getter,
     ):
         global purchase_mutex
+        stage = "esdx_purchase_stage_seconds"
         try:
-            with purchase_mutex, transaction.atomic():
-                requested_offer, available_offer = offers_getter()
-                # check that this offer matches request.offer
-                if not pb_compare_messages(request.offer, OfferProtoSerializer(requested_offer).message):
-                    raise MarketServiceError("purchase request validation failed: " + \
-                        f"offer with ID {request.offer.id} not the same as in the request")
-                # create contract and new offer
-                contract, _ = purchase_offer(
-                    requested_offer,
-                    available_offer,
-                    request.buyer_iaid,
-                    time_from_pb_timestamp(request.starting_on),
-                    request.bw_profile,
-                    request.signature,
-                )
-            serializer = ContractProtoSerializer(contract)
-            return serializer.message
+            with metrics.timer(stage, stage="lock_wait"):
+                purchase_mutex.acquire()
+            try:
+                with metrics.timer(stage, stage="locked"), transaction.atomic():
+                    with metrics.timer(stage, stage="db_get_offers"):
+                        requested_offer, available_offer = offers_getter()
+                    # check that this offer matches request.offer
+                    with metrics.timer(stage, stage="compare_offer"):
+                        same = pb_compare_messages(
+                            request.offer, OfferProtoSerializer(requested_offer).message)
+                    if not same:
+                        raise MarketServiceError("purchase request validation failed: " + \
+                            f"offer with ID {request.offer.id} not the same as in the request")
+                    # create contract and new offer
+                    contract, _ = purchase_offer(
+                        requested_offer,
+                        available_offer,
+                        request.buyer_iaid,
+                        time_from_pb_timestamp(request.starting_on),
+                        request.bw_profile,
+                        request.signature,
+                    )
+            finally:
+                purchase_mutex.release()
+            with metrics.timer(stage, stage="serialize_contract"):
+                serializer = ContractProtoSerializer(contract)
+                return serializer.message
         except MarketServiceError:
             raise
         except IntegrityError as ex:
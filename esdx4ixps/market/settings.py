@@ -138,3 +138,36 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# gRPC server configuration (django_grpc_framework)
+
+GRPC_FRAMEWORK = {
+    'SERVER_INTERCEPTORS': [
+        'market.interceptors.metrics_interceptor',
+        'market.interceptors.profiling_interceptor',
+    ],
+}
+
+
+# Metrics (see util.metrics)
+# When disabled, the instrumentation only costs a boolean check per timer or counter.
+# None keeps the value of the ESDX_METRICS environment variable (enabled unless it is 0).
+
+METRICS_ENABLED = None
+
+# If not None, the gRPC server also serves the metrics via HTTP, e.g. 'localhost:9100'
+METRICS_HTTP_ADDRESS = None
+
+
+# Profiling of sampled RPCs (see market.interceptors.ProfilingInterceptor)
+# Summarize the dumps with: ./manage.py profile-summary [DIRECTORY]
+
+PROFILING = {
+    'ENABLED': False,
+    'DIRECTORY': str(BASE_DIR / 'profiles'),
+    'EVERY_N': 100,  # profile every Nth RPC; 0 to disable
+    'SLOWER_THAN': None,  # seconds; if set, profile all RPCs and keep those slower than this
+    'MAX_DUMPS': 100,  # the oldest dumps are removed
+    'PROFILER': 'cprofile',  # or 'pyinstrument', if installed
+}
@@ -0,0 +1,29 @@
+"""
+Minimal settings for the gRPC server (see grpcserver.py).
+
+The gRPC process does not serve the web site, so it does not need the admin, auth, sessions,
+messages and staticfiles apps, nor the middleware and templates. Not loading them makes
+the start up of the process faster.
+"""
+
+from market.settings import *  # noqa: F401,F403
+
+
+INSTALLED_APPS = [
+    'market.apps.MarketConfig',
+    'django_grpc_framework',
+]
+
+MIDDLEWARE = []
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+USE_I18N = False
+
+GRPC_FRAMEWORK = {
+    **GRPC_FRAMEWORK,  # noqa: F405
+    # instead of ROOT_URLCONF.grpc_handlers, which also imports the admin site
+    'ROOT_HANDLERS_HOOK': 'market.handlers.grpc_handlers',
+}
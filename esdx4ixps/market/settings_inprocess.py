@@ -0,0 +1,23 @@
+"""
+Settings for running the market in-process (see util.standalone.InProcessMarket).
+
+The database is a SQLite file in a temporary directory, named by ESDX_INPROCESS_DB, that the
+harness creates and migrates when it starts. It is used in WAL mode (set by the harness on
+each connection), so that the readers do not block the writer, and with a busy timeout for
+the writers to wait for each other.
+"""
+
+from market.settings import *  # noqa: F401,F403
+
+import os
+
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get("ESDX_INPROCESS_DB", "esdx_inprocess.sqlite3"),
+        'OPTIONS': {
+            'timeout': 30,
+        },
+    },
+}
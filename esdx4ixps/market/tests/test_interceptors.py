@@ -0,0 +1,112 @@
+from collections import namedtuple
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from io import StringIO
+from market.interceptors import MetricsInterceptor, ProfilingInterceptor
+from tempfile import TemporaryDirectory
+from pathlib import Path
+from util import metrics
+
+import grpc
+import market_pb2
+import time
+
+
+_CallDetails = namedtuple("_CallDetails", ["method", "invocation_metadata"])
+
+
+class TestProfilingInterceptor(SimpleTestCase):
+    @staticmethod
+    def _call(interceptor, method: str, request, behavior):
+        handler = grpc.unary_unary_rpc_method_handler(behavior)
+        details = _CallDetails(f"/market.MarketController/{method}", ())
+        handler = interceptor.intercept_service(lambda d: handler, details)
+        return handler.unary_unary(request, None)
+
+    def test_every_n(self):
+        with TemporaryDirectory() as temp:
+            interceptor = ProfilingInterceptor(temp, every_n=2, max_dumps=3)
+            request = market_pb2.PurchaseRequest(offer=market_pb2.Offer(id=42))
+            for i in range(10):
+                self.assertEqual(self._call(interceptor, "Purchase", request, lambda r, c: i), i)
+            dumps = sorted(Path(temp).iterdir())
+            self.assertEqual(len(dumps), 3)  # 5 were written, the oldest removed
+            for p in dumps:
+                self.assertTrue(p.name.endswith("-Purchase-42.prof"), p.name)
+            out = StringIO()
+            call_command("profile-summary", temp, "--method", "Purchase", stdout=out)
+            self.assertIn("function calls", out.getvalue())
+
+    def test_summary_pyinstrument(self):
+        with TemporaryDirectory() as temp:
+            for name in ("1-Purchase-42.txt", "2-Purchase-43.txt", "3-AddOffer-none.txt"):
+                Path(temp, name).write_text("pyinstrument report\n")
+            out = StringIO()
+            call_command("profile-summary", temp, "--method", "Purchase", stdout=out)
+            self.assertIn("2 pyinstrument reports, not summarized", out.getvalue())
+            self.assertIn("2-Purchase-43.txt", out.getvalue())
+            self.assertNotIn("AddOffer", out.getvalue())
+
+    def test_slower_than(self):
+        with TemporaryDirectory() as temp:
+            interceptor = ProfilingInterceptor(temp, slower_than=0.05)
+            request = market_pb2.GetContractRequest(contract_id=7)
+            self._call(interceptor, "GetContract", request, lambda r, c: None)
+            self.assertEqual(len(list(Path(temp).iterdir())), 0)
+            self._call(interceptor, "GetContract", request, lambda r, c: time.sleep(0.1))
+            dumps = list(Path(temp).iterdir())
+            self.assertEqual(len(dumps), 1)
+            self.assertTrue(dumps[0].name.endswith("-GetContract-contract7.prof"))
+
+    def test_exception(self):
+        with TemporaryDirectory() as temp:
+            interceptor = ProfilingInterceptor(temp, every_n=1)
+            def fails(request, context):
+                raise ValueError()
+            with self.assertRaises(ValueError):
+                self._call(interceptor, "AddOffer", market_pb2.OfferSpecification(), fails)
+            dumps = list(Path(temp).iterdir())
+            self.assertEqual(len(dumps), 1)
+            self.assertTrue(dumps[0].name.endswith("-AddOffer-none.prof"))
+
+
+class TestMetricsInterceptor(SimpleTestCase):
+    def setUp(self):
+        metrics.set_enabled(True)
+        metrics.registry.clear()
+
+    def tearDown(self):
+        metrics.registry.clear()
+
+    def test_streams(self):
+        produced = []
+        def behavior(request, context):
+            for i in range(3):
+                produced.append(i)
+                yield i
+        handler = grpc.unary_stream_rpc_method_handler(behavior)
+        details = _CallDetails("/market.MarketController/ListOffers", ())
+        handler = MetricsInterceptor().intercept_service(lambda d: handler, details)
+        stream = handler.unary_stream(market_pb2.ListRequest(), None)
+        # the messages are sent as produced, not after reading the whole stream
+        self.assertEqual(next(stream), 0)
+        self.assertEqual(produced, [0])
+        snapshot = metrics.registry.snapshot()
+        self.assertNotIn('esdx_grpc_server_handled_total{method="ListOffers",code="OK"}', snapshot)
+        self.assertEqual(list(stream), [1, 2])
+        snapshot = metrics.registry.snapshot()
+        self.assertEqual(snapshot['esdx_grpc_server_handled_total{method="ListOffers",code="OK"}'], 1)
+        self.assertEqual(snapshot['esdx_grpc_server_handling_seconds_count{method="ListOffers"}'], 1)
+
+    def test_stream_error(self):
+        def behavior(request, context):
+            yield 1
+            raise ValueError()
+        handler = grpc.unary_stream_rpc_method_handler(behavior)
+        details = _CallDetails("/market.MarketController/ListOffers", ())
+        handler = MetricsInterceptor().intercept_service(lambda d: handler, details)
+        stream = handler.unary_stream(market_pb2.ListRequest(), None)
+        self.assertEqual(next(stream), 1)
+        self.assertRaises(ValueError, next, stream)
+        snapshot = metrics.registry.snapshot()
+        self.assertEqual(snapshot['esdx_grpc_server_handled_total{method="ListOffers",code="ERROR"}'], 1)
@@ -1,4 +1,5 @@
 from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.management import call_command
 from django.test import TestCase
 from django.utils import timezone as tz
 from market.models.ases import AS
@@ -7,12 +8,15 @@ from market.models.contract import Contract
 from market.models.offer import Offer, BW_PERIOD
 from market.models.purchase_order import PurchaseOrder
 from market.purchases import purchase_offer, find_available_br_address
+from io import StringIO
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from util import crypto
 from util import serialize
 from util.test import test_data
 
 import datetime
+import shutil
 
 
 class TestOffer(TestCase):
@@ -214,6 +218,34 @@ class TestAS(TestCase):
             cert=cert,
         )
 
+    def test_import_clients(self):
+        with TemporaryDirectory() as temp:
+            for ia in ["1-ff00_0_110", "1-ff00_0_111", "1-ff00_0_112"]:
+                shutil.copy(test_data(ia + ".crt"), temp)
+            shutil.copy(test_data("1-ff00_0_110.crt"), Path(temp, "1-ff00_0_113.crt"))  # bad CN
+            Path(temp, "1-ff00_0_114.crt").write_text("not a certificate")
+            out = StringIO()
+            call_command("import-clients", temp, "--jobs", "2", stdout=out)
+            self.assertEqual(sorted(AS.objects.values_list("iaid", flat=True)),
+                             ["1-ff00:0:110", "1-ff00:0:111", "1-ff00:0:112"])
+            self.assertIn("1-ff00_0_113.crt: common name doesn't match", out.getvalue())
+            self.assertIn("1-ff00_0_114.crt: this does not look like", out.getvalue())
+            self.assertIn("imported 3 clients, rejected 2 files", out.getvalue())
+            # manifest, with an existing IA and a name
+            Path(temp, "manifest").write_text(
+                "# IA certificate name\n"
+                "1-ff00:0:111 1-ff00_0_111.crt\n"
+                "1-ff00:0:113 1-ff00_0_110.crt\n"
+                "1-ff00:0:110 1-ff00_0_110.crt Client 110\n")
+            out = StringIO()
+            call_command("import-clients", Path(temp, "manifest"), "--force", stdout=out)
+            self.assertIn("imported 2 clients, rejected 1 files", out.getvalue())
+            self.assertEqual(AS.objects.get(iaid="1-ff00:0:110").name, "Client 110")
+            out = StringIO()
+            call_command("import-clients", Path(temp, "manifest"), stdout=out)
+            self.assertIn("1-ff00:0:111 exists already", out.getvalue())
+            self.assertIn("imported 0 clients, rejected 3 files", out.getvalue())
+
 
 class TestBroker(TestCase):
     fixtures = ["testdata"]
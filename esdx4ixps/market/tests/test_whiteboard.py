@@ -7,10 +7,11 @@ from pathlib import Path
 from market.models.offer import Offer, BW_PERIOD
 from market.models.contract import Contract
 from market.purchases import sign_purchase_order, sign_get_contract_request
-from market.serializers import OfferProtoSerializer
+from market.serializers import OfferProtoSerializer, ContractProtoSerializer, pb_compare_messages
 from market import services
 from util import conversion
 from util import crypto
+from util import metrics
 from util import serialize
 from util.test import test_data
 
@@ -221,3 +222,21 @@ class TestWhiteboard(TestCase):
             self.assertEqual(o.br_mtu, po.offer.br_mtu)
             self.assertEqual(o.br_link_to, po.offer.br_link_to)
             self.assertEqual(o.signature, po.offer.signature)
+            # the message built from the instance is the same as the one from the DRF data
+            serializer = ContractProtoSerializer(contract)
+            self.assertTrue(pb_compare_messages(
+                response, serializer.data_to_message(serializer.data)))
+
+    def test_purchase_metrics(self):
+        metrics.registry.clear()
+        self.test_purchase()
+        snapshot = metrics.registry.snapshot()
+        for stage in ["lock_wait", "db_get_offers", "verify_purchase_order", "sign_contract",
+                      "sign_new_offer", "serialize_contract"]:
+            self.assertEqual(
+                snapshot[f'esdx_purchase_stage_seconds_count{{stage="{stage}"}}'], 1, stage)
+        self.assertGreater(snapshot['esdx_crypto_seconds_count{operation="sign"}'], 0)
+        # and they are exported in the Prometheus text format
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'esdx_purchase_stage_seconds_count{stage="lock_wait"} 1\n', response.content)
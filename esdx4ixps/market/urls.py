@@ -13,14 +13,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path
-from market.services import MarketService
-import market_pb2_grpc
+from market.handlers import grpc_handlers  # noqa: F401 found via ROOT_URLCONF by grpcrunserver
+from market.views import metrics_view
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    path('metrics', metrics_view),
 ]
 
-def grpc_handlers(server):
-    market_pb2_grpc.add_MarketControllerServicer_to_server(MarketService.as_servicer(), server)
+# not installed with the minimal settings of market.settings_grpc
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
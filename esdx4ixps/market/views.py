@@ -1,3 +1,10 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from util import metrics
 
-# Create your views here.
+
+def metrics_view(request):
+    """ the metrics of this process in the Prometheus text format """
+    return HttpResponse(
+        metrics.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
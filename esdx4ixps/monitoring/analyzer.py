@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+
+# Contract compliance from the logs of the bandwidth monitor (../monitor). The monitor logs the
+# cumulative byte and packet counters of each (ingress, egress) interface pair of the provider
+# hop that had activity, every few seconds:
+#
+#   2022/04/01 20:00:10 Hop 41 -> 1: 123456 bytes, 100 packets
+#
+# The analyzer diffs consecutive messages, assigns the bytes to the BW_PERIOD slots of the
+# contracts whose interface is in the pair, and when a slot is over compares its bandwidth
+# with the one in the contract. The interface IDs are reused: with the contract index of the
+# reloader, the bytes of an interface go only to the contract that had it at the time of the
+# sample. It keeps only the counters of each pair and the open slots of
+# the active contracts, so its memory does not grow with the length of the logs.
+#
+# The downstream monitor (on the buyer side) shows the bandwidth used by the buyer, and the
+# upstream one what the provider forwarded. With only one of the logs, under-delivery cannot
+# be checked. With --follow, the contracts and the topology or index are read again when they
+# change, so the contracts spooled to the reloader later are monitored too.
+#
+#   PYTHONPATH=. ./monitoring/analyzer.py --topology topology.json --contracts spool/done \
+#       --downstream downstream.log --upstream upstream.log --follow
+
+
+from defs import BW_PERIOD, BW_STEP
+from market_pb2 import Contract
+from pathlib import Path
+from reloader import codec
+from reloader.index import ContractIndex
+from reloader.model import TopologyModel
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from util import conversion
+
+import argparse
+import datetime
+import heapq
+import os
+import re
+import sys
+import time
+
+
+DOWNSTREAM = "downstream"
+UPSTREAM = "upstream"
+
+OVERUSE = "overuse"
+UNDERDELIVERY = "underdelivery"
+
+_LINE_RE = re.compile(
+    r"(\d{4})/(\d\d)/(\d\d) (\d\d):(\d\d):(\d\d)(?:\.\d+)? "
+    r"(?:Hop (\d+) -> (\d+): (\d+) bytes, (\d+) packets|Delete hop: (\d+) -> (\d+))")
+
+
+class Sample(NamedTuple):
+    """ counters of a hop (ingress, egress) at a time, in seconds since the epoch """
+    time: int
+    hop: Tuple[int, int]
+    bytes: int
+    packets: int
+    deleted: bool=False  # the monitor removed the hop: its counters start again from zero
+
+
+def parse_line(line: str, tz: Optional[datetime.tzinfo]=datetime.timezone.utc) -> Optional[Sample]:
+    """
+    Returns the sample in the line, or None if the line is not a counters line.
+    tz: time zone of the log timestamps, or None for the local time, as the monitor logs.
+    """
+    m = _LINE_RE.search(line)
+    if m is None:
+        return None
+    t = datetime.datetime(*map(int, m.group(1, 2, 3, 4, 5, 6)), tzinfo=tz)
+    epoch = conversion.epoch_from_time(t)
+    if m.group(7) is None:
+        return Sample(epoch, (int(m.group(11)), int(m.group(12))), 0, 0, deleted=True)
+    return Sample(epoch, (int(m.group(7)), int(m.group(8))), int(m.group(9)), int(m.group(10)))
+
+
+class HopCounters:
+    """
+    Converts the cumulative counters of each hop to the bytes of each interval between samples.
+    interval: the logging interval of the monitor. Hops without activity are not logged, so
+    the bytes of a sample are assigned to at most the interval before it.
+    """
+    def __init__(self, interval: int=10):
+        self.interval = interval
+        self._last: Dict[Tuple[int, int], Tuple[int, int]] = {}  # hop -> (time, bytes)
+
+    def __len__(self):
+        return len(self._last)
+
+    def update(self, s: Sample) -> Optional[Tuple[int, int, int]]:
+        """ returns (start, end, bytes) since the previous sample of the hop, or None """
+        if s.deleted:
+            self._last[s.hop] = (s.time, 0)
+            return None
+        last = self._last.get(s.hop)
+        self._last[s.hop] = (s.time, s.bytes)
+        if last is None:
+            return None  # the counters do not necessarily start from zero
+        last_time, last_bytes = last
+        delta = s.bytes - last_bytes if s.bytes >= last_bytes else s.bytes  # counters reset
+        if delta == 0:
+            return None
+        return max(last_time, s.time - self.interval), s.time, delta
+
+
+class Violation(NamedTuple):
+    kind: str  # OVERUSE or UNDERDELIVERY
+    contract_id: int
+    slot_start: int  # seconds since the epoch
+    contracted_bps: float
+    downstream_bps: Optional[float]
+    upstream_bps: Optional[float]
+
+    def __str__(self):
+        def _bps(v):
+            return "-" if v is None else f"{v:.0f}"
+        t = conversion.time_from_epoch(self.slot_start).isoformat()
+        return f"{self.kind} contract {self.contract_id} slot {t}: " + \
+            f"contracted {_bps(self.contracted_bps)} bps, " + \
+            f"downstream {_bps(self.downstream_bps)} bps, upstream {_bps(self.upstream_bps)} bps"
+
+
+class _ContractUsage:
+    """ bytes per role of the open slots of a contract """
+    def __init__(self, contract: Contract):
+        self.contract_id = contract.contract_id
+        self.start = conversion.epoch_from_pb_timestamp(contract.buyer_starting_on)
+        self.profile = conversion.csv_to_intlist(contract.buyer_bw_profile)
+        self.end = self.start + len(self.profile) * BW_PERIOD
+        self.next_slot = 0  # the slots before this one are closed
+        self.slots: Dict[int, Dict[str, float]] = {}  # slot -> role -> bytes
+
+    def add(self, role: str, start: int, end: int, nbytes: int):
+        """ spreads the bytes of [start, end) evenly over the open slots """
+        lo, hi = max(start, self.start), min(end, self.end)
+        if lo >= hi:
+            return
+        duration = max(1, end - start)
+        slot = (lo - self.start) // BW_PERIOD
+        while lo < hi:
+            slot_end = min(hi, self.start + (slot + 1) * BW_PERIOD)
+            if slot >= self.next_slot:
+                counts = self.slots.setdefault(slot, {})
+                counts[role] = counts.get(role, 0) + nbytes * (slot_end - lo) / duration
+            lo = slot_end
+            slot += 1
+
+
+class ComplianceAnalyzer:
+    """
+    Joins the samples of the monitors with the contracts, and reports the violations of each
+    BW_PERIOD slot once it is over in the logs of all the roles.
+    roles: the monitors whose logs are fed, DOWNSTREAM and/or UPSTREAM.
+    tolerance: relative difference with the contracted bandwidth that is not a violation.
+    interval: logging interval of the monitors.
+    index, ia: the contract index of the reloader and the provider AS in it. If set, the bytes
+               of an interface go only to the contract that had it at the time of the sample,
+               instead of to all the contracts added with that interface.
+    """
+    def __init__(self, roles: Iterable[str]=(DOWNSTREAM, UPSTREAM), tolerance: float=0.05,
+                 interval: int=10, index: Optional[ContractIndex]=None, ia: Optional[str]=None):
+        if index is not None and ia is None:
+            raise ValueError("the AS of the index is needed")
+        self.roles = tuple(roles)
+        self.tolerance = tolerance
+        self.counters = {role: HopCounters(interval) for role in self.roles}
+        self.grace = interval  # the bytes of a slot are logged up to an interval after it ends
+        self.index = index
+        self.ia = ia
+        self._usages: Dict[int, _ContractUsage] = {}  # contract_id -> usage
+        self._contracts: Dict[int, List[_ContractUsage]] = {}  # ifid -> contracts
+        self._latest: Dict[str, int] = {}  # role -> time of the latest sample
+        self._next_close = float("inf")  # when the earliest open slot ends
+
+    def active_contracts(self) -> int:
+        return len(self._usages)
+
+    def add_contract(self, contract: Contract, ifid: int):
+        """
+        ifid: the interface of the contract in the provider AS (see contract_interfaces).
+        A contract can be added with several interfaces, if it was reactivated with another one.
+        """
+        usage = self._usages.get(contract.contract_id)
+        if usage is None:
+            usage = _ContractUsage(contract)
+            self._usages[contract.contract_id] = usage
+            self._next_close = min(self._next_close, usage.start + BW_PERIOD)
+        usages = self._contracts.setdefault(ifid, [])
+        if usage not in usages:
+            usages.append(usage)
+
+    def feed(self, role: str, s: Sample) -> List[Violation]:
+        """ processes a sample of the monitor of that role; returns the new violations """
+        interval = self.counters[role].update(s)
+        if interval is not None:
+            start, end, nbytes = interval
+            for ifid in set(s.hop):
+                usages = self._contracts.get(ifid, ())
+                if self.index is not None and len(usages) > 0:
+                    contract_id = self.index.lookup(self.ia, ifid, start)
+                    usages = [u for u in usages if u.contract_id == contract_id]
+                for usage in usages:
+                    usage.add(role, start, end, nbytes)
+        self._latest[role] = max(self._latest.get(role, s.time), s.time)
+        if len(self._latest) < len(self.roles):
+            return []  # the other logs could still have bytes for any slot
+        return self.close_until(min(self._latest.values()) - self.grace)
+
+    def close_until(self, t: float) -> List[Violation]:
+        """ evaluates the slots ending before t, and forgets the contracts that ended """
+        if t < self._next_close:
+            return []
+        violations = []
+        self._next_close = float("inf")
+        for contract_id in list(self._usages):
+            usage = self._usages[contract_id]
+            closed = len(usage.profile) if t >= usage.end else \
+                max(0, int((t - usage.start) // BW_PERIOD))
+            for slot in range(usage.next_slot, closed):
+                v = self._evaluate(usage, slot, usage.slots.pop(slot, {}))
+                if v is not None:
+                    violations.append(v)
+            usage.next_slot = max(usage.next_slot, closed)
+            if usage.next_slot < len(usage.profile):
+                self._next_close = min(self._next_close, usage.start + (usage.next_slot + 1) * BW_PERIOD)
+            else:
+                del self._usages[contract_id]
+        for ifid in list(self._contracts):
+            usages = [u for u in self._contracts[ifid] if u.next_slot < len(u.profile)]
+            if len(usages) > 0:
+                self._contracts[ifid] = usages
+            else:
+                del self._contracts[ifid]
+        return violations
+
+    def flush(self) -> List[Violation]:
+        """ evaluates all the slots, e.g. at the end of the logs """
+        return self.close_until(float("inf"))
+
+    def _evaluate(self, usage: _ContractUsage, slot: int, counts: Dict[str, float]) -> Optional[Violation]:
+        contracted = usage.profile[slot] * BW_STEP
+        bps = {role: counts.get(role, 0) * 8 / BW_PERIOD for role in self.roles}
+        down, up = bps.get(DOWNSTREAM), bps.get(UPSTREAM)
+        used = down if down is not None else up
+        kind = None
+        if used > contracted * (1 + self.tolerance):
+            kind = OVERUSE
+        elif down is not None and up is not None and \
+                up < min(down, contracted) * (1 - self.tolerance):
+            kind = UNDERDELIVERY
+        if kind is None:
+            return None
+        return Violation(kind, usage.contract_id, usage.start + slot * BW_PERIOD, contracted,
+                         down, up)
+
+
+def contract_interfaces(topo: dict, contracts: Iterable[Contract]) -> Iterator[Tuple[Contract, int]]:
+    """ pairs each contract with the ID of its interface in the topology, if it has one """
+    model = TopologyModel(topo, 0)
+    for c in contracts:
+        found = model.find_remote(c.br_address)
+        if found is not None:
+            yield c, int(found[1])
+
+
+def indexed_interfaces(
+    index: ContractIndex,
+    ia: str,
+    contracts: Iterable[Contract],
+) -> Iterator[Tuple[Contract, int]]:
+    """
+    as contract_interfaces, from the index of the reloader. It also finds the interfaces of the
+    contracts already deactivated, which are not in the topology anymore. Only the intervals
+    of the AS that overlap the contract count, and a contract is paired with each interface it
+    had in them.
+    """
+    intervals: Dict[int, List[Tuple[int, ContractIndex.Interval]]] = {}  # contract_id -> ...
+    for interval_ia, ifid, i in index.intervals():
+        if interval_ia == ia:
+            intervals.setdefault(i.contract_id, []).append((ifid, i))
+    for c in contracts:
+        start = conversion.epoch_from_pb_timestamp(c.buyer_starting_on)
+        end = start + len(conversion.csv_to_intlist(c.buyer_bw_profile)) * BW_PERIOD
+        ifids = []
+        for ifid, i in intervals.get(c.contract_id, ()):
+            if i.since < end and (i.until is None or i.until > start) and ifid not in ifids:
+                ifids.append(ifid)
+        for ifid in ifids:
+            yield c, ifid
+
+
+def index_as(index: ContractIndex) -> Optional[str]:
+    """ the AS of the index, if it has only one, as the index of a topology """
+    ias = {ia for ia, _, _ in index.intervals()}
+    return ias.pop() if len(ias) == 1 else None
+
+
+def read_contracts(paths: Iterable[Path]) -> List[Contract]:
+    """ reads serialized contracts from files or from the *.contract files of directories """
+    contracts = []
+    for p in paths:
+        files = sorted(Path(p).glob("*.contract")) if Path(p).is_dir() else [Path(p)]
+        for f in files:
+            c = Contract()
+            c.ParseFromString(f.read_bytes())
+            contracts.append(c)
+    return contracts
+
+
+class ContractSource:
+    """
+    The contracts to monitor and their interfaces, from contract files and either the topology
+    or the contract index of the reloader. poll reads all of them again when any of the files,
+    or the directories with the contracts, changed since the last call (by modification time),
+    e.g. when the reloader spools a new contract or reassigns an interface.
+    ia: the provider AS in the index; by default its only AS.
+    """
+    def __init__(self, paths: Iterable[Path], topology: Optional[Path]=None,
+                 index: Optional[Path]=None, ia: Optional[str]=None):
+        if (topology is None) == (index is None):
+            raise ValueError("either the topology or the index is needed")
+        self.paths = [Path(p) for p in paths]
+        self.topology = topology
+        self.index_path = index
+        self.ia = ia
+        self.index: Optional[ContractIndex] = None  # the last one read
+        self.contracts = 0  # number of contracts read by the last poll that found changes
+        self._signature = None
+        self._found: Set[Tuple[int, int]] = set()  # (contract_id, ifid) of the last read
+
+    def _current_signature(self) -> tuple:
+        signature = []
+        for p in self.paths + [self.topology if self.topology is not None else self.index_path]:
+            try:
+                signature.append(os.stat(p).st_mtime_ns)
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def poll(self) -> Optional[List[Tuple[Contract, int]]]:
+        """
+        None if nothing changed since the last call. Otherwise the (contract, ifid) pairs that
+        were not found by the previous read.
+        """
+        signature = self._current_signature()
+        if signature == self._signature:
+            return None
+        contracts = read_contracts(self.paths)
+        if self.index_path is not None:
+            index = ContractIndex(self.index_path)
+            ia = self.ia or index_as(index)
+            if ia is None:
+                raise ValueError("the AS of the index is needed, it does not have exactly one")
+            pairs = list(indexed_interfaces(index, ia, contracts))
+            self.index, self.ia = index, ia
+        else:
+            pairs = list(contract_interfaces(codec.loads(self.topology.read_bytes()), contracts))
+        self._signature = signature
+        self.contracts = len(contracts)
+        new = [(c, ifid) for c, ifid in pairs if (c.contract_id, ifid) not in self._found]
+        self._found = {(c.contract_id, ifid) for c, ifid in pairs}
+        return new
+
+
+def follow(filename: Path, poll: float=1) -> Iterator[Optional[str]]:
+    """
+    Yields the lines of the file as they are appended, like `tail -F`: the file is opened again
+    if it is rotated or truncated. Yields None when there is nothing new, after waiting `poll`.
+    """
+    f = None
+    inode = None
+    partial = ""
+    while True:
+        if f is None:
+            try:
+                f = open(filename, "r")
+                inode = os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                time.sleep(poll)
+                yield None
+                continue
+        line = f.readline()
+        if line.endswith("\n"):
+            yield partial + line
+            partial = ""
+            continue
+        partial += line
+        try:
+            st = os.stat(filename)
+            if st.st_ino != inode or st.st_size < f.tell():
+                f.close()
+                f = None
+                partial = ""
+                continue
+        except FileNotFoundError:
+            pass
+        time.sleep(poll)
+        yield None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ESDX contract compliance from monitor logs")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--topology", type=Path,
+                       help="topology of the provider AS, to find the interface of each contract")
+    where.add_argument("--index", type=Path,
+                       help="contract index kept by the reloader (<topology>.contracts), instead")
+    parser.add_argument("--ia", help="the provider AS in the index; by default its only AS")
+    parser.add_argument("--contracts", type=Path, nargs="+", required=True,
+                        help="contract files, or directories with *.contract files")
+    parser.add_argument("--downstream", type=Path, help="log of the downstream monitor")
+    parser.add_argument("--upstream", type=Path, help="log of the upstream monitor")
+    parser.add_argument("--follow", action="store_true", help="keep reading the logs as they grow")
+    parser.add_argument("--interval", type=int, default=10, help="logging interval of the monitors")
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--utc", action="store_true",
+                        help="the log timestamps are in UTC instead of the local time")
+    args = parser.parse_args()
+    logs = {role: path for role, path in [(DOWNSTREAM, args.downstream), (UPSTREAM, args.upstream)]
+            if path is not None}
+    if len(logs) == 0:
+        parser.error("at least one of --downstream and --upstream is needed")
+    tz = datetime.timezone.utc if args.utc else None
+
+    source = ContractSource(args.contracts, topology=args.topology, index=args.index, ia=args.ia)
+    try:
+        interfaces = source.poll()
+    except ValueError as ex:
+        parser.error(f"{ex}: use --ia")
+    analyzer = ComplianceAnalyzer(logs.keys(), tolerance=args.tolerance, interval=args.interval,
+                                  index=source.index, ia=source.ia)
+    for c, ifid in interfaces:
+        analyzer.add_contract(c, ifid)
+    print(f"monitoring {analyzer.active_contracts()} of {source.contracts} contracts", file=sys.stderr)
+
+    def report(violations):
+        for v in violations:
+            print(v, flush=True)
+
+    if not args.follow:
+        def _samples(role, f):
+            for line in f:
+                s = parse_line(line, tz)
+                if s is not None:
+                    yield s.time, role, s
+        files = [open(path) for path in logs.values()]
+        try:
+            # the logs are in time order: merge them to close the slots as soon as possible
+            for _, role, s in heapq.merge(*[_samples(role, f) for role, f in zip(logs, files)],
+                                           key=lambda x: x[0]):
+                report(analyzer.feed(role, s))
+        finally:
+            for f in files:
+                f.close()
+        report(analyzer.flush())
+        return 0
+    followers = {role: follow(path) for role, path in logs.items()}
+    try:
+        while True:
+            # the contracts spooled and the interfaces assigned by the reloader since then
+            try:
+                interfaces = source.poll()
+            except Exception as ex:
+                print(f"cannot read the contracts, retrying: {ex}", file=sys.stderr)
+                interfaces = None
+            if interfaces is not None:
+                analyzer.index = source.index
+                for c, ifid in interfaces:
+                    analyzer.add_contract(c, ifid)
+                if len(interfaces) > 0:
+                    print(f"monitoring {analyzer.active_contracts()} contracts", file=sys.stderr)
+            for role, lines in followers.items():
+                for line in lines:
+                    if line is None:
+                        break
+                    s = parse_line(line, tz)
+                    if s is not None:
+                        report(analyzer.feed(role, s))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
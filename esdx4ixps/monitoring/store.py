@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+
+# Append-only store of the samples of the bandwidth monitors, in fixed width binary records
+# that are read with NumPy memory maps. Each monitor (downstream or upstream) has its own
+# subdirectory in the store, with two files per interface pair:
+#
+#   <ingress>-<egress>.samples  the cumulative counters as logged: time, bytes, packets
+#   <ingress>-<egress>.rollup   the bytes and packets of each BW_PERIOD slot, aligned to
+#                               multiples of BW_PERIOD since the epoch, without gaps
+#
+# The samples of a pair are kept in time order: those at or before the latest stored one are
+# dropped, so ingesting a log twice does not count its traffic again.
+# The rollups are extended on flush with the slots that are over, i.e. before the slot of the
+# latest sample. Comparing months of measurements with the contracted bandwidth profiles is
+# then a slice of the rollups and a few vectorized operations.
+#
+#   PYTHONPATH=. ./monitoring/store.py ingest --store /var/lib/esdx/store --role downstream \
+#       downstream.log
+#   PYTHONPATH=. ./monitoring/store.py check --store /var/lib/esdx/store \
+#       --topology topology.json --contracts spool/done
+
+
+from defs import BW_PERIOD, BW_STEP
+from market_pb2 import Contract
+from monitoring import analyzer
+from pathlib import Path
+from reloader import codec
+from reloader.index import ContractIndex
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from util import conversion
+
+import argparse
+import datetime
+import numpy as np
+import re
+import sys
+
+
+SAMPLE_DTYPE = np.dtype([("time", "<i8"), ("bytes", "<u8"), ("packets", "<u8")])
+ROLLUP_DTYPE = np.dtype([("slot", "<i8"), ("bytes", "<u8"), ("packets", "<u8")])
+
+_PAIR_RE = re.compile(r"(\d+)-(\d+)\.samples")
+
+
+def _read(filename: Path, dtype: np.dtype) -> np.ndarray:
+    """ maps the complete records of the file; empty if it does not exist """
+    try:
+        n = filename.stat().st_size // dtype.itemsize
+    except FileNotFoundError:
+        n = 0
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r", shape=(n,))
+
+
+def _deltas(samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (time, bytes, packets) between consecutive cumulative samples. A counter lower than the
+    previous one was reset (also when the monitor deleted the hop), and counts from zero.
+    """
+    if len(samples) < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    result = [samples["time"][1:].astype(np.int64)]
+    for field in ("bytes", "packets"):
+        values = samples[field].astype(np.int64)
+        d = np.diff(values)
+        result.append(np.where(d < 0, values[1:], d))
+    return tuple(result)
+
+
+def _per_slot(samples: np.ndarray, start: int, n: int, period: int=BW_PERIOD) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    bytes and packets in each of the n slots starting at start. The counters logged at time t
+    are those of the interval before t, so they belong to the slot containing t - 1.
+    """
+    times, nbytes, packets = _deltas(samples)
+    slots = (times - 1 - start) // period
+    inside = (slots >= 0) & (slots < n)
+    slots = slots[inside]
+    return (np.bincount(slots, weights=nbytes[inside], minlength=n),
+            np.bincount(slots, weights=packets[inside], minlength=n))
+
+
+class SampleStore:
+    """
+    The samples of the monitor of one role (analyzer.DOWNSTREAM or UPSTREAM), in the role
+    subdirectory of directory. They are buffered in memory until flush, which also extends the
+    rollups.
+    """
+    def __init__(self, directory: Path, role: str=analyzer.DOWNSTREAM):
+        if role not in (analyzer.DOWNSTREAM, analyzer.UPSTREAM):
+            raise ValueError(f"unknown monitor role {role}")
+        self.role = role
+        self.directory = Path(directory, role)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._pending: Dict[Tuple[int, int], List[Tuple[int, int, int]]] = {}
+        self._latest: Dict[Tuple[int, int], int] = {}  # pair -> time of its latest sample
+        self.dropped = 0  # samples not in time order
+
+    def _file(self, pair: Tuple[int, int], suffix: str) -> Path:
+        return Path(self.directory, f"{pair[0]}-{pair[1]}{suffix}")
+
+    def pairs(self) -> List[Tuple[int, int]]:
+        pairs = []
+        for p in self.directory.iterdir():
+            m = _PAIR_RE.fullmatch(p.name)
+            if m is not None:
+                pairs.append((int(m.group(1)), int(m.group(2))))
+        return sorted(pairs)
+
+    def append(self, s: analyzer.Sample) -> bool:
+        """
+        Returns False if the sample was dropped, being at or before the latest one of its pair.
+        A deleted hop is stored as a sample with zero counters, as the monitor restarts them.
+        """
+        latest = self._latest.get(s.hop)
+        if latest is None:
+            stored = self.samples(s.hop)
+            latest = int(stored["time"][-1]) if len(stored) > 0 else None
+        if latest is not None and s.time <= latest:
+            self.dropped += 1
+            return False
+        self._latest[s.hop] = s.time
+        nbytes, packets = (0, 0) if s.deleted else (s.bytes, s.packets)
+        self._pending.setdefault(s.hop, []).append((s.time, nbytes, packets))
+        return True
+
+    def flush(self):
+        for pair, records in self._pending.items():
+            with open(self._file(pair, ".samples"), "ab") as f:
+                f.write(np.array(records, dtype=SAMPLE_DTYPE).tobytes())
+            self._update_rollup(pair)
+        self._pending.clear()
+
+    def samples(self, pair: Tuple[int, int], start: Optional[int]=None, end: Optional[int]=None) -> np.ndarray:
+        """ the stored samples of the pair with start <= time < end, in time order """
+        samples = _read(self._file(pair, ".samples"), SAMPLE_DTYPE)
+        lo = 0 if start is None else np.searchsorted(samples["time"], start, side="left")
+        hi = len(samples) if end is None else np.searchsorted(samples["time"], end, side="left")
+        return samples[lo:hi]
+
+    def rollups(self, pair: Tuple[int, int]) -> np.ndarray:
+        return _read(self._file(pair, ".rollup"), ROLLUP_DTYPE)
+
+    def _update_rollup(self, pair: Tuple[int, int]):
+        """ appends the slots after the last rolled up one, until the slot of the latest sample """
+        rollups = self.rollups(pair)
+        samples = self.samples(pair)
+        if len(samples) < 2:
+            return
+        last_slot = (int(samples["time"][-1]) - 1) // BW_PERIOD * BW_PERIOD  # still open
+        if len(rollups) > 0:
+            first = int(rollups["slot"][-1]) + BW_PERIOD
+        else:
+            first = (int(samples["time"][1]) - 1) // BW_PERIOD * BW_PERIOD
+        n = (last_slot - first) // BW_PERIOD
+        if n <= 0:
+            return
+        # from the sample before the first slot, the base of the first difference
+        lo = max(0, np.searchsorted(samples["time"], first + 1, side="left") - 1)
+        nbytes, packets = _per_slot(samples[lo:], first, n)
+        records = np.empty(n, dtype=ROLLUP_DTYPE)
+        records["slot"] = first + np.arange(n, dtype=np.int64) * BW_PERIOD
+        records["bytes"] = nbytes
+        records["packets"] = packets
+        with open(self._file(pair, ".rollup"), "ab") as f:
+            f.write(records.tobytes())
+
+    def slot_bytes(self, pair: Tuple[int, int], start: int, n: int) -> np.ndarray:
+        """
+        bytes of the pair in each of the n BW_PERIOD slots starting at start. Uses the rollups
+        if start is aligned to them, and the samples for the slots not rolled up.
+        """
+        result = np.zeros(n)
+        done = 0
+        rollups = self.rollups(pair)
+        if len(rollups) > 0 and start % BW_PERIOD == 0:
+            first = int(rollups["slot"][0])
+            lo = (start - first) // BW_PERIOD
+            if lo >= 0 and lo < len(rollups):
+                chunk = rollups["bytes"][lo:lo + n]
+                result[:len(chunk)] = chunk
+                done = len(chunk)
+        if done < n:
+            rest_start = start + done * BW_PERIOD
+            # the sample before the range is the base of the first difference
+            samples = self.samples(pair)
+            lo = max(0, np.searchsorted(samples["time"], rest_start + 1, side="left") - 1)
+            hi = np.searchsorted(samples["time"], start + n * BW_PERIOD + 1, side="left")
+            result[done:] = _per_slot(samples[lo:hi], rest_start, n - done)[0]
+        return result
+
+
+def contract_compliance(
+    store: SampleStore,
+    contract: Contract,
+    interfaces: Union[int, Dict[int, List[ContractIndex.Interval]]],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    returns the contracted and the measured bandwidth, in bps, of each slot of the contract.
+    The measured one adds up all the interface pairs of the store that include its interface.
+    interfaces: the interface of the contract, or the intervals in which the contract had each
+                interface (see indexed_intervals): then only the part of the slots within
+                them is counted.
+    """
+    start = conversion.epoch_from_pb_timestamp(contract.buyer_starting_on)
+    contracted = np.array(conversion.csv_to_intlist(contract.buyer_bw_profile), dtype=np.float64)
+    measured = np.zeros(len(contracted))
+    if not isinstance(interfaces, dict):
+        interfaces = {interfaces: None}
+    for ifid, intervals in interfaces.items():
+        nbytes = np.zeros(len(contracted))
+        for pair in store.pairs():
+            if ifid in pair:
+                nbytes += store.slot_bytes(pair, start, len(contracted))
+        if intervals is not None:
+            nbytes *= _coverage(start, len(contracted), intervals)
+        measured += nbytes
+    return contracted * BW_STEP, measured * 8 / BW_PERIOD
+
+
+def indexed_intervals(
+    index: ContractIndex,
+    ia: str,
+    contract: Contract,
+) -> Dict[int, List[ContractIndex.Interval]]:
+    """ the intervals of the index in which the contract had each interface of the AS """
+    interfaces = {}
+    for interval_ia, ifid, i in index.intervals():
+        if interval_ia == ia and i.contract_id == contract.contract_id:
+            interfaces.setdefault(ifid, []).append(i)
+    return interfaces
+
+
+def _coverage(start: int, n: int, intervals: Iterable[ContractIndex.Interval]) -> np.ndarray:
+    """ the fraction of each of the n slots from start within the intervals """
+    slots = start + np.arange(n, dtype=np.float64) * BW_PERIOD
+    covered = np.zeros(n)
+    for i in intervals:
+        until = np.inf if i.until is None else i.until
+        covered += np.clip(np.minimum(slots + BW_PERIOD, until) - np.maximum(slots, i.since), 0, None)
+    return np.minimum(covered / BW_PERIOD, 1)
+
+
+def contract_violations(
+    stores: Dict[str, SampleStore],
+    contract: Contract,
+    interfaces: Union[int, Dict[int, List[ContractIndex.Interval]]],
+    tolerance: float=0.05,
+) -> List[analyzer.Violation]:
+    """
+    the violations of the contract in the stores of each role, with the same rules as
+    analyzer.ComplianceAnalyzer, but evaluated for all the slots at once
+    """
+    start = conversion.epoch_from_pb_timestamp(contract.buyer_starting_on)
+    bps = {}
+    contracted = None
+    for role, store in stores.items():
+        contracted, bps[role] = contract_compliance(store, contract, interfaces)
+    if contracted is None:
+        return []
+    down, up = bps.get(analyzer.DOWNSTREAM), bps.get(analyzer.UPSTREAM)
+    used = down if down is not None else up
+    overuse = used > contracted * (1 + tolerance)
+    underdelivery = np.zeros(len(contracted), dtype=bool)
+    if down is not None and up is not None:
+        underdelivery = ~overuse & (up < np.minimum(down, contracted) * (1 - tolerance))
+    violations = []
+    for slot in np.flatnonzero(overuse | underdelivery):
+        violations.append(analyzer.Violation(
+            analyzer.OVERUSE if overuse[slot] else analyzer.UNDERDELIVERY,
+            contract.contract_id,
+            start + int(slot) * BW_PERIOD,
+            float(contracted[slot]),
+            None if down is None else float(down[slot]),
+            None if up is None else float(up[slot]),
+        ))
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ESDX monitor samples store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="append the samples of monitor logs")
+    ingest.add_argument("logs", type=Path, nargs="+")
+    ingest.add_argument("--role", choices=[analyzer.DOWNSTREAM, analyzer.UPSTREAM],
+                        default=analyzer.DOWNSTREAM, help="the monitor that wrote the logs")
+    ingest.add_argument("--utc", action="store_true",
+                        help="the log timestamps are in UTC instead of the local time")
+    check = sub.add_parser("check", help="compare the stored bandwidth with the contracts")
+    where = check.add_mutually_exclusive_group(required=True)
+    where.add_argument("--topology", type=Path)
+    where.add_argument("--index", type=Path, help="contract index kept by the reloader")
+    check.add_argument("--ia", help="the provider AS in the index; by default its only AS")
+    check.add_argument("--contracts", type=Path, nargs="+", required=True)
+    check.add_argument("--tolerance", type=float, default=0.05)
+    for p in (ingest, check):
+        p.add_argument("--store", type=Path, required=True, help="directory of the store")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        store = SampleStore(args.store, args.role)
+        tz = datetime.timezone.utc if args.utc else None
+        for path in args.logs:
+            with open(path) as f:
+                for line in f:
+                    s = analyzer.parse_line(line, tz)
+                    if s is not None:
+                        store.append(s)
+            store.flush()
+        if store.dropped > 0:
+            print(f"dropped {store.dropped} samples not newer than the stored ones", file=sys.stderr)
+        return 0
+    roles = [role for role in (analyzer.DOWNSTREAM, analyzer.UPSTREAM)
+             if Path(args.store, role).is_dir()]
+    stores = {role: SampleStore(args.store, role) for role in roles}
+    contracts = analyzer.read_contracts(args.contracts)
+    if args.index is None:
+        interfaces = analyzer.contract_interfaces(codec.loads(args.topology.read_bytes()), contracts)
+        for c, ifid in interfaces:
+            for v in contract_violations(stores, c, ifid, args.tolerance):
+                print(v)
+        return 0
+    index = ContractIndex(args.index)
+    ia = args.ia or analyzer.index_as(index)
+    if ia is None:
+        parser.error("--ia is needed, the index does not have exactly one AS")
+    for c in contracts:
+        interfaces = indexed_intervals(index, ia, c)
+        if len(interfaces) > 0:
+            for v in contract_violations(stores, c, interfaces, args.tolerance):
+                print(v)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+from defs import BW_PERIOD, BW_STEP
+from market_pb2 import Contract
+from monitoring import analyzer
+from monitoring.analyzer import ComplianceAnalyzer, HopCounters, Sample, DOWNSTREAM, UPSTREAM
+from pathlib import Path
+from reloader.index import ContractIndex
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from util import conversion
+
+import datetime
+import heapq
+import json
+import os
+import subprocess
+import sys
+
+
+T0 = 1648843200  # 2022/04/01 20:00:00 UTC
+
+
+def _contract(contract_id: int, bw_profile: str, br_address: str="10.1.1.1:50003") -> Contract:
+    return Contract(
+        contract_id=contract_id,
+        br_address=br_address,
+        buyer_iaid="1-ff00:0:111",
+        buyer_starting_on=conversion.pb_timestamp_from_seconds(T0),
+        buyer_bw_profile=bw_profile,
+    )
+
+
+def _log_line(t: int, hop, nbytes: int) -> str:
+    ts = datetime.datetime.fromtimestamp(t, datetime.timezone.utc).strftime("%Y/%m/%d %H:%M:%S")
+    return f"{ts} Hop {hop[0]} -> {hop[1]}: {nbytes} bytes, {nbytes // 1000} packets\n"
+
+
+def _samples(hop, rates_bps, interval=10):
+    """ cumulative samples of a hop sending at the rate of each slot """
+    total = 1000  # the counters do not start from zero
+    samples = [Sample(T0, hop, total, 0)]
+    for slot, bps in enumerate(rates_bps):
+        for t in range(T0 + slot * BW_PERIOD + interval, T0 + (slot + 1) * BW_PERIOD + 1, interval):
+            total += int(bps * interval / 8)
+            samples.append(Sample(t, hop, total, 0))
+    return samples
+
+
+class TestParse(TestCase):
+    def test_parse_line(self):
+        s = analyzer.parse_line("2022/04/01 20:00:10 Hop 41 -> 1: 123456 bytes, 100 packets\n")
+        self.assertEqual(s, Sample(T0 + 10, (41, 1), 123456, 100))
+        s = analyzer.parse_line("2022/04/01 20:00:20 Delete hop: 41 -> 1\n")
+        self.assertEqual(s, Sample(T0 + 20, (41, 1), 0, 0, deleted=True))
+        self.assertIsNone(analyzer.parse_line("2022/04/01 20:00:00 Monitor attached to eth0\n"))
+        self.assertIsNone(analyzer.parse_line(""))
+
+    def test_hop_counters(self):
+        c = HopCounters(interval=10)
+        self.assertIsNone(c.update(Sample(T0, (1, 2), 500, 0)))
+        self.assertEqual(c.update(Sample(T0 + 10, (1, 2), 800, 0)), (T0, T0 + 10, 300))
+        # no activity for a while: the bytes are in the last interval only
+        self.assertEqual(c.update(Sample(T0 + 100, (1, 2), 900, 0)), (T0 + 90, T0 + 100, 100))
+        # counters reset
+        self.assertEqual(c.update(Sample(T0 + 110, (1, 2), 50, 0)), (T0 + 100, T0 + 110, 50))
+        # hop removed, counting again from zero
+        self.assertIsNone(c.update(Sample(T0 + 120, (1, 2), 0, 0, deleted=True)))
+        self.assertEqual(c.update(Sample(T0 + 130, (1, 2), 70, 0)), (T0 + 120, T0 + 130, 70))
+        self.assertEqual(len(c), 1)
+
+
+class TestComplianceAnalyzer(TestCase):
+    def test_violations(self):
+        a = ComplianceAnalyzer(tolerance=0.05)
+        a.add_contract(_contract(1, "1,2,2"), 41)
+        a.add_contract(_contract(2, "1"), 42)  # no traffic
+        hop = (41, 1)
+        down = _samples(hop, [2 * BW_STEP, 2 * BW_STEP, 2 * BW_STEP])
+        up = _samples(hop, [2 * BW_STEP, 1 * BW_STEP, 2 * BW_STEP])
+        violations = []
+        for d, u in zip(down, up):
+            for role, s in [(DOWNSTREAM, d), (UPSTREAM, u)]:
+                new = a.feed(role, s)
+                violations.extend((s.time, v) for v in new)
+        self.assertEqual([v.kind for _, v in violations],
+                         [analyzer.OVERUSE, analyzer.UNDERDELIVERY])
+        # reported as soon as the slot is over, plus the logging interval
+        self.assertEqual(violations[0][0], T0 + BW_PERIOD + 10)
+        self.assertEqual(violations[1][0], T0 + 2 * BW_PERIOD + 10)
+        overuse = violations[0][1]
+        self.assertEqual(overuse.contract_id, 1)
+        self.assertEqual(overuse.slot_start, T0)
+        self.assertEqual(overuse.contracted_bps, BW_STEP)
+        self.assertAlmostEqual(overuse.downstream_bps, 2 * BW_STEP, delta=BW_STEP / 50)
+        self.assertEqual(violations[1][1].slot_start, T0 + BW_PERIOD)
+        self.assertEqual(a.active_contracts(), 1)  # contract 2 ended
+        self.assertEqual(a.flush(), [])
+        self.assertEqual(a.active_contracts(), 0)
+
+    def test_waits_for_all_roles(self):
+        a = ComplianceAnalyzer(tolerance=0.05)
+        a.add_contract(_contract(1, "1,1"), 41)
+        for s in _samples((41, 1), [2 * BW_STEP, 2 * BW_STEP]):
+            self.assertEqual(a.feed(DOWNSTREAM, s), [])
+        self.assertEqual(len(a.flush()), 2)
+        # with only one role, the slots are closed as its log advances
+        a = ComplianceAnalyzer([DOWNSTREAM], tolerance=0.05)
+        a.add_contract(_contract(1, "1,1"), 41)
+        violations = []
+        for s in _samples((1, 41), [2 * BW_STEP, 0.5 * BW_STEP]):
+            violations.extend(a.feed(DOWNSTREAM, s))
+        self.assertEqual([v.kind for v in violations], [analyzer.OVERUSE])
+        self.assertIsNone(violations[0].upstream_bps)
+
+    def test_contract_interfaces(self):
+        topo = {"border_routers": {"br1": {
+            "internal_addr": "10.0.0.1:30042",
+            "interfaces": {
+                "41": {"underlay": {"public": "127.0.0.1:50000", "remote": "10.1.1.1:50003"}},
+                "42": {"underlay": {"public": "127.0.0.1:50001", "remote": "10.1.1.1:50004"}},
+            },
+        }}}
+        contracts = [_contract(1, "1", "10.1.1.1:50004"), _contract(2, "1", "10.1.1.1:50009")]
+        pairs = list(analyzer.contract_interfaces(topo, contracts))
+        self.assertEqual([(c.contract_id, ifid) for c, ifid in pairs], [(1, 42)])
+
+    def test_indexed_interfaces(self):
+        ia = "1-ff00:0:110"
+        index = ContractIndex()
+        index.activate(ia, 41, 1, T0)
+        index.deactivate(ia, 41, T0 + BW_PERIOD)
+        index.activate(ia, 41, 3, T0 + BW_PERIOD)
+        self.assertEqual(analyzer.index_as(index), ia)
+        index.activate("1-ff00:0:112", 42, 2, T0)  # another AS
+        index.activate(ia, 43, 4, T0 + 2 * BW_PERIOD)  # after the contract ended
+        index.activate(ia, 44, 3, T0 + BW_PERIOD + 300)  # reactivated with another interface
+        contracts = [_contract(1, "1"), _contract(2, "1"), _contract(3, "1,1"), _contract(4, "1,1")]
+        pairs = list(analyzer.indexed_interfaces(index, ia, contracts))
+        self.assertEqual([(c.contract_id, ifid) for c, ifid in pairs], [(1, 41), (3, 41), (3, 44)])
+        self.assertIsNone(analyzer.index_as(index))
+
+    def test_index_attribution(self):
+        ia = "1-ff00:0:110"
+        index = ContractIndex()
+        index.activate(ia, 41, 1, T0)
+        index.activate(ia, 41, 2, T0 + BW_PERIOD)  # the interface ID is reused
+        samples = _samples((41, 1), [2 * BW_STEP, 1 * BW_STEP])
+        self.assertRaises(ValueError, ComplianceAnalyzer, [DOWNSTREAM], index=index)
+        for a, expected in [(ComplianceAnalyzer([DOWNSTREAM]), [(1, T0), (2, T0)]),
+                            (ComplianceAnalyzer([DOWNSTREAM], index=index, ia=ia), [(1, T0)])]:
+            for c in (_contract(1, "1,1"), _contract(2, "1,1")):
+                a.add_contract(c, 41)
+            violations = []
+            for s in samples:
+                violations.extend(a.feed(DOWNSTREAM, s))
+            violations.extend(a.flush())
+            self.assertEqual(sorted((v.contract_id, v.slot_start) for v in violations), expected)
+        # a contract added with two interfaces is evaluated once, with the bytes of both
+        a = ComplianceAnalyzer([DOWNSTREAM])
+        a.add_contract(_contract(1, "3"), 41)
+        a.add_contract(_contract(1, "3"), 42)
+        self.assertEqual(a.active_contracts(), 1)
+        violations = []
+        for s in heapq.merge(_samples((41, 1), [2 * BW_STEP]), _samples((1, 42), [2 * BW_STEP])):
+            violations.extend(a.feed(DOWNSTREAM, s))
+        violations.extend(a.flush())
+        self.assertEqual([v.kind for v in violations], [analyzer.OVERUSE])
+
+    def test_contract_source(self):
+        ia = "1-ff00:0:110"
+        with TemporaryDirectory() as temp:
+            done = Path(temp, "done")
+            done.mkdir()
+            index = ContractIndex()
+            index.activate(ia, 41, 1, T0)
+            indexfile = Path(temp, "topo.json.contracts")
+            indexfile.write_bytes(index.dumps())
+            Path(done, "1.contract").write_bytes(_contract(1, "1,1").SerializeToString())
+            source = analyzer.ContractSource([done], index=indexfile)
+            self.assertEqual([(c.contract_id, ifid) for c, ifid in source.poll()], [(1, 41)])
+            self.assertEqual((source.ia, source.contracts), (ia, 1))
+            self.assertIsNone(source.poll())  # nothing changed
+
+            def touch(p, t):
+                os.utime(p, ns=(t, t))
+            # the reloader spools a contract, and later assigns it an interface
+            Path(done, "2.contract").write_bytes(_contract(2, "1,1").SerializeToString())
+            touch(done, 10**18)
+            self.assertEqual(source.poll(), [])
+            self.assertEqual(source.contracts, 2)
+            index.activate(ia, 42, 2, T0 + BW_PERIOD)
+            indexfile.write_bytes(index.dumps())
+            touch(indexfile, 10**18)
+            self.assertEqual([(c.contract_id, ifid) for c, ifid in source.poll()], [(2, 42)])
+            self.assertEqual(source.index.lookup(ia, 42, T0 + BW_PERIOD), 2)
+            self.assertRaises(ValueError, analyzer.ContractSource, [done])
+
+    def test_main(self):
+        with TemporaryDirectory() as temp:
+            topo = {"border_routers": {"br1": {
+                "internal_addr": "10.0.0.1:30042",
+                "interfaces": {
+                    "41": {"underlay": {"public": "127.0.0.1:50000", "remote": "10.1.1.1:50003"}},
+                },
+            }}}
+            Path(temp, "topo.json").write_text(json.dumps(topo))
+            Path(temp, "1.contract").write_bytes(_contract(1, "1,2").SerializeToString())
+            for role, rates in [(DOWNSTREAM, [2 * BW_STEP, 2 * BW_STEP]),
+                                (UPSTREAM, [2 * BW_STEP, 1 * BW_STEP])]:
+                with open(Path(temp, role + ".log"), "w") as f:
+                    for s in _samples((41, 1), rates):
+                        f.write(_log_line(s.time, s.hop, s.bytes))
+            index = ContractIndex()
+            index.activate("1-ff00:0:110", 41, 1, T0)
+            Path(temp, "topo.json.contracts").write_bytes(index.dumps())
+            for where in (["--topology", Path(temp, "topo.json")],
+                          ["--index", Path(temp, "topo.json.contracts")]):
+                p = subprocess.run(
+                    [sys.executable, "monitoring/analyzer.py", "--contracts", temp, "--utc",
+                     "--downstream", Path(temp, "downstream.log"),
+                     "--upstream", Path(temp, "upstream.log")] + where,
+                    cwd=Path(__file__).parent.parent.parent, env={"PYTHONPATH": "."},
+                    capture_output=True, text=True)
+                self.assertEqual(p.returncode, 0, p.stderr)
+                lines = p.stdout.splitlines()
+                self.assertEqual(len(lines), 2, p.stdout)
+                self.assertTrue(lines[0].startswith("overuse contract 1 slot 2022-04-01T20:00:00"))
+                self.assertTrue(lines[1].startswith("underdelivery contract 1 slot 2022-04-01T20:10:00"))
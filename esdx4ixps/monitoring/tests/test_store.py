@@ -0,0 +1,166 @@
+from defs import BW_PERIOD, BW_STEP
+from monitoring.analyzer import Sample, DOWNSTREAM, UPSTREAM
+from monitoring.store import SampleStore, contract_compliance, contract_violations, indexed_intervals
+from monitoring.tests.test_analyzer import T0, _contract, _log_line, _samples
+from pathlib import Path
+from reloader.index import ContractIndex
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import json
+import numpy as np
+import subprocess
+import sys
+
+
+IA = "1-ff00:0:110"
+
+
+class TestSampleStore(TestCase):
+    def setUp(self):
+        self.temp = TemporaryDirectory()
+        self.store = SampleStore(Path(self.temp.name))
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def _append(self, samples):
+        for s in samples:
+            self.store.append(s)
+        self.store.flush()
+
+    def test_append(self):
+        hop = (41, 1)
+        self._append(_samples(hop, [BW_STEP]))
+        self._append([Sample(T0 + BW_PERIOD + 10, hop, 0, 0, deleted=True)])
+        samples = self.store.samples(hop)
+        self.assertEqual(len(samples), BW_PERIOD // 10 + 2)
+        self.assertEqual(samples["time"][0], T0)
+        self.assertEqual(samples["bytes"][-1], 0)
+        self.assertEqual(len(self.store.samples(hop, T0 + 10, T0 + 30)), 2)
+        self.assertEqual(self.store.pairs(), [hop])
+        # reopened
+        self.assertEqual(len(SampleStore(Path(self.temp.name)).samples(hop)), len(samples))
+        self.assertEqual(len(SampleStore(Path(self.temp.name), UPSTREAM).samples(hop)), 0)
+        self.assertRaises(ValueError, SampleStore, Path(self.temp.name), "sideways")
+
+    def test_time_order(self):
+        hop = (41, 1)
+        samples = _samples(hop, [BW_STEP, 2 * BW_STEP])
+        self._append(samples)
+        rollups = self.store.rollups(hop).copy()
+        # ingested again, also from another instance: nothing changes
+        self._append(samples)
+        store = SampleStore(Path(self.temp.name))
+        for s in samples:
+            self.assertFalse(store.append(s))
+        store.flush()
+        self.assertEqual(store.dropped, len(samples))
+        self.assertEqual(len(self.store.samples(hop)), len(samples))
+        np.testing.assert_array_equal(self.store.rollups(hop), rollups)
+        np.testing.assert_array_equal(
+            self.store.slot_bytes(hop, T0, 2), np.array([1, 2]) * BW_STEP * BW_PERIOD / 8)
+        # within a batch too
+        later = Sample(samples[-1].time + 10, hop, samples[-1].bytes + 100, 0)
+        self.assertTrue(self.store.append(later))
+        self.assertFalse(self.store.append(later))
+        self.assertFalse(self.store.append(samples[-1]))
+        self.store.flush()
+        self.assertEqual(len(self.store.samples(hop)), len(samples) + 1)
+
+    def test_rollups(self):
+        hop = (41, 1)
+        samples = _samples(hop, [1 * BW_STEP, 2 * BW_STEP, 3 * BW_STEP])
+        # flushed in several batches, the rollups are the same
+        self._append(samples[:100])
+        self._append(samples[100:])
+        rollups = self.store.rollups(hop)
+        # the last slot is open until a later sample arrives
+        self.assertEqual(list(rollups["slot"]), [T0, T0 + BW_PERIOD])
+        self.assertEqual(list(rollups["bytes"]), [BW_STEP * BW_PERIOD / 8, 2 * BW_STEP * BW_PERIOD / 8])
+        expected = np.array([1, 2, 3]) * BW_STEP * BW_PERIOD / 8
+        np.testing.assert_array_equal(self.store.slot_bytes(hop, T0, 3), expected)
+        # not aligned to the rollups, from the samples
+        np.testing.assert_array_equal(
+            self.store.slot_bytes(hop, T0 + BW_PERIOD // 2, 2), (expected[:2] + expected[1:]) / 2)
+        # counters reset, and no activity in a slot
+        self._append([Sample(T0 + 3 * BW_PERIOD + 10, hop, 500, 0),
+                      Sample(T0 + 5 * BW_PERIOD + 10, hop, 800, 0)])
+        rollups = self.store.rollups(hop)
+        self.assertEqual(list(rollups["bytes"][2:]), [expected[2], 500, 0])
+        self.assertEqual(list(rollups["slot"]), [T0 + i * BW_PERIOD for i in range(5)])
+
+    def test_contract_compliance(self):
+        self._append(_samples((41, 1), [2 * BW_STEP, 1 * BW_STEP]))
+        self._append(_samples((1, 41), [0, 1 * BW_STEP]))
+        self._append(_samples((1, 42), [5 * BW_STEP, 5 * BW_STEP]))
+        contracted, measured = contract_compliance(self.store, _contract(1, "1,2,1"), 41)
+        np.testing.assert_array_equal(contracted, [BW_STEP, 2 * BW_STEP, BW_STEP])
+        np.testing.assert_array_equal(measured, [2 * BW_STEP, 2 * BW_STEP, 0])
+        # the interface belonged to the contract until the middle of the second slot
+        index = ContractIndex()
+        index.activate(IA, 41, 1, T0)
+        index.deactivate(IA, 41, T0 + BW_PERIOD + BW_PERIOD // 2)
+        index.activate(IA, 41, 2, T0 + BW_PERIOD + BW_PERIOD // 2)
+        interfaces = indexed_intervals(index, IA, _contract(1, "1,2,1"))
+        self.assertEqual(list(interfaces), [41])
+        _, measured = contract_compliance(self.store, _contract(1, "1,2,1"), interfaces)
+        np.testing.assert_array_equal(measured, [2 * BW_STEP, BW_STEP, 0])
+
+    def test_contract_violations(self):
+        up = SampleStore(Path(self.temp.name), UPSTREAM)
+        for s in _samples((41, 1), [2 * BW_STEP, 2 * BW_STEP, 1 * BW_STEP]):
+            self.store.append(s)
+        for s in _samples((41, 1), [2 * BW_STEP, 1 * BW_STEP, 1 * BW_STEP]):
+            up.append(s)
+        self.store.flush()
+        up.flush()
+        c = _contract(1, "1,2,1")
+        violations = contract_violations({DOWNSTREAM: self.store, UPSTREAM: up}, c, 41)
+        self.assertEqual([(v.kind, v.slot_start) for v in violations],
+                         [("overuse", T0), ("underdelivery", T0 + BW_PERIOD)])
+        self.assertEqual(violations[0].upstream_bps, 2 * BW_STEP)
+        # only one role
+        violations = contract_violations({UPSTREAM: up}, c, 41)
+        self.assertEqual([(v.kind, v.downstream_bps) for v in violations], [("overuse", None)])
+        self.assertEqual(contract_violations({}, c, 41), [])
+
+    def test_main(self):
+        temp = self.temp.name
+        topo = {"border_routers": {"br1": {
+            "internal_addr": "10.0.0.1:30042",
+            "interfaces": {
+                "41": {"underlay": {"public": "127.0.0.1:50000", "remote": "10.1.1.1:50003"}},
+            },
+        }}}
+        Path(temp, "topo.json").write_text(json.dumps(topo))
+        Path(temp, "1.contract").write_bytes(_contract(1, "1,2").SerializeToString())
+        for role, rates in [(DOWNSTREAM, [2 * BW_STEP, 2 * BW_STEP]),
+                            (UPSTREAM, [2 * BW_STEP, 1 * BW_STEP])]:
+            with open(Path(temp, role + ".log"), "w") as f:
+                for s in _samples((41, 1), rates):
+                    f.write(_log_line(s.time, s.hop, s.bytes))
+        cwd = Path(__file__).parent.parent.parent
+        store = Path(temp, "store")
+        for role in (DOWNSTREAM, UPSTREAM):
+            # the second copy of the log is dropped
+            p = subprocess.run(
+                [sys.executable, "monitoring/store.py", "ingest", "--store", store, "--utc",
+                 "--role", role, Path(temp, role + ".log"), Path(temp, role + ".log")],
+                cwd=cwd, env={"PYTHONPATH": "."}, capture_output=True, text=True)
+            self.assertEqual(p.returncode, 0, p.stderr)
+            self.assertIn("dropped", p.stderr)
+        index = ContractIndex()
+        index.activate(IA, 41, 1, T0)
+        Path(temp, "topo.json.contracts").write_bytes(index.dumps())
+        for where in (["--topology", Path(temp, "topo.json")],
+                      ["--index", Path(temp, "topo.json.contracts")]):
+            p = subprocess.run(
+                [sys.executable, "monitoring/store.py", "check", "--store", store,
+                 "--contracts", temp] + where,
+                cwd=cwd, env={"PYTHONPATH": "."}, capture_output=True, text=True)
+            self.assertEqual(p.returncode, 0, p.stderr)
+            lines = p.stdout.splitlines()
+            self.assertEqual(len(lines), 2, p.stdout)
+            self.assertTrue(lines[0].startswith("overuse contract 1 slot 2022-04-01T20:00:00"))
+            self.assertTrue(lines[1].startswith("underdelivery contract 1 slot 2022-04-01T20:10:00"))
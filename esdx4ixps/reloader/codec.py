@@ -0,0 +1,38 @@
+from typing import Any
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the json module
+    orjson = None
+
+
+# JSON encoding and decoding of topology files. If orjson is installed it is used, as it is
+# several times faster than the json module. For ASCII contents, both produce the same bytes.
+
+BACKEND = "json" if orjson is None else "orjson"
+
+
+def stdlib_loads(data: bytes) -> Any:
+    return json.loads(data)
+
+
+def stdlib_dumps(obj: Any, compact: bool=False) -> bytes:
+    if compact:
+        raw = json.dumps(obj, separators=(",", ":"))
+    else:
+        raw = json.dumps(obj, indent=2)
+    return (raw + "\n").encode("utf-8")
+
+
+if orjson is None:
+    loads = stdlib_loads
+    dumps = stdlib_dumps
+else:
+    loads = orjson.loads
+
+    def dumps(obj: Any, compact: bool=False) -> bytes:
+        if compact:
+            return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
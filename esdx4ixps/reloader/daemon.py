@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+# Long running reloader: reads the contracts of the local AS from a spool directory, and
+# activates and deactivates them following the non zero slots of their bandwidth profile
+# (see reloader.scheduler). The changes due at the same time are applied to the topology in one
+# batch, and the border router is signaled once per batch.
+#
+#   PYTHONPATH=. ./reloader/daemon.py --topology topology.json --internal-addr 1.1.1.1:43210 \
+#       --spool /var/spool/esdx --reload-cmd "systemctl restart scion-border-router@br1-1111"
+
+
+from market_pb2 import Contract
+from pathlib import Path
+from reloader.index import DEFAULT_RETENTION
+from reloader.locks import DEFAULT_LOCK
+from reloader.scheduler import ACTIVATE, DEACTIVATE, Schedule, contract_intervals
+from reloader.topology import Topology
+from typing import Callable, Dict, List, Optional
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+logger = logging.getLogger("reloader")
+
+SPOOL_SUFFIX = ".contract"
+
+
+def spool_contract(spool: Path, c: Contract) -> Path:
+    """ atomically writes the contract in the spool directory, to be picked up by the daemon """
+    fd, temp = tempfile.mkstemp(dir=spool, prefix=".tmp.")
+    with os.fdopen(fd, "wb") as w:
+        w.write(c.SerializeToString())
+    unique = os.path.basename(temp)[len(".tmp."):]
+    filename = Path(spool, f"{c.contract_id}-{unique}{SPOOL_SUFFIX}")
+    os.replace(temp, filename)
+    return filename
+
+
+class ReloaderDaemon:
+    """
+    Read contract files are moved to spool/done, or to spool/failed if they could not be parsed.
+    The schedule is rebuilt from spool/done when the daemon starts (see recover), so done only
+    keeps the contracts with pending changes: once the last interval of a contract ended and
+    it was deactivated, its files are moved to spool/expired.
+    A contract is scheduled only once, even if it is spooled again.
+    If the topology cannot be modified (e.g. the lock times out), the batch is retried after
+    poll seconds. A contract that fails on its own is not retried: its pending changes are
+    dropped and its files moved to spool/failed.
+    signal_br: called once after each batch that modified the topology.
+    window: events due in less than these seconds are applied together with the current ones.
+    """
+    def __init__(
+        self,
+        topology: Topology,
+        spool: Path,
+        signal_br: Optional[Callable[[], None]]=None,
+        window: float=1,
+        poll: float=1,
+        clock: Callable[[], float]=time.time,
+    ):
+        self.topology = topology
+        self.spool = Path(spool)
+        self.signal_br = signal_br
+        self.window = window
+        self.poll = poll
+        self.clock = clock
+        self.schedule = Schedule()
+        self._scheduled: Dict[int, int] = {}  # contract ID -> end of its last interval
+        self._files: Dict[int, List[Path]] = {}  # contract ID -> its files in spool/done
+        self._stop = threading.Event()
+        for d in ("done", "failed", "expired"):
+            Path(self.spool, d).mkdir(parents=True, exist_ok=True)
+
+    def add(self, c: Contract, now: float, active: bool=False) -> bool:
+        """
+        schedules the activation and deactivation of the contract. Returns False if it already
+        expired.
+        active: its interface is already in the topology (see Schedule.add).
+        """
+        if c.contract_id in self._scheduled:
+            logger.info(f"contract {c.contract_id} already scheduled")
+            return True
+        if self.schedule.add(c, now, active) == 0:
+            logger.info(f"contract {c.contract_id} already expired")
+            return False
+        self._scheduled[c.contract_id] = contract_intervals(c)[-1][1]
+        return True
+
+    def _move_files(self, contract_id: int, directory: str):
+        """ moves the files of the contract from spool/done to that spool subdirectory """
+        for filename in self._files.pop(contract_id, []):
+            try:
+                os.replace(filename, Path(self.spool, directory, filename.name))
+            except FileNotFoundError:
+                pass
+
+    def recover(self, now: float) -> int:
+        """
+        Schedules again the contracts in spool/done, e.g. after a restart, checking which ones
+        are active in the topology. An active contract outside of its intervals is
+        deactivated now. Returns the number of contracts read.
+        """
+        contracts = {}
+        for filename in sorted(Path(self.spool, "done").glob("*" + SPOOL_SUFFIX)):
+            c = Contract()
+            try:
+                c.ParseFromString(filename.read_bytes())
+            except Exception as ex:
+                logger.error(f"cannot parse {filename}: {ex}")
+                continue
+            contracts.setdefault(c.contract_id, c)
+            self._files.setdefault(c.contract_id, []).append(filename)
+        contracts = list(contracts.values())
+        for c, active in zip(contracts, self.topology.active(contracts)):
+            scheduled = self.add(c, now, active)
+            if active and not any(start <= now < end for start, end in contract_intervals(c)):
+                self.schedule.push(c, DEACTIVATE, now)
+                self._scheduled.setdefault(c.contract_id, now)
+            elif not scheduled:
+                self._move_files(c.contract_id, "expired")
+        return len(contracts)
+
+    def read_spool(self, now: float) -> int:
+        """ schedules the contracts found in the spool directory; returns how many """
+        count = 0
+        for filename in sorted(self.spool.glob("*" + SPOOL_SUFFIX)):
+            c = Contract()
+            try:
+                c.ParseFromString(filename.read_bytes())
+            except Exception as ex:
+                logger.error(f"cannot parse {filename}: {ex}")
+                os.replace(filename, Path(self.spool, "failed", filename.name))
+                continue
+            done = Path(self.spool, "done", filename.name)
+            os.replace(filename, done)
+            self._files.setdefault(c.contract_id, []).append(done)
+            if not self.add(c, now):
+                self._move_files(c.contract_id, "expired")
+            count += 1
+        return count
+
+    def _expire(self, now: float):
+        """ forgets the contracts that ended and have no pending changes """
+        ended = [cid for cid, end in self._scheduled.items() if end <= now]
+        if len(ended) == 0:
+            return
+        pending = self.schedule.contract_ids()
+        for cid in ended:
+            if cid not in pending:
+                del self._scheduled[cid]
+                self._move_files(cid, "expired")
+
+    def run_once(self, now: Optional[float]=None) -> List[Topology.Failure]:
+        """ reads the spool and applies the due changes in one batch """
+        now = self.clock() if now is None else now
+        self.read_spool(now)
+        self._expire(now)
+        activate, deactivate = self.schedule.pop_due(now + self.window)
+        if len(activate) + len(deactivate) == 0:
+            return []
+        try:
+            failures = self.topology.apply(activate=activate, deactivate=deactivate)
+        except Exception as ex:
+            logger.error(f"cannot apply {len(activate)} activations and {len(deactivate)} " +\
+                f"deactivations, retrying in {self.poll} seconds: {ex}")
+            for action, contracts in [(ACTIVATE, activate), (DEACTIVATE, deactivate)]:
+                for c in contracts:
+                    self.schedule.push(c, action, now + self.poll)
+            return [Topology.Failure(c, ex) for c in activate + deactivate]
+        for f in failures:
+            cid = f.contract.contract_id
+            logger.error(f"contract {cid} failed, moved to {Path(self.spool, 'failed')}: {f.error}")
+            self.schedule.remove(cid)
+            self._scheduled.pop(cid, None)
+            self._move_files(cid, "failed")
+        self._expire(now)
+        logger.info(f"applied {len(activate)} activations and {len(deactivate)} deactivations, " +\
+            f"{len(failures)} failed")
+        if not self.topology.last_diff.is_empty() and self.signal_br is not None:
+            self.signal_br()
+        return failures
+
+    def next_wakeup(self, now: float) -> float:
+        """ seconds to sleep until the next event or the next spool poll """
+        if len(self.schedule) == 0:
+            return self.poll
+        return max(0, min(self.poll, self.schedule.next_time() - now))
+
+    def run(self):
+        self.recover(self.clock())
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.next_wakeup(self.clock()))
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ESDX topology reloader daemon")
+    parser.add_argument("--topology", type=Path, required=True, help="the topology JSON file")
+    parser.add_argument("--internal-addr", required=True,
+                        help="internal address of the ESDX border router, e.g. 1.1.1.1:43210")
+    parser.add_argument("--spool", type=Path, required=True,
+                        help="directory where the contracts are dropped")
+    parser.add_argument("--reload-cmd", help="shell command run after each modification")
+    parser.add_argument("--window", type=float, default=1,
+                        help="apply together the events due within these seconds")
+    parser.add_argument("--poll", type=float, default=1, help="spool poll interval in seconds")
+    parser.add_argument("--lock", choices=["create", "flock"], default=DEFAULT_LOCK,
+                        help="lock backend; \"create\" is the legacy one, see Topology")
+    parser.add_argument("--index", action="store_true",
+                        help="keep the contract of each interface in <topology>.contracts")
+    parser.add_argument("--index-retention", type=int, default=DEFAULT_RETENTION,
+                        help="seconds the index keeps the interfaces of the ended contracts")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    signal_br = None
+    if args.reload_cmd is not None:
+        def signal_br():
+            subprocess.run(args.reload_cmd, shell=True, check=False)
+    daemon = ReloaderDaemon(
+        Topology(args.topology, args.internal_addr, lock=args.lock, index=args.index,
+                 index_retention=args.index_retention),
+        args.spool,
+        signal_br=signal_br,
+        window=args.window,
+        poll=args.poll,
+    )
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
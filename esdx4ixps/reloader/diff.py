@@ -0,0 +1,67 @@
+from typing import List, NamedTuple, Tuple
+
+
+class TopologyDiff(NamedTuple):
+    """
+    Changes between two topologies. Interfaces are identified by (BR name, interface ID).
+    The interfaces of added or removed BRs are also listed as added or removed interfaces.
+    A BR is modified if any of its values other than its interfaces changed.
+    """
+    added_brs: List[str]
+    removed_brs: List[str]
+    modified_brs: List[str]
+    added_interfaces: List[Tuple[str, str]]
+    removed_interfaces: List[Tuple[str, str]]
+    modified_interfaces: List[Tuple[str, str]]
+    modified_keys: List[str]  # top level keys other than border_routers
+
+    def is_empty(self) -> bool:
+        return all(len(l) == 0 for l in self)
+
+
+def _without_interfaces(br: dict) -> dict:
+    return {k: v for k, v in br.items() if k != "interfaces"}
+
+
+def diff(old: dict, new: dict) -> TopologyDiff:
+    d = TopologyDiff([], [], [], [], [], [], [])
+    for k in sorted(old.keys() | new.keys()):
+        if k != "border_routers" and old.get(k) != new.get(k):
+            d.modified_keys.append(k)
+    old_brs = old.get("border_routers", {})
+    new_brs = new.get("border_routers", {})
+    for name in sorted(old_brs.keys() - new_brs.keys()):
+        d.removed_brs.append(name)
+        d.removed_interfaces.extend((name, ifid) for ifid in old_brs[name]["interfaces"])
+    for name in sorted(new_brs.keys() - old_brs.keys()):
+        d.added_brs.append(name)
+        d.added_interfaces.extend((name, ifid) for ifid in new_brs[name]["interfaces"])
+    for name in sorted(old_brs.keys() & new_brs.keys()):
+        old_br, new_br = old_brs[name], new_brs[name]
+        if old_br is new_br:
+            continue
+        if _without_interfaces(old_br) != _without_interfaces(new_br):
+            d.modified_brs.append(name)
+        old_ifaces, new_ifaces = old_br["interfaces"], new_br["interfaces"]
+        d.removed_interfaces.extend(
+            (name, ifid) for ifid in old_ifaces if ifid not in new_ifaces)
+        d.added_interfaces.extend(
+            (name, ifid) for ifid in new_ifaces if ifid not in old_ifaces)
+        d.modified_interfaces.extend(
+            (name, ifid) for ifid in old_ifaces
+            if ifid in new_ifaces and old_ifaces[ifid] != new_ifaces[ifid])
+    return d
+
+
+def snapshot(topo: dict) -> dict:
+    """
+    Copy of the topology that can be diffed against it after it is modified by Topology, which
+    only adds and removes BRs and interfaces but never modifies an interface in place.
+    Copies only the containers, so it is much cheaper than a deep copy.
+    """
+    copy = dict(topo)
+    copy["border_routers"] = {
+        name: {**br, "interfaces": dict(br["interfaces"])}
+        for name, br in topo["border_routers"].items()
+    }
+    return copy
@@ -0,0 +1,80 @@
+from pathlib import Path
+from reloader import codec
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+# Index of the interfaces assigned to the contracts by Topology, persisted next to the topology
+# file. The interface IDs are reused once a contract is deactivated, so each (AS, ifid) keeps
+# the intervals in which it belonged to each contract:
+#
+#   {"1-ff00:0:110": {"3": [[contract_id, since, until], ...]}}
+#
+# with since and until in seconds since the epoch, and until null while still active.
+# The monitor identifies the traffic by interface ID, and finds the contract of a sample with
+# a dictionary lookup and a scan of the few intervals of that interface. Topology prunes the
+# intervals that ended more than a retention period ago on each update.
+
+
+DEFAULT_RETENTION = 90 * 24 * 3600  # seconds
+
+
+class ContractIndex:
+    class Interval(NamedTuple):
+        contract_id: int
+        since: int
+        until: Optional[int]  # None if active
+
+        def contains(self, t: float) -> bool:
+            return self.since <= t and (self.until is None or t < self.until)
+
+    def __init__(self, filename: Optional[Path]=None):
+        """ loads the index from filename, if it exists """
+        self.filename = filename
+        self._intervals: Dict[Tuple[str, int], List[ContractIndex.Interval]] = {}
+        if filename is not None and Path(filename).exists():
+            data = codec.loads(Path(filename).read_bytes())
+            for ia, ifids in data.items():
+                for ifid, intervals in ifids.items():
+                    self._intervals[(ia, int(ifid))] = [ContractIndex.Interval(*i) for i in intervals]
+
+    def __len__(self) -> int:
+        return sum(len(intervals) for intervals in self._intervals.values())
+
+    def dumps(self) -> bytes:
+        data = {}
+        for (ia, ifid), intervals in sorted(self._intervals.items()):
+            data.setdefault(ia, {})[str(ifid)] = [list(i) for i in intervals]
+        return codec.dumps(data, compact=True)
+
+    def activate(self, ia: str, ifid: int, contract_id: int, t: int):
+        """ the interface belongs to the contract from t on; it closes any active interval """
+        self.deactivate(ia, ifid, t)
+        self._intervals.setdefault((ia, ifid), []).append(
+            ContractIndex.Interval(contract_id, t, None))
+
+    def deactivate(self, ia: str, ifid: int, t: int):
+        intervals = self._intervals.get((ia, ifid))
+        if intervals and intervals[-1].until is None:
+            intervals[-1] = intervals[-1]._replace(until=t)
+
+    def lookup(self, ia: str, ifid: int, t: float) -> Optional[int]:
+        """ the ID of the contract that had the interface at time t, or None """
+        for interval in reversed(self._intervals.get((ia, ifid), ())):
+            if interval.contains(t):
+                return interval.contract_id
+        return None
+
+    def intervals(self) -> Iterator[Tuple[str, int, "ContractIndex.Interval"]]:
+        """ (AS, ifid, interval) of all the intervals in the index """
+        for (ia, ifid), intervals in self._intervals.items():
+            for i in intervals:
+                yield ia, ifid, i
+
+    def prune(self, before: int):
+        """ forgets the intervals that ended before that time """
+        for key in list(self._intervals):
+            intervals = [i for i in self._intervals[key] if i.until is None or i.until >= before]
+            if len(intervals) > 0:
+                self._intervals[key] = intervals
+            else:
+                del self._intervals[key]
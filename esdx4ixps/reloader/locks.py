@@ -0,0 +1,177 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+import fcntl
+import os
+import threading
+import time
+
+
+# Locks that serialize the modifications of a topology file among the reloader processes.
+# Both raise RuntimeError if the lock could not be acquired in time.
+# FlockLock is the default. CreateFileLock is the legacy backend, kept for the deployments that
+# still use it: a FlockLock given its lock file as `legacy` also excludes those processes.
+
+DEFAULT_LOCK = "flock"
+
+
+class CreateFileLock:
+    """
+    The lock is held while the lock file exists. Acquiring it polls every `sleep` seconds, up to
+    `attempts` times. If a process dies while holding it, the lock file must be removed by hand.
+    """
+    def __init__(self, lockfile: Path, attempts: int=10, sleep: float=0.1):
+        self.lockfile = lockfile
+        self.attempts = attempts
+        self.sleep = sleep
+
+    @contextmanager
+    def acquire(self):
+        def _lock():
+            ex = None
+            for attempts in range(self.attempts):
+                try:
+                    with open(self.lockfile, "x+b"):
+                        return
+                except FileExistsError as e:
+                    ex = e
+                    attempts += 1
+                    time.sleep(self.sleep)
+            if attempts >= self.attempts:
+                raise RuntimeError(ex) from ex
+        _lock()
+        try:
+            yield
+        finally:
+            try:
+                os.remove(self.lockfile)
+            except FileNotFoundError as ex:
+                raise RuntimeError(ex) from ex
+
+
+class _FifoLock:
+    """ ticket lock: the threads of this process get it in the order they asked for it """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self._abandoned = set()
+
+    def acquire(self, timeout: Optional[float]) -> bool:
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            if self._cond.wait_for(lambda: self._serving == ticket, timeout):
+                return True
+            self._abandoned.add(ticket)
+            return False
+
+    def release(self):
+        with self._cond:
+            self._serving += 1
+            while self._serving in self._abandoned:
+                self._abandoned.remove(self._serving)
+                self._serving += 1
+            self._cond.notify_all()
+
+
+_fifo_locks = {}
+_fifo_locks_mutex = threading.Lock()
+
+
+def _fifo_lock(lockfile: Path) -> _FifoLock:
+    key = os.path.realpath(lockfile)
+    with _fifo_locks_mutex:
+        lock = _fifo_locks.get(key)
+        if lock is None:
+            lock = _fifo_locks[key] = _FifoLock()
+        return lock
+
+
+class FlockLock:
+    """
+    Lock based on flock(2) on the lock file, which is created if needed and never removed.
+    The kernel releases the lock when the holding process dies, so there are no stale locks.
+    Without a timeout, a waiting process is woken up as soon as the lock is released; with
+    one, it polls flock without blocking, backing off up to _MAX_POLL seconds.
+    The threads of the same process are served in FIFO order.
+    timeout: seconds to wait for the lock, or None to wait forever.
+    legacy: the lock file of a CreateFileLock to honor too, while processes using both backends
+            coexist. It is created while holding the flock, and marked as ours: a marked file
+            found while holding the flock was left by a process that died, and is removed.
+    """
+    _MAX_POLL = 0.005
+
+    def __init__(self, lockfile: Path, timeout: Optional[float]=None, legacy: Optional[Path]=None):
+        self.lockfile = lockfile
+        self.timeout = timeout
+        self.legacy = legacy
+
+    @contextmanager
+    def acquire(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        fifo = _fifo_lock(self.lockfile)
+        if not fifo.acquire(self.timeout):
+            raise RuntimeError(f"timeout waiting for lock {self.lockfile}")
+        try:
+            fd = self._flock(deadline)
+            try:
+                if self.legacy is not None:
+                    self._acquire_legacy(deadline)
+                try:
+                    yield
+                finally:
+                    if self.legacy is not None:
+                        os.remove(self.legacy)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        finally:
+            fifo.release()
+
+    def _flock(self, deadline: Optional[float]) -> int:
+        """ returns the file descriptor of the locked file """
+        fd = os.open(self.lockfile, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if deadline is None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                return fd
+            # flock has no timeout, and a thread blocked in it cannot be woken up: poll
+            self._poll(deadline, lambda: fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB),
+                       BlockingIOError)
+            return fd
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def _acquire_legacy(self, deadline: Optional[float]):
+        def _create():
+            try:
+                with open(self.legacy, "xb") as f:
+                    f.write(_LEGACY_MARK)
+            except FileExistsError:
+                try:
+                    if Path(self.legacy).read_bytes() == _LEGACY_MARK:
+                        os.remove(self.legacy)  # stale, we hold the flock
+                except FileNotFoundError:
+                    pass
+                raise
+        self._poll(deadline, _create, FileExistsError)
+
+    def _poll(self, deadline: Optional[float], attempt: Callable[[], None], busy: type):
+        """ calls attempt until it does not raise busy, or raises RuntimeError at the deadline """
+        wait = 0.0001
+        while True:
+            try:
+                return attempt()
+            except busy:
+                pass
+            left = float("inf") if deadline is None else deadline - time.monotonic()
+            if left <= 0:
+                raise RuntimeError(f"timeout waiting for lock {self.lockfile}")
+            time.sleep(min(wait, left))
+            wait = min(2 * wait, self._MAX_POLL)
+
+
+_LEGACY_MARK = b"flock\n"
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from market_pb2 import Contract
+from pathlib import Path
+from reloader.topology import Topology
+from typing import Dict, Iterable, List, Tuple
+
+
+class TopologyManager:
+    """
+    Manages the topologies of many local ASes, e.g. those of the customers of an IXP.
+    Contracts are routed to the topologies of their seller and buyer by IA, and the changes
+    to different topologies are applied in parallel.
+    """
+    def __init__(self, topologies: Iterable[Topology], max_workers: int=None):
+        self.topologies: Dict[str, Topology] = {}
+        for t in topologies:
+            if t.isd_as in self.topologies:
+                raise ValueError(f"more than one topology for {t.isd_as}: " +\
+                    f"{self.topologies[t.isd_as].topofile} and {t.topofile}")
+            self.topologies[t.isd_as] = t
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="topology")
+
+    @classmethod
+    def from_files(cls, files: Iterable[Tuple[Path, str]], max_workers: int=None, **kwargs):
+        """
+        files: tuples of (topology file, internal address of its ESDX BR).
+        kwargs are passed to each Topology.
+        """
+        return cls([Topology(f, addr, **kwargs) for f, addr in files], max_workers)
+
+    def route(self, c: Contract) -> List[Topology]:
+        """ the managed topologies the contract applies to: the seller's and/or the buyer's """
+        ias = {c.offer.iaid, c.buyer_iaid}
+        return [self.topologies[ia] for ia in sorted(ias) if ia in self.topologies]
+
+    def apply(
+        self,
+        activate: Iterable[Contract]=(),
+        deactivate: Iterable[Contract]=(),
+    ) -> Dict[str, List[Topology.Failure]]:
+        """
+        Applies the contracts to their topologies, one Topology.apply per topology and all of
+        them in parallel. Returns the failures by IA. Contracts not belonging to any managed
+        topology are reported under the None key.
+        """
+        batches = {}  # IA -> ([activate], [deactivate])
+        failures = {}
+        for i, contracts in enumerate((activate, deactivate)):
+            for c in contracts:
+                topologies = self.route(c)
+                if len(topologies) == 0:
+                    failures.setdefault(None, []).append(Topology.Failure(
+                        c, RuntimeError(f"no topology for {c.offer.iaid} nor {c.buyer_iaid}")))
+                for t in topologies:
+                    batches.setdefault(t.isd_as, ([], []))[i].append(c)
+        futures = {
+            ia: self._executor.submit(self.topologies[ia].apply, activate=a, deactivate=d)
+            for ia, (a, d) in batches.items()
+        }
+        for ia, future in futures.items():
+            try:
+                f = future.result()
+            except Exception as ex:  # e.g. the lock could not be acquired
+                f = [Topology.Failure(c, ex) for c in batches[ia][0] + batches[ia][1]]
+            if len(f) > 0:
+                failures[ia] = f
+        return failures
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
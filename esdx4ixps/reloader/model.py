@@ -0,0 +1,74 @@
+from collections import defaultdict
+from ipaddress import IPv4Address, IPv6Address
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from util.conversion import ip_port_from_str
+
+
+class FreeValuePool:
+    """
+    Set of used integers, that returns the lowest unused one greater or equal than min_value.
+    The search starts at a hint that only moves forward when taking values and backward when
+    releasing them, so allocating values in order is O(1) amortized.
+    """
+    def __init__(self, min_value: int=1, used: Iterable[int]=()):
+        self.min_value = min_value
+        self.used = set(used)
+        self._hint = min_value
+
+    def lowest_free(self) -> int:
+        v = self._hint
+        while v in self.used:
+            v += 1
+        self._hint = v
+        return v
+
+    def take(self, value: int):
+        self.used.add(value)
+
+    def release(self, value: int):
+        self.used.discard(value)
+        if self.min_value <= value < self._hint:
+            self._hint = value
+
+
+class TopologyModel:
+    """
+    Indices over a topology dictionary, to allocate interface IDs and public ports, to find
+    interfaces by their remote underlay without scanning all the border routers, and to check
+    internal addresses for conflicts. All addresses are parsed once, when building the model.
+    The model must be updated with add_interface and remove_interface together with the topology.
+    """
+    def __init__(self, topo: dict, min_port: int):
+        self.min_port = min_port
+        self.ifids = FreeValuePool(1)
+        self.ports = defaultdict(lambda: FreeValuePool(self.min_port))  # ip -> ports
+        self.by_remote: Dict[str, Tuple[str, str]] = {}  # remote underlay -> (br name, ifid)
+        self.internal_addrs: Dict[tuple, List[str]] = {}  # (ip, port) -> br names, as loaded
+        for br_name, br in topo["border_routers"].items():
+            self.internal_addrs.setdefault(ip_port_from_str(br["internal_addr"]), []).append(br_name)
+            for ifid, iface in br["interfaces"].items():
+                self._index(br_name, ifid, iface)
+
+    def _index(self, br_name: str, ifid: str, iface: dict):
+        self.ifids.take(int(ifid))
+        ip, port = ip_port_from_str(iface["underlay"]["public"])
+        self.ports[ip].take(port)
+        self.by_remote[iface["underlay"]["remote"]] = (br_name, ifid)
+
+    def add_interface(self, br_name: str, ifid: str, iface: dict):
+        self._index(br_name, ifid, iface)
+
+    def remove_interface(self, br_name: str, ifid: str, iface: dict):
+        self.ifids.release(int(ifid))
+        ip, port = ip_port_from_str(iface["underlay"]["public"])
+        self.ports[ip].release(port)
+        if self.by_remote.get(iface["underlay"]["remote"]) == (br_name, ifid):
+            del self.by_remote[iface["underlay"]["remote"]]
+
+    def find_remote(self, remote_underlay: str) -> Optional[Tuple[str, str]]:
+        """ returns (br name, ifid) of the interface with that remote underlay, or None """
+        return self.by_remote.get(remote_underlay)
+
+    def internal_addr_users(self, ip: Union[IPv4Address, IPv6Address], port: int) -> List[str]:
+        """ names of the BRs with that internal address in the loaded topology """
+        return self.internal_addrs.get((ip, port), [])
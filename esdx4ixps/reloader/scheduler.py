@@ -0,0 +1,101 @@
+from defs import BW_PERIOD
+from market_pb2 import Contract
+from typing import Dict, List, Set, Tuple
+from util import conversion
+
+import heapq
+import itertools
+
+
+ACTIVATE = 0
+DEACTIVATE = 1
+
+
+def contract_intervals(c: Contract) -> List[Tuple[int, int]]:
+    """
+    Returns the [start, end) intervals, in seconds since the epoch, when the interface of the
+    contract must exist: those of the non zero slots of the bandwidth profile, with adjacent
+    slots merged into one interval.
+    """
+    intervals = []
+    start = c.buyer_starting_on.seconds
+    for i, bw in enumerate(conversion.csv_to_intlist(c.buyer_bw_profile)):
+        if bw == 0:
+            continue
+        t0 = start + i * BW_PERIOD
+        if len(intervals) > 0 and intervals[-1][1] == t0:
+            intervals[-1] = (intervals[-1][0], t0 + BW_PERIOD)
+        else:
+            intervals.append((t0, t0 + BW_PERIOD))
+    return intervals
+
+
+class Schedule:
+    """
+    Activation and deactivation events of contracts, in a heap: adding a contract is
+    O(k log n) for its k intervals, and looking up the next event is O(1).
+    """
+    def __init__(self):
+        self._heap = []  # (time, sequence, action, contract)
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, c: Contract, now: float=0, active: bool=False) -> int:
+        """
+        schedules the intervals of the contract not yet finished; returns how many.
+        active: the interface of the contract already exists, so the interval in progress only
+        needs its deactivation.
+        """
+        count = 0
+        for start, end in contract_intervals(c):
+            if end <= now:
+                continue
+            if not (active and start <= now):
+                heapq.heappush(self._heap, (start, next(self._sequence), ACTIVATE, c))
+            heapq.heappush(self._heap, (end, next(self._sequence), DEACTIVATE, c))
+            count += 1
+        return count
+
+    def push(self, c: Contract, action: int, t: float):
+        """ schedules one event, e.g. to retry one that could not be applied """
+        heapq.heappush(self._heap, (t, next(self._sequence), action, c))
+
+    def contract_ids(self) -> Set[int]:
+        """ the IDs of the contracts with pending events """
+        return {c.contract_id for _, _, _, c in self._heap}
+
+    def remove(self, contract_id: int) -> int:
+        """ drops the pending events of the contract; returns how many """
+        before = len(self._heap)
+        self._heap = [e for e in self._heap if e[3].contract_id != contract_id]
+        heapq.heapify(self._heap)
+        return before - len(self._heap)
+
+    def next_time(self) -> float:
+        """ time of the next event, or None if there are none """
+        return self._heap[0][0] if len(self._heap) > 0 else None
+
+    def pop_due(self, now: float) -> Tuple[List[Contract], List[Contract]]:
+        """
+        Pops the events due until now and returns the net changes as (activate, deactivate).
+        The events of a contract alternate, so if its first and last due events are different
+        (e.g. activate and deactivate) its state does not change and it appears in neither list.
+        """
+        first: Dict[int, int] = {}
+        last: Dict[int, Tuple[int, Contract]] = {}
+        while len(self._heap) > 0 and self._heap[0][0] <= now:
+            _, _, action, c = heapq.heappop(self._heap)
+            first.setdefault(id(c), action)
+            last[id(c)] = (action, c)
+        activate = []
+        deactivate = []
+        for key, (action, c) in last.items():
+            if first[key] != action:
+                continue
+            if action == ACTIVATE:
+                activate.append(c)
+            else:
+                deactivate.append(c)
+        return activate, deactivate
@@ -0,0 +1,24 @@
+from collections import defaultdict
+from pathlib import Path
+from reloader import codec
+from reloader.tests.test_topology import DATADIR
+from unittest import TestCase
+
+import json
+
+
+class TestCodec(TestCase):
+    def test_same_output_as_stdlib(self):
+        with open(Path(DATADIR, "topo.json")) as f:
+            topo = json.load(f)
+        topo["border_routers"]["br1-ff00_0_111-1111"] = {
+            "internal_addr": "1.1.1.1:43210",
+            "interfaces": defaultdict(lambda: []),  # as created by Topology
+        }
+        topo["foo"] = [1.5, None, True, {}]
+        for compact in [False, True]:
+            with self.subTest(compact=compact):
+                raw = codec.dumps(topo, compact)
+                self.assertEqual(raw, codec.stdlib_dumps(topo, compact))
+                self.assertEqual(codec.loads(raw), json.loads(raw))
+        self.assertEqual(codec.stdlib_dumps(topo), (json.dumps(topo, indent=2) + "\n").encode())
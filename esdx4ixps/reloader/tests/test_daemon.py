@@ -0,0 +1,178 @@
+from pathlib import Path
+from reloader.daemon import ReloaderDaemon, spool_contract
+from reloader.tests import test_topology
+from reloader.tests.test_topology import DATADIR
+from reloader.topology import Topology
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import json
+import shutil
+import subprocess
+import sys
+
+
+class TestReloaderDaemon(TestCase):
+    def _interfaces(self, temp) -> dict:
+        with open(Path(temp, "topo.json")) as f:
+            topo = json.load(f)
+        br = topo["border_routers"].get("br1-ff00_0_111-1111", {"interfaces": {}})
+        return {iface["underlay"]["remote"] for iface in br["interfaces"].values()}
+
+    def test_run_once(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            spool = Path(temp, "spool")
+            spool.mkdir()
+            signals = []
+            daemon = ReloaderDaemon(
+                Topology(Path(temp, "topo.json"), "1.1.1.1:43210"),
+                spool,
+                signal_br=lambda: signals.append(1),
+                window=0,
+            )
+            # starting at 1, with two slots of BW_PERIOD; the last one starts one slot later
+            for i in range(3):
+                c = test_topology.TestTopology._mock_contract()
+                c.contract_id = i + 1
+                c.br_address = f"1.1.1.1:{50000 + i}"
+                if i == 2:
+                    c.buyer_starting_on.seconds = 601
+                spool_contract(spool, c)
+            Path(spool, "bad.contract").write_bytes(b"garbage")
+
+            self.assertEqual(daemon.run_once(now=0), [])
+            self.assertEqual(signals, [])
+            self.assertEqual(len(list(spool.glob("*.contract"))), 0)
+            self.assertEqual(len(list(Path(spool, "done").iterdir())), 3)
+            self.assertEqual(len(list(Path(spool, "failed").iterdir())), 1)
+            self.assertEqual(daemon.next_wakeup(0), 1)
+
+            # the first two activations in one batch
+            self.assertEqual(daemon.run_once(now=1), [])
+            self.assertEqual(len(signals), 1)
+            self.assertEqual(self._interfaces(temp), {"1.1.1.1:50000", "1.1.1.1:50001"})
+            daemon.run_once(now=601)
+            self.assertEqual(len(signals), 2)
+            self.assertEqual(len(self._interfaces(temp)), 3)
+            daemon.run_once(now=1201)
+            self.assertEqual(self._interfaces(temp), {"1.1.1.1:50002"})
+            self.assertEqual(daemon.run_once(now=1801), [])
+            self.assertEqual(self._interfaces(temp), set())
+            self.assertEqual(len(signals), 4)
+            self.assertEqual(len(daemon.schedule), 0)
+            # the ended contracts leave spool/done, so the restarts do not read them again
+            self.assertEqual(len(list(Path(spool, "done").iterdir())), 0)
+            self.assertEqual(len(list(Path(spool, "expired").iterdir())), 3)
+
+    def test_expired_and_late(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            daemon = ReloaderDaemon(
+                Topology(Path(temp, "topo.json"), "1.1.1.1:43210"),
+                Path(temp, "spool"),
+            )
+            c = test_topology.TestTopology._mock_contract()
+            daemon.add(c, now=1201)  # already expired
+            self.assertEqual(len(daemon.schedule), 0)
+            # the activation and deactivation are due in the same batch: nothing happens
+            daemon.add(c, now=1200)
+            self.assertEqual(daemon.run_once(now=1205), [])
+            self.assertEqual(self._interfaces(temp), set())
+
+    def test_duplicates_and_restart(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            spool = Path(temp, "spool")
+            spool.mkdir()
+
+            def _daemon():
+                return ReloaderDaemon(
+                    Topology(Path(temp, "topo.json"), "1.1.1.1:43210"), spool, window=0)
+            daemon = _daemon()
+            contracts = []
+            for i in range(3):
+                c = test_topology.TestTopology._mock_contract()
+                c.contract_id = i + 1
+                c.br_address = f"1.1.1.1:{50000 + i}"
+                c.buyer_starting_on.seconds = 1 + i * 600
+                contracts.append(c)
+            spool_contract(spool, contracts[0])
+            spool_contract(spool, contracts[0])  # scheduled once
+            spool_contract(spool, contracts[1])
+            daemon.run_once(now=0)
+            self.assertEqual(len(daemon.schedule), 4)
+            daemon.run_once(now=1)
+            self.assertEqual(self._interfaces(temp), {"1.1.1.1:50000"})
+
+            # restarted: contract 1 is still active, contract 2 is due
+            daemon = _daemon()
+            self.assertEqual(daemon.recover(now=601), 2)
+            self.assertEqual(len(daemon.schedule), 3)
+            daemon.run_once(now=601)
+            self.assertEqual(self._interfaces(temp), {"1.1.1.1:50000", "1.1.1.1:50001"})
+            spool_contract(spool, contracts[1])  # spooled again
+            daemon.run_once(now=602)
+            self.assertEqual(len(daemon.schedule), 2)
+
+            # down while contract 1 ended: deactivated when restarting
+            daemon = _daemon()
+            daemon.recover(now=1300)
+            daemon.run_once(now=1300)
+            self.assertEqual(self._interfaces(temp), {"1.1.1.1:50001"})
+            self.assertEqual(len(list(Path(spool, "expired").iterdir())), 2)  # contract 1
+            daemon.run_once(now=1801)
+            self.assertEqual(self._interfaces(temp), set())
+            self.assertEqual(len(daemon.schedule), 0)
+            daemon.run_once(now=1802)
+            self.assertEqual(len(list(Path(spool, "done").iterdir())), 0)
+            self.assertEqual(_daemon().recover(now=1802), 0)
+            # spooled after it expired
+            spool_contract(spool, contracts[0])
+            daemon.run_once(now=1803)
+            self.assertEqual(len(list(Path(spool, "expired").iterdir())), 5)
+
+    def test_apply_error(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            topology = Topology(Path(temp, "topo.json"), "1.1.1.1:43210", attempts=1, sleep=0)
+            daemon = ReloaderDaemon(topology, Path(temp, "spool"), window=0, poll=5)
+            c = test_topology.TestTopology._mock_contract()
+            daemon.add(c, now=0)
+            with topology._lock():
+                failures = daemon.run_once(now=1)  # the lock is taken: retried later
+            self.assertEqual([f.contract for f in failures], [c])
+            self.assertIsInstance(failures[0].error, RuntimeError)
+            self.assertEqual(self._interfaces(temp), set())
+            self.assertEqual(daemon.schedule.next_time(), 6)
+            self.assertEqual(daemon.run_once(now=6), [])
+            self.assertEqual(self._interfaces(temp), {"1.1.1.1:50000"})
+            daemon.run_once(now=1201)
+            self.assertEqual(self._interfaces(temp), set())
+
+    def test_contract_failure(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            spool = Path(temp, "spool")
+            spool.mkdir()
+            daemon = ReloaderDaemon(
+                Topology(Path(temp, "topo.json"), "1.1.1.1:43210"), spool, window=0)
+            bad = test_topology.TestTopology._mock_contract()
+            bad.contract_id = 2
+            bad.br_address = "garbage"
+            spool_contract(spool, test_topology.TestTopology._mock_contract())
+            spool_contract(spool, bad)
+            daemon.run_once(now=0)
+            failures = daemon.run_once(now=1)
+            self.assertEqual([f.contract.contract_id for f in failures], [2])
+            self.assertEqual(self._interfaces(temp), {"1.1.1.1:50000"})
+            # not retried, and visible in spool/failed
+            self.assertEqual([f.name.split("-")[0] for f in Path(spool, "failed").iterdir()], ["2"])
+            self.assertEqual(daemon.schedule.contract_ids(), {0})
+            self.assertEqual(daemon.run_once(now=1201), [])
+            self.assertEqual(self._interfaces(temp), set())
+
+    def test_does_not_import_django(self):
+        code = "import reloader.daemon, sys; sys.exit('django' in sys.modules)"
+        p = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent.parent.parent)
+        self.assertEqual(p.returncode, 0)
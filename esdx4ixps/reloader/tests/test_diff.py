@@ -0,0 +1,63 @@
+from pathlib import Path
+from reloader.diff import diff, snapshot
+from reloader.tests import test_topology
+from reloader.tests.test_topology import DATADIR
+from reloader.topology import Topology
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import copy
+import json
+import shutil
+
+
+class TestDiff(TestCase):
+    def test_diff(self):
+        with open(Path(DATADIR, "topo.json")) as f:
+            old = json.load(f)
+        old["border_routers"]["br1-ff00_0_111-2"] = {
+            "internal_addr": "127.0.0.1:1",
+            "interfaces": {"2": {}, "3": {}},
+        }
+        self.assertTrue(diff(old, copy.deepcopy(old)).is_empty())
+        new = copy.deepcopy(old)
+        brs = new["border_routers"]
+        name = "br1-ff00_0_111-1"
+        ifid = sorted(brs[name]["interfaces"])[0]
+        brs[name]["interfaces"][ifid]["mtu"] = 1000
+        brs[name]["interfaces"]["999"] = copy.deepcopy(brs[name]["interfaces"][ifid])
+        del brs["br1-ff00_0_111-2"]
+        brs["br-new"] = {"internal_addr": "1.1.1.1:1", "interfaces": {"1000": {}}}
+        new["foo"] = "bar"
+        d = diff(old, new)
+        self.assertEqual(d.added_brs, ["br-new"])
+        self.assertEqual(d.removed_brs, ["br1-ff00_0_111-2"])
+        self.assertEqual(d.modified_brs, [])
+        self.assertEqual(sorted(d.added_interfaces), [("br-new", "1000"), (name, "999")])
+        self.assertEqual(d.removed_interfaces, [("br1-ff00_0_111-2", "2"), ("br1-ff00_0_111-2", "3")])
+        self.assertEqual(d.modified_interfaces, [(name, ifid)])
+        self.assertEqual(d.modified_keys, ["foo"])
+        new = snapshot(old)
+        new["border_routers"][name]["internal_addr"] = "2.2.2.2:2"
+        self.assertEqual(diff(old, new).modified_brs, [name])
+
+    def test_apply_diff(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            r = Topology(
+                topofile=Path(temp, "topo.json"),
+                internal_addr="1.1.1.1:43210",
+            )
+            c = test_topology.TestTopology._mock_contract()
+            r.activate(c)
+            self.assertEqual(r.last_diff.added_brs, ["br1-ff00_0_111-1111"])
+            self.assertEqual(r.last_diff.added_interfaces, [("br1-ff00_0_111-1111", "1")])
+            # a failed batch does not touch the file
+            mtime = Path(temp, "topo.json").stat().st_mtime_ns
+            c2 = copy.deepcopy(c)
+            c2.br_address = "1.1.1.1:60000"
+            self.assertEqual(len(r.deactivate_many([c2])), 1)
+            self.assertTrue(r.last_diff.is_empty())
+            self.assertEqual(Path(temp, "topo.json").stat().st_mtime_ns, mtime)
+            r.deactivate(c)
+            self.assertEqual(r.last_diff.removed_brs, ["br1-ff00_0_111-1111"])
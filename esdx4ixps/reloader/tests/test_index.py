@@ -0,0 +1,42 @@
+from pathlib import Path
+from reloader.index import ContractIndex
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+
+IA = "1-ff00:0:110"
+
+
+class TestContractIndex(TestCase):
+    def test_lookup(self):
+        index = ContractIndex()
+        index.activate(IA, 1, 10, 100)
+        index.activate(IA, 2, 11, 100)
+        index.deactivate(IA, 1, 200)
+        index.activate(IA, 1, 12, 300)  # the interface ID is reused
+        self.assertEqual(len(index), 3)
+        self.assertIsNone(index.lookup(IA, 1, 99))
+        self.assertEqual(index.lookup(IA, 1, 100), 10)
+        self.assertEqual(index.lookup(IA, 1, 199), 10)
+        self.assertIsNone(index.lookup(IA, 1, 250))
+        self.assertEqual(index.lookup(IA, 1, 1000), 12)
+        self.assertEqual(index.lookup(IA, 2, 1000), 11)
+        self.assertIsNone(index.lookup("1-ff00:0:111", 2, 1000))
+        # activating an interface closes its active interval
+        index.activate(IA, 2, 13, 400)
+        self.assertEqual(index.lookup(IA, 2, 399), 11)
+        self.assertEqual(index.lookup(IA, 2, 400), 13)
+        index.prune(250)
+        self.assertEqual(sorted(i.contract_id for _, _, i in index.intervals()), [11, 12, 13])
+
+    def test_persisted(self):
+        with TemporaryDirectory() as temp:
+            index = ContractIndex()
+            index.activate(IA, 1, 10, 100)
+            index.deactivate(IA, 1, 200)
+            index.activate(IA, 3, 11, 150)
+            Path(temp, "index").write_bytes(index.dumps())
+            loaded = ContractIndex(Path(temp, "index"))
+            self.assertEqual(list(loaded.intervals()), list(index.intervals()))
+            self.assertEqual(loaded.lookup(IA, 3, 1000), 11)
+            self.assertEqual(len(ContractIndex(Path(temp, "missing"))), 0)
@@ -0,0 +1,96 @@
+from pathlib import Path
+from reloader.locks import CreateFileLock, FlockLock
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import subprocess
+import sys
+import threading
+import time
+
+
+class TestFlockLock(TestCase):
+    def test_exclusion_and_order(self):
+        with TemporaryDirectory() as temp:
+            lockfile = Path(temp, ".lock")
+            holders = []
+            order = []
+            def worker(i):
+                with FlockLock(lockfile).acquire():
+                    holders.append(i)
+                    self.assertEqual(len(holders), 1)
+                    order.append(i)
+                    time.sleep(0.01)
+                    holders.remove(i)
+            with FlockLock(lockfile).acquire():
+                threads = []
+                for i in range(5):
+                    t = threading.Thread(target=worker, args=(i,))
+                    t.start()
+                    threads.append(t)
+                    time.sleep(0.05)  # let it queue
+            for t in threads:
+                t.join()
+            self.assertEqual(order, list(range(5)))
+            self.assertTrue(lockfile.exists())  # flock lock files are never removed
+
+    def test_timeout(self):
+        with TemporaryDirectory() as temp:
+            lockfile = Path(temp, ".lock")
+            threads = threading.active_count()
+            with FlockLock(lockfile).acquire():
+                t0 = time.monotonic()
+                with self.assertRaises(RuntimeError):
+                    with FlockLock(lockfile, timeout=0.1).acquire():
+                        pass
+                self.assertGreaterEqual(time.monotonic() - t0, 0.1)
+            # the abandoned attempt did not keep the lock, nor left a thread waiting for it
+            self.assertEqual(threading.active_count(), threads)
+            with FlockLock(lockfile, timeout=1).acquire():
+                pass
+
+    def test_legacy(self):
+        with TemporaryDirectory() as temp:
+            lockfile, legacy = Path(temp, ".flock"), Path(temp, ".lock")
+            with FlockLock(lockfile, legacy=legacy).acquire():
+                with self.assertRaises(RuntimeError):
+                    with CreateFileLock(legacy, attempts=2, sleep=0.01).acquire():
+                        pass
+            self.assertFalse(legacy.exists())
+            # held by a process of the legacy backend
+            with CreateFileLock(legacy).acquire():
+                with self.assertRaises(RuntimeError):
+                    with FlockLock(lockfile, timeout=0.05, legacy=legacy).acquire():
+                        pass
+            self.assertFalse(legacy.exists())
+            # left behind by a process with the flock that died: it is stale
+            legacy.write_bytes(b"flock\n")
+            with FlockLock(lockfile, timeout=1, legacy=legacy).acquire():
+                self.assertTrue(legacy.exists())
+            self.assertFalse(legacy.exists())
+
+    def test_released_when_holder_dies(self):
+        with TemporaryDirectory() as temp:
+            lockfile = Path(temp, ".lock")
+            # another process takes the lock and is killed while holding it
+            code = "import fcntl,os,sys,time\n" +\
+                f"fd = os.open({str(lockfile)!r}, os.O_RDWR | os.O_CREAT)\n" +\
+                "fcntl.flock(fd, fcntl.LOCK_EX)\n" +\
+                "print('locked', flush=True)\n" +\
+                "time.sleep(60)\n"
+            p = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+            try:
+                self.assertEqual(p.stdout.readline().strip(), b"locked")
+                with self.assertRaises(RuntimeError):
+                    with FlockLock(lockfile, timeout=0.05).acquire():
+                        pass
+                def kill():
+                    time.sleep(0.1)
+                    p.kill()
+                threading.Thread(target=kill).start()
+                with FlockLock(lockfile, timeout=5).acquire():
+                    pass
+            finally:
+                p.kill()
+                p.wait()
+                p.stdout.close()
@@ -0,0 +1,42 @@
+from pathlib import Path
+from reloader.manager import TopologyManager
+from reloader.tests import test_topology
+from reloader.tests.test_topology import DATADIR
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import json
+
+
+class TestTopologyManager(TestCase):
+    def test_apply(self):
+        with TemporaryDirectory() as temp:
+            with open(Path(DATADIR, "topo.json")) as f:
+                topo = json.load(f)
+            files = []
+            for ia in ["1-ff00:0:110", "1-ff00:0:111"]:  # seller and buyer of the mock contract
+                topo["isd_as"] = ia
+                filename = Path(temp, f"{ia.replace(':', '_')}.json")
+                with open(filename, "w") as f:
+                    json.dump(topo, f)
+                files.append((filename, "1.1.1.1:43210"))
+            with TopologyManager.from_files(files, lock="flock") as m:
+                self.assertEqual(sorted(m.topologies), ["1-ff00:0:110", "1-ff00:0:111"])
+                c = test_topology.TestTopology._mock_contract()
+                other = test_topology.TestTopology._mock_contract()
+                other.offer.iaid = "1-ff00:0:112"
+                other.buyer_iaid = "1-ff00:0:113"
+                failures = m.apply(activate=[c, other])
+                self.assertEqual(list(failures), [None])
+                self.assertEqual(failures[None][0].contract, other)
+                for ia, t in m.topologies.items():
+                    with self.subTest(ia):
+                        self.assertEqual(len(t.last_diff.added_interfaces), 1)
+                        with open(t.topofile) as f:
+                            topo = json.load(f)
+                        br = topo["border_routers"][t._generate_esdx_br_name(topo)]
+                        self.assertEqual(len(br["interfaces"]), 1)
+                self.assertEqual(m.apply(deactivate=[c]), {})
+                failures = m.apply(deactivate=[c])
+                self.assertEqual(sorted(failures), ["1-ff00:0:110", "1-ff00:0:111"])
+            self.assertRaises(ValueError, TopologyManager.from_files, files + files[:1])
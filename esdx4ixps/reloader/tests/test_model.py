@@ -0,0 +1,56 @@
+from pathlib import Path
+from reloader.model import FreeValuePool, TopologyModel
+from reloader.topology import Topology
+from unittest import TestCase
+from util import conversion
+
+import json
+
+
+DATADIR = Path(__file__).parent.joinpath("data")
+
+
+class TestFreeValuePool(TestCase):
+    def test_lowest_free(self):
+        pool = FreeValuePool(1, [1, 2, 4])
+        self.assertEqual(pool.lowest_free(), 3)
+        pool.take(3)
+        self.assertEqual(pool.lowest_free(), 5)
+        pool.release(2)
+        self.assertEqual(pool.lowest_free(), 2)
+        pool.release(0)  # below min_value, never returned
+        self.assertEqual(pool.lowest_free(), 2)
+        # agrees with Topology._find_lowest_free_value
+        for values, min_value in [([], 1), ([41, 1], 1), ([13, 14, 11], 11), ([], 50000)]:
+            with self.subTest():
+                self.assertEqual(
+                    FreeValuePool(min_value, values).lowest_free(),
+                    Topology._find_lowest_free_value(values, min_value))
+
+
+class TestTopologyModel(TestCase):
+    def test_model(self):
+        with open(Path(DATADIR, "topo.json")) as f:
+            topo = json.load(f)
+        model = TopologyModel(topo, 50000)
+        br_name, ifid = next(iter(
+            (k, i) for k, v in topo["border_routers"].items() for i in v["interfaces"]))
+        iface = topo["border_routers"][br_name]["interfaces"][ifid]
+        self.assertEqual(model.find_remote(iface["underlay"]["remote"]), (br_name, ifid))
+        self.assertNotEqual(model.ifids.lowest_free(), int(ifid))
+        model.remove_interface(br_name, ifid, iface)
+        self.assertIsNone(model.find_remote(iface["underlay"]["remote"]))
+        self.assertLessEqual(model.ifids.lowest_free(), int(ifid))
+        model.add_interface(br_name, ifid, iface)
+        self.assertEqual(model.find_remote(iface["underlay"]["remote"]), (br_name, ifid))
+
+    def test_internal_addrs(self):
+        with open(Path(DATADIR, "topo.json")) as f:
+            topo = json.load(f)
+        model = TopologyModel(topo, 50000)
+        ip, port = conversion.ip_port_from_str("127.0.0.17:31012")
+        self.assertEqual(model.internal_addr_users(ip, port), ["br1-ff00_0_111-1"])
+        self.assertEqual(model.internal_addr_users(ip, port + 1), [])
+        with self.assertRaises(RuntimeError):
+            Topology(Path(DATADIR, "topo.json"), internal_addr="127.0.0.17:31012")
+        Topology(Path(DATADIR, "topo.json"), internal_addr="127.0.0.17:31013")
@@ -0,0 +1,70 @@
+from defs import BW_PERIOD
+from market_pb2 import Contract
+from reloader.scheduler import Schedule, contract_intervals
+from unittest import TestCase
+from util import conversion
+
+
+def _contract(starting_on: int, bw_profile: str) -> Contract:
+    return Contract(
+        buyer_starting_on=conversion.pb_timestamp_from_seconds(starting_on),
+        buyer_bw_profile=bw_profile,
+    )
+
+
+class TestScheduler(TestCase):
+    def test_contract_intervals(self):
+        P = BW_PERIOD
+        cases = [  # tuples of ( bw_profile, expected intervals starting at 0 )
+            ("3,3", [(0, 2*P)]),
+            ("0,3", [(P, 2*P)]),
+            ("0", []),
+            ("1,0,1", [(0, P), (2*P, 3*P)]),
+            ("1,2,0,0,3,4,0", [(0, 2*P), (4*P, 6*P)]),
+        ]
+        for profile, expected in cases:
+            with self.subTest(profile):
+                self.assertEqual(contract_intervals(_contract(0, profile)), expected)
+        self.assertEqual(contract_intervals(_contract(10, "0,1")), [(10 + P, 10 + 2*P)])
+
+    def test_pop_due(self):
+        P = BW_PERIOD
+        s = Schedule()
+        c1 = _contract(0, "1,0,1")
+        c2 = _contract(P, "1")
+        self.assertEqual(s.add(c1), 2)
+        self.assertEqual(s.add(c2), 1)
+        self.assertEqual(s.add(_contract(0, "1"), now=P), 0)  # already finished
+        self.assertEqual(len(s), 6)
+        self.assertEqual(s.next_time(), 0)
+        self.assertEqual(s.pop_due(0), ([c1], []))
+        # c1 goes down and c2 up at P
+        self.assertEqual(s.pop_due(P), ([c2], [c1]))
+        # late: c1 up and c2 down at 2P, c1 down at 3P
+        self.assertEqual(s.pop_due(3*P), ([], [c2]))
+        self.assertEqual(len(s), 0)
+        self.assertIsNone(s.next_time())
+        # activation and deactivation in the same call: no change
+        s.add(c2)
+        self.assertEqual(s.pop_due(2*P), ([], []))
+        # already active: only the deactivation of the interval in progress
+        self.assertEqual(s.add(c1, now=P // 2, active=True), 2)
+        self.assertEqual(len(s), 3)
+        self.assertEqual(s.pop_due(P), ([], [c1]))
+        # pending events per contract
+        c2.contract_id = 2
+        s.add(c2)
+        self.assertEqual(s.contract_ids(), {0, 2})
+        self.assertEqual(s.remove(2), 2)
+        self.assertEqual(s.contract_ids(), {0})
+        self.assertEqual(s.next_time(), 2*P)
+
+    def test_many(self):
+        s = Schedule()
+        contracts = [_contract((i % 100) * BW_PERIOD, "1,0,1,1") for i in range(20000)]
+        for c in contracts:
+            s.add(c)
+        self.assertEqual(len(s), 80000)
+        activate, deactivate = s.pop_due(0)
+        self.assertEqual(len(activate), 200)
+        self.assertEqual(len(deactivate), 0)
@@ -6,8 +6,11 @@ from tempfile import TemporaryDirectory
 from unittest import TestCase
 from util import conversion
 import copy
+import hashlib
 import json
 import shutil
+import threading
+import time
 
 
 DATADIR = Path(__file__).parent.joinpath("data")
@@ -55,12 +58,14 @@ class TestTopology(TestCase):
                 topofile=Path(temp, "topo.json"),
                 internal_addr="1.1.1.1:43210",
                 attempts=2,
+                lock="create",
             )
             shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo2.json"))
             r2 = Topology(
                 topofile=Path(temp, "topo2.json"),
                 internal_addr="1.1.1.1:43210",
                 attempts=2,
+                lock="create",
             )
             filename = r.lockfile
             # check that lock file exists only during context
@@ -85,6 +90,7 @@ class TestTopology(TestCase):
                     topofile=Path(temp, "topo.json"),
                     internal_addr="1.1.1.1:43210",
                     attempts=2,
+                    lock="create",
                 )
                 self.assertEqual(r2.lockfile, filename)
                 with self.assertRaises(RuntimeError) as raised:
@@ -95,6 +101,7 @@ class TestTopology(TestCase):
                 topofile=Path(temp, "topo.json"),
                 internal_addr="1.1.1.1:43210",
                 attempts=2,
+                lock="create",
             )
             filename = r.lockfile
             class myException(Exception):
@@ -580,3 +587,182 @@ class TestTopology(TestCase):
             with open(Path(temp, "topo.json")) as f:
                 topo = json.load(f)
             self.assertNotIn("br1-ff00_0_111-1111", topo["border_routers"])
+
+    def test_apply(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            r = Topology(
+                topofile=Path(temp, "topo.json"),
+                internal_addr="1.1.1.1:43210",
+            )
+            contracts = []
+            for i in range(5):
+                c = self._mock_contract()
+                c.br_address = f"1.1.1.1:{50000 + i}"
+                contracts.append(c)
+            bad = self._mock_contract()
+            bad.buyer_iaid = "1-ff00:0:112"  # neither seller nor buyer
+            failures = r.activate_many(contracts + [bad])
+            self.assertEqual(len(failures), 1)
+            self.assertEqual(failures[0].contract, bad)
+            self.assertIsInstance(failures[0].error, RuntimeError)
+            with open(Path(temp, "topo.json")) as f:
+                topo = json.load(f)
+            br = topo["border_routers"]["br1-ff00_0_111-1111"]
+            self.assertEqual(len(br["interfaces"]), 5)
+
+            # remove the first two and add a new one, that reuses the lowest interface ID
+            c = self._mock_contract()
+            c.br_address = "1.1.1.1:50010"
+            failures = r.apply(activate=[c], deactivate=contracts[:2])
+            self.assertEqual(failures, [])
+            with open(Path(temp, "topo.json")) as f:
+                topo = json.load(f)
+            br = topo["border_routers"]["br1-ff00_0_111-1111"]
+            self.assertEqual(len(br["interfaces"]), 4)
+            self.assertEqual(br["interfaces"]["1"]["underlay"]["remote"], "1.1.1.1:50010")
+
+            # deactivating an unknown contract fails but does not affect the others
+            failures = r.deactivate_many(contracts[:3] + [c])
+            self.assertEqual([f.contract for f in failures], contracts[:2])
+            failures = r.deactivate_many(contracts[3:])
+            self.assertEqual(failures, [])
+            with open(Path(temp, "topo.json")) as f:
+                topo = json.load(f)
+            self.assertNotIn("br1-ff00_0_111-1111", topo["border_routers"])
+
+    def test_write_compact_and_checksum(self):
+        with TemporaryDirectory() as temp:
+            filename = Path(temp, "topo.json")
+            shutil.copyfile(Path(DATADIR, "topo.json"), filename)
+            filename.chmod(0o640)
+            r = Topology(
+                topofile=filename,
+                internal_addr="1.1.1.1:43210",
+                compact=True,
+                checksum=True,
+            )
+            r.activate(self._mock_contract())
+            raw = filename.read_bytes()
+            self.assertEqual(raw.count(b"\n"), 1)
+            self.assertIn("br1-ff00_0_111-1111", json.loads(raw)["border_routers"])
+            self.assertEqual(filename.stat().st_mode & 0o777, 0o640)
+            self.assertEqual(
+                r.checksumfile.read_text(),
+                f"{hashlib.sha256(raw).hexdigest()}  topo.json\n")
+            # no temporary files are left behind, only the flock lock file
+            self.assertEqual(sorted(p.name for p in Path(temp).iterdir()),
+                             [".flock.topo.json", "topo.json", "topo.json.sha256"])
+
+    def test_index(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            r = Topology(
+                topofile=Path(temp, "topo.json"),
+                internal_addr="1.1.1.1:43210",
+                index=True,
+            )
+            contracts = []
+            for i in range(3):
+                c = self._mock_contract()
+                c.contract_id = i + 1
+                c.br_address = f"1.1.1.1:{50000 + i}"
+                contracts.append(c)
+            before = time.time()
+            r.activate_many(contracts)
+            r.deactivate(contracts[0])
+            c = self._mock_contract()
+            c.contract_id = 4
+            c.br_address = "1.1.1.1:50010"
+            r.activate(c)  # reuses the interface ID 1
+            index = r.contract_index()
+            now = time.time()
+            self.assertEqual(len(index), 4)
+            self.assertEqual(index.lookup("1-ff00:0:111", 1, now), 4)
+            self.assertEqual(index.lookup("1-ff00:0:111", 3, now), 3)
+            first = [i for _, _, i in index.intervals() if i.contract_id == 1]
+            self.assertEqual(len(first), 1)
+            self.assertLessEqual(int(before), first[0].since)
+            self.assertIsNotNone(first[0].until)
+            # failed operations are not indexed
+            r.deactivate_many([contracts[0]])
+            self.assertEqual(len(r.contract_index()), 4)
+            # on the next update, the intervals older than the retention period are pruned
+            index.activate("1-ff00:0:111", 99, 99, 100)
+            index.deactivate("1-ff00:0:111", 99, 200)
+            r.indexfile.write_bytes(index.dumps())
+            r.deactivate(contracts[1])
+            index = r.contract_index()
+            self.assertEqual(sorted(i.contract_id for _, _, i in index.intervals()), [1, 2, 3, 4])
+            self.assertIsNone(Topology(Path(temp, "topo.json"), "1.1.1.1:43210").contract_index())
+
+    def test_flock(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            r = Topology(
+                topofile=Path(temp, "topo.json"),
+                internal_addr="1.1.1.1:43210",
+                lock="flock",
+            )
+            contracts = []
+            for i in range(10):
+                c = self._mock_contract()
+                c.br_address = f"1.1.1.1:{50000 + i}"
+                contracts.append(c)
+            threads = [threading.Thread(target=r.activate, args=(c,)) for c in contracts]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            with open(Path(temp, "topo.json")) as f:
+                topo = json.load(f)
+            self.assertEqual(len(topo["border_routers"]["br1-ff00_0_111-1111"]["interfaces"]), 10)
+            # the flock lock file is left behind, and the legacy one is taken too
+            self.assertTrue(r.lockfile.exists())
+            r2 = Topology(Path(temp, "topo.json"), internal_addr="1.1.1.1:43210", attempts=2,
+                          lock="create")
+            self.assertNotEqual(r2.lockfile, r.lockfile)
+            with r._lock():
+                self.assertTrue(r2.lockfile.exists())
+                self.assertRaises(RuntimeError, r2.deactivate, contracts[0])
+            self.assertFalse(r2.lockfile.exists())
+            r2.deactivate(contracts[0])
+            self.assertEqual(Topology(Path(temp, "topo.json"), "1.1.1.1:43210").lockfile, r.lockfile)
+            self.assertRaises(
+                ValueError,
+                Topology,
+                Path(temp, "topo.json"),
+                internal_addr="1.1.1.1:43210",
+                lock="foo",
+            )
+
+    def test_cached_model(self):
+        with TemporaryDirectory() as temp:
+            shutil.copyfile(Path(DATADIR, "topo.json"), Path(temp, "topo.json"))
+            r = Topology(
+                topofile=Path(temp, "topo.json"),
+                internal_addr="1.1.1.1:43210",
+            )
+            c1 = self._mock_contract()
+            r.activate(c1)
+            _, model = r._cached[1:]
+            c2 = self._mock_contract()
+            c2.br_address = "1.1.1.1:50001"
+            r.activate(c2)
+            self.assertIs(r._cached[2], model)  # not reloaded
+            # someone else modifies the file: the model is rebuilt
+            with open(Path(temp, "topo.json")) as f:
+                topo = json.load(f)
+            del topo["border_routers"]["br1-ff00_0_111-1111"]["interfaces"]["1"]
+            with open(Path(temp, "topo.json"), "w") as f:
+                json.dump(topo, f)
+            c3 = self._mock_contract()
+            c3.br_address = "1.1.1.1:50002"
+            r.activate(c3)
+            self.assertIsNot(r._cached[2], model)
+            with open(Path(temp, "topo.json")) as f:
+                topo = json.load(f)
+            br = topo["border_routers"]["br1-ff00_0_111-1111"]
+            self.assertEqual(br["interfaces"]["1"]["underlay"]["remote"], "1.1.1.1:50002")
+            r.deactivate(c2)
+            self.assertRaises(RuntimeError, r.deactivate, c1)
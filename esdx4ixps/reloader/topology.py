@@ -1,20 +1,22 @@
 from collections import defaultdict
-from contextlib import contextmanager
 from ipaddress import IPv4Address, IPv6Address, ip_address
-import ipaddress
-from unicodedata import name
 from market_pb2 import Contract
 from pathlib import Path
-from typing import Callable, Dict, List, NamedTuple, Union
+from reloader import codec
+from reloader import diff as topology_diff
+from reloader.index import ContractIndex, DEFAULT_RETENTION
+from reloader.locks import CreateFileLock, FlockLock, DEFAULT_LOCK
+from reloader.model import TopologyModel
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple, Union
 from util import conversion
-import json
+import hashlib
 import os
+import tempfile
 import time
 
 
-# TODO(juagargi): the (re)loading task should be executed automatically from a task manager,
-# such as Celery, Advanced Python Scheduler, or something else.
-# To simplify development, at the moment the events are triggered manually by an admin.
+# The (re)loading task can be executed automatically by the reloader daemon (reloader/daemon.py),
+# which reads the contracts from a spool directory. They can also be triggered manually.
 
 class Topology:
     """ Represents the SCiON topology """
@@ -26,6 +28,11 @@ class Topology:
         mtu: int
         link_to: str
 
+    class Failure(NamedTuple):
+        """ a contract that could not be (de)activated, and why """
+        contract: Contract
+        error: Exception
+
     def __init__(
         self,
         topofile: Path,
@@ -34,14 +41,30 @@ class Topology:
         min_port=50000,
         max_port=51000,
         attempts=10,
-        sleep=0.1):
+        sleep=0.1,
+        compact=False,
+        checksum=False,
+        lock=DEFAULT_LOCK,
+        index=False,
+        index_retention=DEFAULT_RETENTION):
         """
         internal_addr: e.g. "1.1.1.1:43210"
         router: a function fcn(IP)-: ip that returns the ip of the local interface to use. If None,
                 then a default of 127.0.0.1 for IPv4 and ::1 for IPv6 is used.
+        compact: write the topology without indentation.
+        checksum: after each write, also write the SHA256 of the topology to topofile.sha256,
+                  in the format of sha256sum.
+        lock: "flock" (the default) waits on flock(2) on .flock.<topofile> for at most
+              attempts*sleep seconds; it is released if the process dies. "create" is the
+              legacy backend, which polls `attempts` times every `sleep` seconds for the lock
+              file .lock.<topofile> to be created. "flock" also takes the legacy lock file, so
+              both kinds of processes can modify the same topology during a migration.
+        index: keep in topofile.contracts the contract of each assigned interface, over time
+               (see reloader/index.py).
+        index_retention: seconds the index keeps an interval after it ended, or None to keep
+                         them forever.
         """
         self.topofile = topofile
-        self.lockfile = Path(self.topofile).parent / Path(".lock." + topofile.name)
         self.internal_addr_ip, self.internal_addr_port = conversion.ip_port_from_str(internal_addr)
         if router is None:
             def _default_router(ip):
@@ -57,43 +80,46 @@ class Topology:
         self.max_port = max_port
         self.attempts = attempts
         self.sleep = sleep # seconds
+        self.compact = compact
+        self.checksum = checksum
+        self.checksumfile = Path(self.topofile).parent / Path(topofile.name + ".sha256")
+        self.indexfile = Path(self.topofile).parent / Path(topofile.name + ".contracts") \
+            if index else None
+        self.index_retention = index_retention
+        if lock == "create":
+            self.lockfile = Path(self.topofile).parent / Path(".lock." + topofile.name)
+            self._lock_backend = CreateFileLock(self.lockfile, attempts, sleep)
+        elif lock == "flock":
+            # the flock lock file is never removed: it would look held to the "create" backend
+            self.lockfile = Path(self.topofile).parent / Path(".flock." + topofile.name)
+            self._lock_backend = FlockLock(
+                self.lockfile, timeout=attempts * sleep,
+                legacy=Path(self.topofile).parent / Path(".lock." + topofile.name))
+        else:
+            raise ValueError(f"unknown lock type {lock}")
+        self.last_diff = None  # changes made by the last call to apply
         # check consistency of the topology and internal_addr
-        topo = self._load_topo()
-        for k, v in topo["border_routers"].items():
-            if not k.endswith("-1111"):
-                # check its internal address does not clash with the ESDX's one
-                ip, port = conversion.ip_port_from_str(v["internal_addr"])
-                if ip == self.internal_addr_ip and port == self.internal_addr_port:
-                    raise RuntimeError(f"internal address {internal_addr} already present in a " +\
-                        "non ESDX BR in the topology file")
+        signature, topo = self._read_topo()
+        model = TopologyModel(topo, self.min_port)
+        self._cached = (signature, topo, model)  # (file signature, topology, model)
+        self.isd_as = topo["isd_as"]
+        # check its internal address does not clash with the one of a non ESDX BR
+        brs = model.internal_addr_users(self.internal_addr_ip, self.internal_addr_port)
+        if any(not br_name.endswith("-1111") for br_name in brs):
+            raise RuntimeError(f"internal address {internal_addr} already present in a " +\
+                "non ESDX BR in the topology file")
 
     def _load_topo(self) -> dict:
-        with open(self.topofile) as r:
-            return json.load(r)
+        return self._read_topo()[1]
 
-    @contextmanager
-    def _lock(self):
-        def _lock():
-            ex = None
-            for attempts in range(self.attempts):
-                try:
-                    with open(self.lockfile, "x+b"):
-                        return
-                except FileExistsError as e:
-                    ex = e
-                    attempts += 1
-                    time.sleep(self.sleep)
-            if attempts >= self.attempts:
-                raise RuntimeError(ex) from ex
-        _lock()
-        try:
-            yield
-        finally:
-            try:
-                os.remove(self.lockfile)
-            except FileNotFoundError as ex:
-                raise RuntimeError(ex) from ex
+    def _read_topo(self) -> Tuple[tuple, dict]:
+        """ returns the file signature (see _file_signature) and the parsed topology """
+        with open(self.topofile, "rb") as r:
+            st = os.fstat(r.fileno())
+            return (st.st_ino, st.st_mtime_ns, st.st_size), codec.loads(r.read())
 
+    def _lock(self):
+        return self._lock_backend.acquire()
 
     def _contract_as_seller(self, c: Contract) -> TopoInfoFromContract:
         """ Returns the relevant info for the seller """
@@ -140,8 +166,13 @@ class Topology:
         ia = ia.replace(":", "_")
         return f"br{ia}-1111"
 
-    def _add_cotract_to_topo(self, topo: dict, info: TopoInfoFromContract):
+    def _add_cotract_to_topo(
+        self,
+        topo: dict,
+        info: TopoInfoFromContract,
+        model: Optional[TopologyModel]=None) -> int:
         """
+        Returns the ID of the new interface.
         The ESDX border router is one that ends in -1111. If none is found in the topology,
         this function adds one, with internal address deduced from the internal address of
         the other BRs. If there is more than one IP in the list of internal addresses,
@@ -150,24 +181,14 @@ class Topology:
         the public addresses of the other interfaces of all border routers. If more than
         one IP address exists in the list of public addresses, it raises an exception.
         The port is the first integer greater than zero not in use by other interface.
+        model: the indices of topo, updated with the new interface. If None, it is built here.
         """
+        if model is None:
+            model = TopologyModel(topo, self.min_port)
         # find the ESDX BR; create it if not there.
         # The ESDX BR is the one that ends with -1111
-        esdx_br = None
         esdx_br_name = self._generate_esdx_br_name(topo)
-        public_addrs = defaultdict(lambda: [])
-        ifid_inuse = []
-        for k, v in topo["border_routers"].items():
-            # add its interface IDs to the list
-            ifid_inuse.extend([int(k) for k in v["interfaces"].keys()])
-            # add its public addresses to the list
-            addrs = [interface["underlay"]["public"] for interface in v["interfaces"].values()]
-            for a in addrs:
-                ip, port = conversion.ip_port_from_str(a)
-                public_addrs[ip].append(port)
-            # is this the ESDX router?
-            if k == esdx_br_name:
-                esdx_br = v
+        esdx_br = topo["border_routers"].get(esdx_br_name)
         if esdx_br is None:
             esdx_br = {
                 "internal_addr": conversion.ip_port_to_str(
@@ -177,14 +198,14 @@ class Topology:
 
             topo["border_routers"][esdx_br_name] = esdx_br
         # add a new interface with the values from "info"
-        ifid = self._find_lowest_free_value(ifid_inuse)
+        ifid = model.ifids.lowest_free()
         remote_ip, _ = conversion.ip_port_from_str(info.remote_underlay)
         public_ip = self.router(remote_ip)
-        port = self._find_lowest_free_value(public_addrs[public_ip], min_value=self.min_port)
+        port = model.ports[public_ip].lowest_free()
         if port > self.max_port:
             raise RuntimeError(f"could not find a free port for public ip {public_ip}")
         public_addr = conversion.ip_port_to_str(public_ip, port)
-        esdx_br["interfaces"][str(ifid)] = {
+        iface = {
             "underlay": {
                 "public": public_addr,
                 "remote": info.remote_underlay,
@@ -193,23 +214,190 @@ class Topology:
             "mtu": info.mtu,
             "link_to": info.link_to,
         }
+        esdx_br["interfaces"][str(ifid)] = iface
+        model.add_interface(esdx_br_name, str(ifid), iface)
+        return ifid
 
     @staticmethod
-    def _remove_interface_from_br(topo: dict, info: TopoInfoFromContract):
-        for br in topo["border_routers"].values():
-            for ifid, iface in br["interfaces"].items():
-                if iface["underlay"]["remote"] == info.remote_underlay:
-                    del br["interfaces"][ifid]
-                    return
+    def _remove_interface_from_br(
+        topo: dict,
+        info: TopoInfoFromContract,
+        model: Optional[TopologyModel]=None) -> int:
+        """ returns the ID of the removed interface """
+        if model is None:
+            for br in topo["border_routers"].values():
+                for ifid, iface in br["interfaces"].items():
+                    if iface["underlay"]["remote"] == info.remote_underlay:
+                        del br["interfaces"][ifid]
+                        return int(ifid)
+        else:
+            found = model.find_remote(info.remote_underlay)
+            if found is not None:
+                br_name, ifid = found
+                iface = topo["border_routers"][br_name]["interfaces"].pop(ifid)
+                model.remove_interface(br_name, ifid, iface)
+                return int(ifid)
         raise RuntimeError(f"interface with remote {info.remote_underlay} not found in topology")
 
     @classmethod
-    def _remove_interface(cls, topo: dict, info: TopoInfoFromContract):
-        cls._remove_interface_from_br(topo, info)
+    def _remove_interface(
+        cls,
+        topo: dict,
+        info: TopoInfoFromContract,
+        model: Optional[TopologyModel]=None) -> int:
+        ifid = cls._remove_interface_from_br(topo, info, model)
         # remove esdx BR if empty
         br_id = cls._generate_esdx_br_name(topo)
-        if len(topo["border_routers"][br_id]["interfaces"]) == 0:
+        brs = topo["border_routers"]
+        if br_id in brs and len(brs[br_id]["interfaces"]) == 0:
             del topo["border_routers"][br_id]
+        return ifid
+
+    def _file_signature(self) -> tuple:
+        st = os.stat(self.topofile)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load_model(self) -> Tuple[dict, TopologyModel]:
+        """
+        Returns the topology and its model. They are kept across operations and only loaded
+        again if the file changed (another inode, modification time or size).
+        Must be called with the lock held.
+        """
+        if self._cached is None or self._cached[0] != self._file_signature():
+            signature, topo = self._read_topo()
+            self._cached = (signature, topo, TopologyModel(topo, self.min_port))
+        return self._cached[1], self._cached[2]
+
+    def _write_topo(self, topo: dict):
+        raw = codec.dumps(topo, self.compact)
+        self._atomic_write(Path(self.topofile), raw)
+        if self.checksum:
+            digest = hashlib.sha256(raw).hexdigest()
+            self._atomic_write(self.checksumfile, f"{digest}  {self.topofile.name}\n".encode())
+
+    @staticmethod
+    def _atomic_write(filename: Path, data: bytes):
+        """
+        Writes to a temporary file in the same directory and replaces filename with it, so
+        that readers (e.g. the border router) see either the old or the new contents.
+        The permissions of an existing file are kept.
+        """
+        try:
+            mode = os.stat(filename).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        fd, temp = tempfile.mkstemp(dir=filename.parent, prefix=f".tmp.{filename.name}.")
+        try:
+            with os.fdopen(fd, "wb") as w:
+                w.write(data)
+                w.flush()
+                os.fchmod(w.fileno(), mode)
+                os.fsync(w.fileno())
+            os.replace(temp, filename)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except FileNotFoundError:
+                pass
+            raise
+        # persist the rename itself
+        dirfd = os.open(filename.parent, os.O_RDONLY)
+        try:
+            os.fsync(dirfd)
+        finally:
+            os.close(dirfd)
+
+    def apply(
+        self,
+        activate: Iterable[Contract]=(),
+        deactivate: Iterable[Contract]=(),
+    ) -> List[Failure]:
+        """
+        Deactivates and activates many contracts under one lock, with one read and one write
+        of the topology. The deactivations are applied first, so that their interface IDs and
+        ports can be reused by the activations.
+        A contract that cannot be applied does not stop the others: the returned list contains
+        the failed contracts and their errors, and is empty if all of them succeeded.
+        The changes are left in self.last_diff; if there are none, the file is not written.
+        """
+        failures = []
+        changes = []  # (activated, ifid, contract ID) for the index
+        with self._lock():
+            topo, model = self._load_model()
+            before = topology_diff.snapshot(topo)
+            try:
+                for c in deactivate:
+                    try:
+                        info = self._contract_info(topo, c)
+                        changes.append((False, self._remove_interface(topo, info, model), c.contract_id))
+                    except Exception as ex:
+                        failures.append(Topology.Failure(c, ex))
+                for c in activate:
+                    try:
+                        info = self._contract_info(topo, c)
+                        changes.append((True, self._add_cotract_to_topo(topo, info, model), c.contract_id))
+                    except Exception as ex:
+                        failures.append(Topology.Failure(c, ex))
+                # a failed activation could have left a new and empty ESDX BR
+                br_id = self._generate_esdx_br_name(topo)
+                if br_id in topo["border_routers"] and \
+                        len(topo["border_routers"][br_id]["interfaces"]) == 0:
+                    del topo["border_routers"][br_id]
+                self.last_diff = topology_diff.diff(before, topo)
+                if not self.last_diff.is_empty():
+                    self._write_topo(topo)
+                    self._cached = (self._file_signature(), topo, model)
+                if self.indexfile is not None and len(changes) > 0:
+                    self._update_index(topo["isd_as"], changes)
+            except BaseException:
+                self._cached = None  # the cached topology no longer matches the file
+                raise
+        return failures
+
+    def _update_index(self, ia: str, changes: List[Tuple[bool, int, int]]):
+        """ must be called with the lock held, as other processes can update the index too """
+        index = ContractIndex(self.indexfile)
+        now = int(time.time())
+        for activated, ifid, contract_id in changes:
+            if activated:
+                index.activate(ia, ifid, contract_id, now)
+            else:
+                index.deactivate(ia, ifid, now)
+        if self.index_retention is not None:
+            index.prune(now - self.index_retention)
+        self._atomic_write(self.indexfile, index.dumps())
+
+    def contract_index(self) -> Optional[ContractIndex]:
+        """ the persisted index, or None if the topology does not keep one """
+        if self.indexfile is None:
+            return None
+        with self._lock():
+            return ContractIndex(self.indexfile)
+
+    @staticmethod
+    def diff(old: dict, new: dict) -> topology_diff.TopologyDiff:
+        """ the changes from the old to the new topology """
+        return topology_diff.diff(old, new)
+
+    def active(self, contracts: Iterable[Contract]) -> List[bool]:
+        """ whether the interface of each contract is in the topology """
+        result = []
+        with self._lock():
+            topo, model = self._load_model()
+            for c in contracts:
+                try:
+                    info = self._contract_info(topo, c)
+                except RuntimeError:  # not a contract of this AS
+                    result.append(False)
+                    continue
+                result.append(model.find_remote(info.remote_underlay) is not None)
+        return result
+
+    def activate_many(self, contracts: Iterable[Contract]) -> List[Failure]:
+        return self.apply(activate=contracts)
+
+    def deactivate_many(self, contracts: Iterable[Contract]) -> List[Failure]:
+        return self.apply(deactivate=contracts)
 
     def activate(self, c: Contract):
         """
@@ -218,27 +406,13 @@ class Topology:
         of the topology are done through this Topology class, activating/deactivating the
         contracts should have no race conditions.
         """
-        with self._lock():
-            # read topology
-            topo = self._load_topo()
-            # add contract
-            info = self._contract_info(topo, c)
-            self._add_cotract_to_topo(topo, info)
-            # write topology
-            with open(self.topofile, "w") as w:
-                raw = json.dumps(topo, indent=2) + "\n"
-                w.write(raw)
+        failures = self.apply(activate=[c])
+        if len(failures) > 0:
+            raise failures[0].error
 
     def deactivate(self, c: Contract):
-        with self._lock():
-            # read topology
-            topo = self._load_topo()
-            # find and remove interface. The remote underlay is unique; remove esdx BR if empty.
-            # TODO(juagargi) is the remote underlay unique per topology?
-            info = self._contract_info(topo, c)
-            self._remove_interface(topo, info)
-
-            # write topology
-            with open(self.topofile, "w") as w:
-                raw = json.dumps(topo, indent=2) + "\n"
-                w.write(raw)
+        # find and remove interface. The remote underlay is unique; remove esdx BR if empty.
+        # TODO(juagargi) is the remote underlay unique per topology?
+        failures = self.apply(deactivate=[c])
+        if len(failures) > 0:
+            raise failures[0].error
@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+from util import crypto
+import csv
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+
+# metrics of a benchmark summary, and whether a higher value is worse
+METRICS = {
+    "p50": True,
+    "p95": True,
+    "p99": True,
+    "mean": True,
+    "throughput": False,
+    "failed_attempt_ratio": True,
+    "rsa_sign_per_op": True,
+    "rsa_verify_per_op": True,
+}
+
+
+def percentile(samples: List[float], p: float) -> Optional[float]:
+    """ p in [0, 100]. Linear interpolation between the closest ranks; None if no samples """
+    if len(samples) == 0:
+        return None
+    s = sorted(samples)
+    k = (len(s) - 1) * p / 100
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+class BenchmarkResult:
+    """ latencies and counters of one benchmark (e.g. "purchase") in one run """
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []  # seconds, only of the successful operations
+        self.attempts = 0
+        self.failed_attempts = 0
+        self.elapsed = 0.0  # wall time of the whole benchmark
+        self.rsa_sign = 0
+        self.rsa_verify = 0
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """ the metrics that need successful operations are None without them """
+        ok = len(self.latencies)
+        return {
+            "name": self.name,
+            "operations": ok,
+            "attempts": self.attempts,
+            "failed_attempts": self.failed_attempts,
+            "failed_attempt_ratio": self.failed_attempts / self.attempts if self.attempts else 0.0,
+            "elapsed": self.elapsed,
+            "throughput": ok / self.elapsed if self.elapsed > 0 else 0.0,
+            "mean": sum(self.latencies) / ok if ok > 0 else None,
+            "p50": percentile(self.latencies, 50),
+            "p95": percentile(self.latencies, 95),
+            "p99": percentile(self.latencies, 99),
+            "rsa_sign": self.rsa_sign,
+            "rsa_verify": self.rsa_verify,
+            "rsa_sign_per_op": self.rsa_sign / ok if ok > 0 else None,
+            "rsa_verify_per_op": self.rsa_verify / ok if ok > 0 else None,
+        }
+
+
+def measure(
+    name: str,
+    operation: Callable,
+    iterations: int,
+    concurrency: int=1,
+    retryable: tuple=(Exception,),
+    prepare: Callable=None) -> BenchmarkResult:
+    """
+    Calls operation(i) for i in range(iterations), from `concurrency` threads.
+    If `prepare` is not None, operation(prepare(i)) is called instead, and only the operation
+    is timed.
+    An operation that raises one of `retryable` counts as a failed attempt and is retried,
+    up to 10 times. RSA operations done by this process during the benchmark are counted.
+    """
+    result = BenchmarkResult(name)
+    lock = threading.Lock()
+
+    def _run(i: int):
+        for _ in range(10):
+            arg = prepare(i) if prepare is not None else i
+            t0 = time.perf_counter()
+            try:
+                operation(arg)
+            except retryable:
+                with lock:
+                    result.attempts += 1
+                    result.failed_attempts += 1
+                continue
+            latency = time.perf_counter() - t0
+            with lock:
+                result.attempts += 1
+                result.latencies.append(latency)
+            return
+
+    with crypto.counting_operations():
+        sign0 = crypto.operation_counts["sign"]
+        verify0 = crypto.operation_counts["verify"]
+        t0 = time.perf_counter()
+        if concurrency <= 1:
+            for i in range(iterations):
+                _run(i)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(_run, range(iterations)))
+        result.elapsed = time.perf_counter() - t0
+        result.rsa_sign = crypto.operation_counts["sign"] - sign0
+        result.rsa_verify = crypto.operation_counts["verify"] - verify0
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def environment_metadata() -> Dict[str, str]:
+    """ describes where and when the benchmark ran """
+    versions = {}
+    for module in ["django", "grpc", "cryptography", "google.protobuf"]:
+        try:
+            versions[module] = __import__(module, fromlist=["__version__"]).__version__
+        except (ImportError, AttributeError):
+            versions[module] = ""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "hostname": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": _git_commit(),
+        "versions": versions,
+    }
+
+
+def write_json(path: Path, results: List[BenchmarkResult], metadata: dict=None):
+    doc = {
+        "metadata": metadata if metadata is not None else environment_metadata(),
+        "results": [r.summary() for r in results],
+    }
+    with open(path, "w") as f:
+        json.dump(doc, f, indent=2, allow_nan=False)
+        f.write("\n")
+
+
+def write_csv(path: Path, results: List[BenchmarkResult]):
+    rows = [r.summary() for r in results]
+    if len(rows) == 0:
+        return
+    with open(path, "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        w.writeheader()
+        w.writerows(rows)
+
+
+def load_json(path: Path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+class Regression(NamedTuple):
+    name: str  # the benchmark, e.g. "purchase"
+    metric: str  # e.g. "p95"
+    old: float
+    new: float
+    change: float  # relative change, positive means worse
+
+
+def compare(old: dict, new: dict, threshold: float=0.1) -> List[Regression]:
+    """
+    Compares two documents produced by write_json and returns the metrics of the benchmarks
+    present in both that got worse by more than `threshold` (relative). The metrics that are
+    null (no successful operations) in either of them are skipped.
+    """
+    old_results = {r["name"]: r for r in old["results"]}
+    regressions = []
+    for r in new["results"]:
+        if r["name"] not in old_results:
+            continue
+        o = old_results[r["name"]]
+        for metric, higher_is_worse in METRICS.items():
+            if metric not in r or metric not in o:
+                continue
+            old_value, new_value = o[metric], r[metric]
+            if old_value is None or new_value is None:
+                continue
+            if old_value == 0:
+                change = math.inf if new_value != 0 else 0.0
+            else:
+                change = (new_value - old_value) / abs(old_value)
+            if not higher_is_worse:
+                change = -change
+            if change > threshold:
+                regressions.append(Regression(r["name"], metric, old_value, new_value, change))
+    return regressions
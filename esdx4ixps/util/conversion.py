@@ -1,10 +1,11 @@
+# Django is only imported by the functions that need it, so that the processes that do not use
+# it, like the reloader, do not pay for importing it.
+from defs import BW_PERIOD
 from ipaddress import IPv4Address, IPv6Address, AddressValueError, NetmaskValueError
-from django.utils import timezone as tz
-from django.utils import dateparse
-from django.core.exceptions import ValidationError
 from google.protobuf.timestamp_pb2 import Timestamp
-from typing import List, Tuple, Union
-import pytz
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import datetime
+import functools
 import re
 
 
@@ -14,11 +15,17 @@ def csv_to_intlist(csv: str) -> List[int]:
 
 
 def time_from_str(s: str):
+    from django.utils import dateparse
     return dateparse.parse_datetime(s)
 
 
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
 def time_from_pb_timestamp(timestamp):
-    return tz.datetime.fromtimestamp(timestamp.seconds + timestamp.nanos / 1e9).astimezone(tz.utc)
+    # integer arithmetic: no float rounding and no conversion to local time
+    return _EPOCH + datetime.timedelta(seconds=timestamp.seconds,
+                                       microseconds=round(timestamp.nanos / 1000))
 
 
 def pb_timestamp_from_seconds(s: int):
@@ -26,14 +33,68 @@ def pb_timestamp_from_seconds(s: int):
 
 
 def pb_timestamp_from_time(time):
-    return pb_timestamp_from_seconds(int(time.timestamp()))
+    return pb_timestamp_from_seconds(epoch_from_time(time))
+
+
+# integer seconds since the epoch, truncated as in the serialized offers and contracts.
+# Slot arithmetic on them does not need any datetime object.
+
+def epoch_from_time(time) -> int:
+    return int(time.timestamp())
+
+
+def epoch_from_pb_timestamp(timestamp) -> int:
+    return timestamp.seconds
+
+
+def time_from_epoch(s: int):
+    return _EPOCH + datetime.timedelta(seconds=s)
+
+
+def bw_slot(t: int, origin: int, period: int=BW_PERIOD) -> Optional[int]:
+    """ index of the period starting at t, counting from origin; None if before or not aligned """
+    offset = t - origin
+    if offset < 0 or offset % period != 0:
+        return None
+    return offset // period
 
 
 def pb_timestamp_from_str(s: str):
     return pb_timestamp_from_time(time_from_str(s))
 
 
+# the usual forms of an IA: ISD-AS with the AS in decimal (BGP) or as three hex groups.
+# Only ASCII digits, as int() would also accept other unicode digits.
+_IA_BGP_RE = re.compile(r"([0-9]{1,5})-([0-9]{1,10})")
+_IA_HEX_RE = re.compile(r"([0-9]{1,5})-([0-9a-fA-F]{1,4}):([0-9a-fA-F]{1,4}):([0-9a-fA-F]{1,4})")
+_MAX_BGP_AS = (1 << 32) - 1
+
+
 def ia_str_to_int(ia: str) -> int:
+    return _ia_str_to_int_cached(str(ia))
+
+
+@functools.lru_cache(maxsize=4096)
+def _ia_str_to_int_cached(ia: str) -> int:
+    # fast path: a single regex match for the valid usual forms. Anything else, including
+    # all invalid values, goes to the complete parser, that raises the detailed errors.
+    m = _IA_HEX_RE.fullmatch(ia)
+    if m is not None:
+        isd = int(m.group(1))
+        if isd <= 65535:
+            return (isd << 48) | (int(m.group(2), 16) << 32) | (int(m.group(3), 16) << 16) | \
+                int(m.group(4), 16)
+    else:
+        m = _IA_BGP_RE.fullmatch(ia)
+        if m is not None:
+            isd = int(m.group(1))
+            as_value = int(m.group(2))
+            if isd <= 65535 and as_value <= _MAX_BGP_AS:
+                return (isd << 48) | as_value
+    return _ia_str_to_int_slow(ia)
+
+
+def _ia_str_to_int_slow(ia: str) -> int:
     ia = str(ia)
     # inspired from scionproto's python.lib.scion_addr parse routines
     parts = ia.split("-")
@@ -72,10 +133,41 @@ def ia_str_to_int(ia: str) -> int:
     return (isd << 48) | as_value
 
 
+def ia_int_to_str(ia: int) -> str:
+    """
+    The canonical string of an IA: the AS in decimal if it is in the BGP range, or in three
+    hex groups otherwise. ia_str_to_int(ia_int_to_str(v)) == v
+    """
+    if ia < 0 or ia >= 1 << 64:
+        raise ValueError(f"IA out of range: {ia}")
+    isd = ia >> 48
+    as_value = ia & ((1 << 48) - 1)
+    if as_value <= _MAX_BGP_AS:
+        return f"{isd}-{as_value}"
+    return f"{isd}-{as_value >> 32:x}:{(as_value >> 16) & 0xffff:x}:{as_value & 0xffff:x}"
+
+
+def ia_strs_to_ints(ias: Iterable[str]) -> List[int]:
+    """ ia_str_to_int for many IAs. Raises the ValueError of the first invalid one """
+    return [ia_str_to_int(ia) for ia in ias]
+
+
+def invalid_ias(ias: Iterable[str]) -> Dict[str, str]:
+    """ validates many IAs, returning the invalid ones with their error message """
+    errors = {}
+    for ia in set(map(str, ias)):
+        try:
+            _ia_str_to_int_cached(ia)
+        except ValueError as ex:
+            errors[ia] = str(ex)
+    return errors
+
+
 def _ia_validator(ia: str):
     try:
         ia_str_to_int(ia)
     except ValueError as ex:
+        from django.core.exceptions import ValidationError
         raise ValidationError(f"not a valid IA value: {str(ex)}")
 
 
@@ -84,24 +176,43 @@ def ia_validator():
     return _ia_validator
 
 
+_ADDRESS_RE = re.compile("(.*):(.*)")
+
+
 def _ip_and_string_from_str(s:str) -> Tuple[Union[IPv4Address, IPv6Address], str]:
     try:
-        parts = re.search("(.*):(.*)", s).groups()
+        parts = _ADDRESS_RE.search(s).groups()
     except Exception as ex:
         raise ValueError(f"invalid address {s}") from ex
     if len(parts) != 2:
         raise ValueError(f"invalid address {s}")
-    # IP address must be written as IPv4 or [IPv6]
-    try:
-        ip = IPv4Address(parts[0])
-    except (AddressValueError, NetmaskValueError):
-        addr = parts[0].strip("[]")
-        if addr == parts[0]:
+    # IP address must be written as IPv4 or [IPv6]. Brackets are never valid in IPv4, so
+    # dispatch on them instead of trying IPv4 first and catching the exception.
+    host = parts[0]
+    if host[:1] == "[" or host[-1:] == "]":
+        ip = IPv6Address(host.strip("[]"))
+    else:
+        try:
+            ip = IPv4Address(host)
+        except (AddressValueError, NetmaskValueError):
             raise ValueError(f"invalid address {s}") # missing []
-        ip = IPv6Address(addr)
     return ip, parts[1]
 
 
+def _cached_for_str(f):
+    """ LRU cache for functions of one string; other types skip the cache """
+    cached = functools.lru_cache(maxsize=4096)(f)
+    @functools.wraps(f)
+    def wrapper(s):
+        if type(s) is str:
+            return cached(s)
+        return f(s)
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+@_cached_for_str
 def ip_port_from_str(s: str) -> Tuple[Union[IPv4Address, IPv6Address], int]:
     ip, port = _ip_and_string_from_str(s)
     port = int(port)
@@ -110,6 +221,7 @@ def ip_port_from_str(s: str) -> Tuple[Union[IPv4Address, IPv6Address], int]:
     return (ip, port)
 
 
+@_cached_for_str
 def ip_port_range_from_str(s: str) -> Tuple[Union[IPv4Address, IPv6Address], int, int]:
     """ returns the IP, the min port and the max port """
     ip, port_range = _ip_and_string_from_str(s)
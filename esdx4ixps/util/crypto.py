@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from datetime import datetime
 from cryptography import x509
 from cryptography.x509.oid import NameOID
@@ -8,8 +9,48 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_der_private_key
 from cryptography.hazmat.primitives.asymmetric import padding
+from util import metrics
 
 import base64
+import threading
+
+
+# number of RSA operations done by this process while counting_operations is active, used by
+# the benchmarks. Otherwise the operations are not counted, and take no lock.
+operation_counts = {
+    "sign": 0,
+    "verify": 0,
+}
+_operation_counts_lock = threading.Lock()
+_counting = 0  # active counting_operations contexts
+
+metrics.registry.describe("esdx_crypto_seconds", "Time spent in RSA operations")
+metrics.registry.describe("esdx_crypto_invalid_signatures_total", "Failed signature validations")
+
+
+def _count_operation(op: str):
+    if _counting > 0:
+        with _operation_counts_lock:
+            operation_counts[op] += 1
+
+
+@contextmanager
+def counting_operations():
+    """ counts the RSA operations of the process in operation_counts while active """
+    global _counting
+    with _operation_counts_lock:
+        _counting += 1
+    try:
+        yield
+    finally:
+        with _operation_counts_lock:
+            _counting -= 1
+
+
+def reset_operation_counts():
+    with _operation_counts_lock:
+        for k in operation_counts:
+            operation_counts[k] = 0
 
 
 def get_common_name(cert: x509.Certificate) -> str:
@@ -107,20 +148,9 @@ def load_key(data, password=None):
 
 
 def signature_create(key: rsa.RSAPrivateKey, data: bytes) -> bytes:
-    return key.sign(
-        data,
-        padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()),
-            salt_length=padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256()
-    )
-
-
-def signature_validate(cert: x509.Certificate, signature: bytes, data: bytes) -> None:
-    try:
-        cert.public_key().verify(
-            signature,
+    _count_operation("sign")
+    with metrics.timer("esdx_crypto_seconds", operation="sign"):
+        return key.sign(
             data,
             padding.PSS(
                 mgf=padding.MGF1(hashes.SHA256()),
@@ -128,5 +158,26 @@ def signature_validate(cert: x509.Certificate, signature: bytes, data: bytes) ->
             ),
             hashes.SHA256()
         )
+
+
+def signature_validate(cert: x509.Certificate, signature: bytes, data: bytes) -> None:
+    signature_validate_with_key(cert.public_key(), signature, data)
+
+
+def signature_validate_with_key(key: rsa.RSAPublicKey, signature: bytes, data: bytes) -> None:
+    """ like signature_validate, for callers that keep the public keys of the certificates """
+    _count_operation("verify")
+    try:
+        with metrics.timer("esdx_crypto_seconds", operation="verify"):
+            key.verify(
+                signature,
+                data,
+                padding.PSS(
+                    mgf=padding.MGF1(hashes.SHA256()),
+                    salt_length=padding.PSS.MAX_LENGTH
+                ),
+                hashes.SHA256()
+            )
     except InvalidSignature as ex:
+        metrics.inc("esdx_crypto_invalid_signatures_total")
         raise ValueError("invalid signature") from ex
@@ -6,8 +6,9 @@ from pathlib import Path
 from util import conversion
 from util import crypto
 from util import serialize
-from util.standalone import run_django
+from util.standalone import run_django, InProcessMarket
 from util.test import test_data
+from util.verification import ContractVerifier
 from typing import List
 import defs
 import grpc
@@ -38,9 +39,16 @@ class Runner:
             "end": None,  # right before returning from run
         }
 
-    def run(self, flush_all_data: bool):
+    def run(self, flush_all_data: bool, market: InProcessMarket=None):
+        """
+        If market is None, the market is started in a subprocess with run_django. Otherwise,
+        the already started in-process market is used, and only reset if flush_all_data.
+        """
         self.timings["start"] = time.time()
-        django = run_django(flush_all_data)
+        if market is None:
+            django = run_django(flush_all_data)
+        elif flush_all_data:
+            market.reset()
         self.timings["before_execution"] = time.time()
         tasks = []
         with ThreadPoolExecutor() as executor:
@@ -59,10 +67,11 @@ class Runner:
             if result != 0:
                 res = 1
         self.timings["after_execution"] = time.time()
-        try:
-            django.terminate()
-        finally:
-            django.kill()
+        if market is None:
+            try:
+                django.terminate()
+            finally:
+                django.kill()
         self.timings["end"] = time.time()
         return res
 
@@ -81,6 +90,8 @@ class MarketClient:
         # load broker's certificate
         with open(test_data("broker.crt"), "r") as f:
             self.broker_cert = crypto.load_certificate(f.read())
+        # verifies offline the contracts bought by this client
+        self.verifier = ContractVerifier(self.broker_cert, {self.ia: self.cert})
 
     def sell_offer(self, offer: market_pb2.OfferSpecification) -> market_pb2.Offer:
         data = serialize.offer_specification_serialize_to_bytes(offer, False)
@@ -113,8 +124,8 @@ class MarketClient:
             offers = [o for o in response]
         return offers
 
-    def buy_offer(self, offer: market_pb2.Offer, bw_profile, starting_on):
-        """ returns the contract """
+    def _purchase_request(self, offer: market_pb2.Offer, bw_profile, starting_on):
+        """ returns the signed purchase request """
         # verify broker's signature
         offer_bytes = serialize.offer_serialize_to_bytes(offer, False)
         crypto.signature_validate(self.broker_cert, offer.specs.signature, offer_bytes)
@@ -134,10 +145,22 @@ class MarketClient:
             request.starting_on.ToSeconds()
         )
         request.signature = crypto.signature_create(self.key, data)
+        return request
+
+    def buy_offer(self, offer: market_pb2.Offer, bw_profile, starting_on):
+        """ returns the contract """
+        request = self._purchase_request(offer, bw_profile, starting_on)
         with grpc.insecure_channel(self.service_address) as channel:
             stub = market_pb2_grpc.MarketControllerStub(channel)
             return stub.Purchase(request)
 
+    def buy_equivalent_offer(self, offer: market_pb2.Offer, bw_profile, starting_on):
+        """ like buy_offer, but the market buys from the offer derived from `offer` """
+        request = self._purchase_request(offer, bw_profile, starting_on)
+        with grpc.insecure_channel(self.service_address) as channel:
+            stub = market_pb2_grpc.MarketControllerStub(channel)
+            return stub.PurchaseEquivalent(request)
+
     def get_contract(self, contract_id: int) -> market_pb2.Contract:
         data = serialize.get_contract_request_serialize(
             contract_id=contract_id,
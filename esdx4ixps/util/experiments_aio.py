@@ -0,0 +1,335 @@
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple
+from util import conversion
+from util import crypto
+from util import serialize
+from util.experiments import MarketClient
+from util.standalone import run_django, InProcessMarket
+import asyncio
+import grpc
+import market_pb2
+import market_pb2_grpc
+import math
+import random
+import time
+
+
+class RetryPolicy(NamedTuple):
+    """ how a client retries a failed purchase """
+    attempts: int = 10
+    backoff: float = 0.0  # seconds to wait before the first retry
+    backoff_factor: float = 2.0
+    max_backoff: float = 1.0
+
+    def delay(self, attempt: int) -> float:
+        """ seconds to wait before retrying, after `attempt` failed attempts (starting at 1) """
+        if self.backoff <= 0:
+            return 0.0
+        return min(self.max_backoff, self.backoff * self.backoff_factor ** (attempt - 1))
+
+
+def poisson_arrivals(n: int, rate: float, rng: random.Random=None) -> List[float]:
+    """ returns n arrival times (seconds from start) of a Poisson process with `rate` per second """
+    rng = rng or random.Random()
+    t = 0.0
+    arrivals = []
+    for _ in range(n):
+        t += rng.expovariate(rate)
+        arrivals.append(t)
+    return arrivals
+
+
+def bursty_arrivals(
+    n: int,
+    burst_size: int,
+    burst_interval: float,
+    jitter: float=0.0,
+    rng: random.Random=None) -> List[float]:
+    """
+    returns n arrival times (seconds from start) in bursts of `burst_size` clients
+    every `burst_interval` seconds. Each client is delayed uniformly in [0, jitter).
+    """
+    rng = rng or random.Random()
+    return [(i // burst_size) * burst_interval + rng.uniform(0, jitter) for i in range(n)]
+
+
+def constant_think_time(seconds: float) -> Callable[[random.Random], float]:
+    return lambda rng: seconds
+
+
+def exponential_think_time(mean: float) -> Callable[[random.Random], float]:
+    return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0.0
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies, in seconds. Each decade between min_value and max_value
+    is divided into `buckets_per_decade` buckets, so memory does not grow with the number of
+    samples. Percentiles are reported as the upper bound of their bucket.
+    """
+    def __init__(self, min_value: float=1e-4, max_value: float=100.0, buckets_per_decade: int=20):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.buckets_per_decade = buckets_per_decade
+        nbuckets = math.ceil(math.log10(max_value / min_value) * buckets_per_decade) + 1
+        self.counts = [0] * nbuckets
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        i = math.ceil(math.log10(value / self.min_value) * self.buckets_per_decade)
+        return min(i, len(self.counts) - 1)
+
+    def _upper_bound(self, index: int) -> float:
+        return self.min_value * 10 ** (index / self.buckets_per_decade)
+
+    def record(self, value: float):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        if len(self.counts) != len(other.counts):
+            raise ValueError("cannot merge histograms with different buckets")
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> float:
+        """ p in [0, 100] """
+        if self.count == 0:
+            return math.nan
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                if i == len(self.counts) - 1:
+                    return self.max  # overflow bucket
+                return min(self._upper_bound(i), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count > 0 else math.nan
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "min": self.min if self.count > 0 else math.nan,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max if self.count > 0 else math.nan,
+        }
+
+
+class LoadSession:
+    """
+    State shared by all clients of an AsyncRunner: one grpc.aio channel, the latency
+    histograms per RPC and the outcome counters.
+    """
+    def __init__(self, service_address: str, rng: random.Random):
+        self.service_address = service_address
+        self.rng = rng
+        self.channel = grpc.aio.insecure_channel(service_address)
+        self.stub = market_pb2_grpc.MarketControllerStub(self.channel)
+        self.latencies = {}  # RPC name -> LatencyHistogram
+        self.counters = {
+            "attempts": 0,
+            "failed_attempts": 0,
+            "succeeded": 0,
+            "gave_up": 0,
+        }
+        self._clients = {}  # cache of MarketClient per IA, to load keys only once
+
+    def client(self, ia: str) -> MarketClient:
+        """ returns the (cached) synchronous client, used only to hold the keys and sign """
+        if ia not in self._clients:
+            self._clients[ia] = MarketClient(ia, self.service_address)
+        return self._clients[ia]
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        if name not in self.latencies:
+            self.latencies[name] = LatencyHistogram()
+        return self.latencies[name]
+
+    async def timed(self, name: str, call):
+        """ awaits the RPC `call` and records its latency, failed or not """
+        t0 = time.perf_counter()
+        try:
+            return await call
+        finally:
+            self.histogram(name).record(time.perf_counter() - t0)
+
+    async def close(self):
+        await self.channel.close()
+
+
+class AsyncMarketClient:
+    """ asyncio version of MarketClient; all clients of a session share one channel """
+    def __init__(self, ia: str, session: LoadSession):
+        self.ia = ia
+        self.session = session
+        self.signer = session.client(ia)
+
+    async def _sign(self, data: bytes) -> bytes:
+        # RSA is CPU bound: run it outside the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, crypto.signature_create, self.signer.key, data)
+
+    async def list(self) -> List[market_pb2.Offer]:
+        async def _list():
+            return [o async for o in self.session.stub.ListOffers(market_pb2.ListRequest())]
+        return await self.session.timed("ListOffers", _list())
+
+    async def sell_offer(self, offer: market_pb2.OfferSpecification) -> market_pb2.Offer:
+        data = serialize.offer_specification_serialize_to_bytes(offer, False)
+        offer.signature = await self._sign(data)
+        return await self.session.timed("AddOffer", self.session.stub.AddOffer(offer))
+
+    async def buy_offer(self, offer: market_pb2.Offer, bw_profile: str, starting_on: datetime):
+        """ returns the contract """
+        offer_bytes = serialize.offer_serialize_to_bytes(offer, False)
+        crypto.signature_validate(self.signer.broker_cert, offer.specs.signature, offer_bytes)
+        request = market_pb2.PurchaseRequest(
+            offer=offer,
+            buyer_iaid=self.ia,
+            signature=b"",
+            bw_profile=bw_profile,
+            starting_on=conversion.pb_timestamp_from_time(starting_on),
+        )
+        data = serialize.purchase_order_fields_serialize_to_bytes(
+            serialize.offer_serialize_to_bytes(offer, True),
+            self.ia,
+            request.bw_profile,
+            request.starting_on.ToSeconds()
+        )
+        request.signature = await self._sign(data)
+        return await self.session.timed("Purchase", self.session.stub.Purchase(request))
+
+    async def get_contract(self, contract_id: int) -> market_pb2.Contract:
+        data = serialize.get_contract_request_serialize(
+            contract_id=contract_id,
+            requester_iaid=self.ia,
+            signature=None,
+        )
+        request = market_pb2.GetContractRequest(
+            contract_id=contract_id,
+            requester_iaid=self.ia,
+            requester_signature=await self._sign(data),
+        )
+        return await self.session.timed("GetContract", self.session.stub.GetContract(request))
+
+
+async def buyer(
+    session: LoadSession,
+    ia: str,
+    bw_profile: str="1",
+    retry: RetryPolicy=RetryPolicy(),
+    think_time: Callable[[random.Random], float]=constant_think_time(0)) -> int:
+    """
+    Simulated buyer: lists the offers, thinks for a while, and attempts to buy `bw_profile` from
+    the first one, starting at its notbefore. Retries according to `retry`.
+    Returns 0 if a contract was obtained, 1 otherwise.
+    """
+    c = AsyncMarketClient(ia, session)
+    for attempt in range(1, retry.attempts + 1):
+        session.counters["attempts"] += 1
+        try:
+            offers = await c.list()
+            if len(offers) == 0:
+                raise RuntimeError("no offers")
+            await asyncio.sleep(think_time(session.rng))
+            await c.buy_offer(
+                offer=offers[0],
+                bw_profile=bw_profile,
+                starting_on=conversion.time_from_pb_timestamp(offers[0].specs.notbefore),
+            )
+            session.counters["succeeded"] += 1
+            return 0
+        except (grpc.RpcError, RuntimeError):
+            session.counters["failed_attempts"] += 1
+            await asyncio.sleep(retry.delay(attempt))
+    session.counters["gave_up"] += 1
+    return 1
+
+
+class AsyncRunner:
+    """
+    Like util.experiments.Runner, but the buyers are coroutines sharing one grpc.aio channel,
+    which allows simulating tens of thousands of concurrent buyers from a single process.
+    Sellers are regular (blocking) functions, run in a thread before the buyers arrive.
+    """
+    def __init__(
+        self,
+        seller_fcn,  # the function to execute per seller
+        sellers_data,  # list of len(sellers) tuples, each with the parameters for seller_fcn
+        buyer_fcn,  # coroutine function called as buyer_fcn(session, *args)
+        buyers_data,  # list of len(buyers) tuples, each with the parameters for buyer_fcn
+        arrivals: List[float]=None,  # start time of each buyer in seconds; None means all at once
+        service_address: str="localhost:50051",
+        seed: int=None,
+    ):
+        if arrivals is not None and len(arrivals) != len(buyers_data):
+            raise ValueError(f"expected {len(buyers_data)} arrival times, got {len(arrivals)}")
+        self.seller_fcn = seller_fcn
+        self.sellers_data = sellers_data
+        self.buyer_fcn = buyer_fcn
+        self.buyers_data = buyers_data
+        self.arrivals = arrivals if arrivals is not None else [0.0] * len(buyers_data)
+        self.service_address = service_address
+        self.seed = seed
+        self.session = None
+        self.timings = { # times for certain events
+            "start": None,  # right after run starts
+            "before_execution": None,  # before the execution of the sellers and buyers
+            "after_execution": None,  # after the sellers and buyers have finished
+            "end": None,  # right before returning from run
+        }
+
+    async def _run_clients(self) -> int:
+        self.session = LoadSession(self.service_address, random.Random(self.seed))
+        try:
+            sellers = [asyncio.to_thread(self.seller_fcn, *args) for args in self.sellers_data]
+            results = await asyncio.gather(*sellers)
+
+            async def _arrive(at: float, args):
+                await asyncio.sleep(at)
+                return await self.buyer_fcn(self.session, *args)
+            results += await asyncio.gather(
+                *[_arrive(at, args) for at, args in zip(self.arrivals, self.buyers_data)])
+        finally:
+            await self.session.close()
+        return 0 if all(r == 0 for r in results) else 1
+
+    def run(self, flush_all_data: bool, market: InProcessMarket=None) -> int:
+        """ see util.experiments.Runner.run; with a market, its service address is used """
+        self.timings["start"] = time.time()
+        if market is None:
+            django = run_django(flush_all_data)
+        else:
+            self.service_address = market.service_address
+            if flush_all_data:
+                market.reset()
+        self.timings["before_execution"] = time.time()
+        try:
+            res = asyncio.run(self._run_clients())
+            self.timings["after_execution"] = time.time()
+        finally:
+            if market is None:
+                try:
+                    django.terminate()
+                finally:
+                    django.kill()
+        self.timings["end"] = time.time()
+        return res
@@ -0,0 +1,213 @@
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+import os
+import threading
+import time
+
+
+# Metrics are collected in this process and can be rendered in the Prometheus text format.
+# When disabled, timers and counters return immediately, so instrumented code pays only for
+# a function call and a boolean check.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_enabled = os.environ.get("ESDX_METRICS", "1") not in ("0", "false", "no", "off")
+
+
+def set_enabled(enabled: bool):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """ counters and histograms, identified by name and a tuple of (label, value) pairs """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> float
+        self.histograms = {}  # (name, labels) -> _Histogram
+        self.help = {}  # name -> help text
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def inc(self, name: str, value: float=1, labels: Tuple[Tuple[str, str]]=()):
+        with self._lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Tuple[Tuple[str, str]]=()):
+        with self._lock:
+            key = (name, labels)
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = _Histogram(DEFAULT_BUCKETS)
+            h.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self) -> Dict[str, float]:
+        """ flat view of the counters and the histogram counts and sums, mostly for tests """
+        with self._lock:
+            d = {_series(name, labels): v for (name, labels), v in self.counters.items()}
+            for (name, labels), h in self.histograms.items():
+                d[_series(name + "_count", labels)] = h.count
+                d[_series(name + "_sum", labels)] = h.sum
+        return d
+
+    def render(self) -> str:
+        """ the Prometheus text exposition format """
+        lines = []
+        with self._lock:
+            by_name = {}
+            for (name, labels), v in self.counters.items():
+                by_name.setdefault(name, []).append((labels, v))
+            for name in sorted(by_name):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, v in sorted(by_name[name]):
+                    lines.append(f"{_series(name, labels)} {_format(v)}")
+            by_name = {}
+            for (name, labels), h in self.histograms.items():
+                by_name.setdefault(name, []).append((labels, h))
+            for name in sorted(by_name):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, h in sorted(by_name[name], key=lambda x: x[0]):
+                    cumulative = 0
+                    for bound, c in zip(h.buckets + (float("inf"),), h.counts):
+                        cumulative += c
+                        le = "+Inf" if bound == float("inf") else _format(bound)
+                        lines.append(f"{_series(name + '_bucket', labels + (('le', le),))} " +\
+                            f"{cumulative}")
+                    lines.append(f"{_series(name + '_sum', labels)} {_format(h.sum)}")
+                    lines.append(f"{_series(name + '_count', labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str]]) -> str:
+    if len(labels) == 0:
+        return name
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels]
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+registry = Registry()
+
+
+def inc(name: str, value: float=1, **labels):
+    if not _enabled:
+        return
+    registry.inc(name, value, tuple(labels.items()))
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "t0")
+
+    def __init__(self, name: str, labels: Tuple[Tuple[str, str]]):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        registry.observe(self.name, time.perf_counter() - self.t0, self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str, **labels):
+    """ context manager that observes the time spent in its body, in seconds """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, tuple(labels.items()))
+
+
+def timed(name: str, **labels):
+    """ decorator that observes the time spent in each call of the function """
+    labels = tuple(labels.items())
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return f(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                registry.observe(name, time.perf_counter() - t0, labels)
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    return registry.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(address: str) -> ThreadingHTTPServer:
+    """
+    Serves the metrics at http://address/metrics from a daemon thread.
+    address: e.g. "localhost:9100"
+    """
+    host, port = address.rsplit(":", 1)
+    server = ThreadingHTTPServer((host.strip("[]"), int(port)), _MetricsHandler)
+    t = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    t.start()
+    return server
@@ -0,0 +1,216 @@
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.hazmat.primitives.asymmetric import rsa
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+from util import conversion
+from util import crypto
+from util import serialize
+
+import collections
+import grpc
+import market_pb2
+import market_pb2_grpc
+import os
+import threading
+
+
+# Seller side of the market. The market has no notifications for the sellers: when an offer is
+# partially sold, it deprecates it and lists a new one, signed by the broker, with the residual
+# bandwidth profile. The SellerAgent keeps a mirror of its offers, one lineage per offer it
+# submitted, and finds the sales by polling ListOffers over one persistent channel.
+
+
+class Lineage:
+    """ an offer submitted by the seller and the offers derived from it by the sales """
+    def __init__(self, specs: market_pb2.OfferSpecification, offer: market_pb2.Offer):
+        self.specs = specs  # as signed by the seller
+        self.offer_id: Optional[int] = offer.id  # the available offer; None if gone
+        self.bw_profile = conversion.csv_to_intlist(offer.specs.bw_profile)  # residual
+        self.key = _lineage_key(specs)
+
+    def is_active(self) -> bool:
+        return self.offer_id is not None
+
+    def sold(self) -> List[int]:
+        """ units sold per slot, so far """
+        return [o - r for o, r in zip(conversion.csv_to_intlist(self.specs.bw_profile), self.bw_profile)]
+
+
+class Sale(NamedTuple):
+    """ bandwidth sold from a lineage between two polls """
+    lineage: Lineage
+    offer_id: int  # the offer that was available before the sale
+    bw_profile: List[int]  # units sold per slot of the offer
+
+
+class Failure(NamedTuple):
+    specs: market_pb2.OfferSpecification
+    error: Exception
+
+
+def _lineage_key(specs: market_pb2.OfferSpecification) -> bytes:
+    """ the signed fields, except the bandwidth profile: they are the same in the derived offers """
+    s = market_pb2.OfferSpecification()
+    s.CopyFrom(specs)
+    s.bw_profile = ""
+    return serialize.offer_specification_serialize_to_bytes(s, False)
+
+
+class SellerAgent:
+    """
+    Signs and submits the offers of a seller, and notifies its sales.
+    The offers are signed in a pool of processes, and submitted with at most max_in_flight
+    AddOffer calls pending on the channel. on_sale is called with each Sale found by poll;
+    the offer specifications it returns are sold too, e.g. to offer again the sold bandwidth
+    at another price. Use it as a context manager, or call close().
+    """
+    def __init__(
+        self,
+        ia: str,
+        key: Union[rsa.RSAPrivateKey, str],
+        service_address: str,
+        on_sale: Callable[[Sale], Iterable[market_pb2.OfferSpecification]]=None,
+        max_workers: Optional[int]=None,
+        max_in_flight: int=64,
+    ):
+        """ key: the private key of the seller, or its PEM """
+        self.ia = ia
+        self._key_pem = key if isinstance(key, str) else crypto.key_to_pem(key)
+        self._key = crypto.load_key(self._key_pem)
+        self.on_sale = on_sale
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight
+        self.channel = grpc.insecure_channel(service_address)
+        self.stub = market_pb2_grpc.MarketControllerStub(self.channel)
+        self._pool = None  # created on the first batch to sign
+        self._lock = threading.Lock()
+        self.lineages: Dict[bytes, List[Lineage]] = {}  # lineage key -> lineages
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self.channel.close()
+
+    def __enter__(self) -> "SellerAgent":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def active_lineages(self) -> List[Lineage]:
+        with self._lock:
+            return [l for ls in self.lineages.values() for l in ls if l.is_active()]
+
+    def sign_many(self, specs: Iterable[market_pb2.OfferSpecification]) -> List[market_pb2.OfferSpecification]:
+        """ sets the signature of each offer specification, and returns them """
+        specs = list(specs)
+        data = [serialize.offer_specification_serialize_to_bytes(s, False) for s in specs]
+        if self.max_workers == 1 or len(specs) < 2:
+            signatures = [crypto.signature_create(self._key, d) for d in data]
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=_init_worker, initargs=(self._key_pem,))
+            chunksize = max(1, len(data) // (4 * self.max_workers))
+            signatures = list(self._pool.map(_sign_in_worker, data, chunksize=chunksize))
+        for s, signature in zip(specs, signatures):
+            s.signature = signature
+        return specs
+
+    def sell_many(self, specs: Iterable[market_pb2.OfferSpecification]) -> List[Failure]:
+        """
+        Signs and submits the offers. Returns the ones that failed, and why; the others are
+        added to the lineages.
+        """
+        specs = list(specs)
+        failures = [Failure(s, ValueError(f"offer of {s.iaid}, not of {self.ia}"))
+                    for s in specs if s.iaid != self.ia]
+        specs = self.sign_many(s for s in specs if s.iaid == self.ia)
+        pending = collections.deque()
+
+        def _complete():
+            s, future = pending.popleft()
+            try:
+                offer = future.result()
+            except grpc.RpcError as ex:
+                failures.append(Failure(s, ex))
+                return
+            lineage = Lineage(s, offer)
+            with self._lock:
+                self.lineages.setdefault(lineage.key, []).append(lineage)
+
+        for s in specs:
+            if len(pending) >= self.max_in_flight:
+                _complete()
+            pending.append((s, self.stub.AddOffer.future(s)))
+        while len(pending) > 0:
+            _complete()
+        return failures
+
+    def sell(self, specs: market_pb2.OfferSpecification) -> Lineage:
+        failures = self.sell_many([specs])
+        if len(failures) > 0:
+            raise failures[0].error
+        with self._lock:
+            return self.lineages[_lineage_key(specs)][-1]
+
+    def poll(self) -> List[Sale]:
+        """
+        Lists the offers of the market and updates the lineages. Returns the sales since the
+        last poll, after calling on_sale with each of them and selling what it returned.
+        The lineages with the same key (all fields but the profile) cannot be told apart: a
+        derived offer is attributed to any of them whose residual profile contains it.
+        """
+        listed: Dict[bytes, List[market_pb2.Offer]] = {}
+        for o in self.stub.ListOffers(market_pb2.ListRequest()):
+            if o.specs.iaid == self.ia:
+                listed.setdefault(_lineage_key(o.specs), []).append(o)
+        sales = []
+        with self._lock:
+            for key, lineages in self.lineages.items():
+                offers = {o.id: o for o in listed.get(key, [])}
+                changed = [l for l in lineages if l.is_active() and offers.pop(l.offer_id, None) is None]
+                for l in changed:
+                    derived = _find_derived(l, offers.values())
+                    old_id, old_profile = l.offer_id, l.bw_profile
+                    if derived is None:
+                        l.offer_id = None  # not listed anymore
+                        continue
+                    del offers[derived.id]
+                    l.offer_id = derived.id
+                    l.bw_profile = conversion.csv_to_intlist(derived.specs.bw_profile)
+                    sold = [o - n for o, n in zip(old_profile, l.bw_profile)]
+                    if any(u > 0 for u in sold):
+                        sales.append(Sale(l, old_id, sold))
+        if self.on_sale is not None:
+            new_specs = [s for sale in sales for s in self.on_sale(sale)]
+            if len(new_specs) > 0:
+                self.sell_many(new_specs)
+        return sales
+
+    def run(self, interval: float, stop: threading.Event):
+        """ polls every interval seconds until stop is set """
+        while not stop.is_set():
+            self.poll()
+            stop.wait(interval)
+
+
+def _find_derived(lineage: Lineage, offers: Iterable[market_pb2.Offer]) -> Optional[market_pb2.Offer]:
+    for o in offers:
+        profile = conversion.csv_to_intlist(o.specs.bw_profile)
+        if len(profile) == len(lineage.bw_profile) and \
+                all(n <= r for n, r in zip(profile, lineage.bw_profile)):
+            return o
+    return None
+
+
+_worker_key = None
+
+
+def _init_worker(key_pem: str):
+    global _worker_key
+    _worker_key = crypto.load_key(key_pem)
+
+
+def _sign_in_worker(data: bytes) -> bytes:
+    return crypto.signature_create(_worker_key, data)
@@ -1,6 +1,10 @@
+from util import metrics
 import market_pb2
 
 
+metrics.registry.describe("esdx_serialize_seconds", "Time spent serializing messages to sign")
+
+@metrics.timed("esdx_serialize_seconds", message="offer")
 def offer_fields_serialize_to_bytes(
     iaid: str,
     notbefore: int,
@@ -45,6 +49,7 @@ def offer_serialize_to_bytes(o: market_pb2.Offer, include_signature: bool) -> by
     return offer_specification_serialize_to_bytes(o.specs, include_signature)
 
 
+@metrics.timed("esdx_serialize_seconds", message="purchase_order")
 def purchase_order_fields_serialize_to_bytes(
     offer_bytes: bytes,
     ia_id: str,
@@ -59,6 +64,7 @@ def purchase_order_fields_serialize_to_bytes(
         b"buyer:" + ia_id.encode("ascii") + b"starting_on:" + str(starting_on).encode("ascii")
 
 
+@metrics.timed("esdx_serialize_seconds", message="contract")
 def contract_fields_serialize_to_bytes(
     purchase_order_bytes: bytes,
     buyer_signature: bytes,
@@ -75,6 +81,7 @@ def contract_fields_serialize_to_bytes(
         b"br_address:" + br_address.encode("ascii")
 
 
+@metrics.timed("esdx_serialize_seconds", message="get_contract_request")
 def get_contract_request_serialize(
     contract_id: int,
     requester_iaid: str,
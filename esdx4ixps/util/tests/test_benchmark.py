@@ -0,0 +1,112 @@
+from tempfile import TemporaryDirectory
+from pathlib import Path
+from unittest import TestCase
+from util import benchmark
+from util import crypto
+from util.test import test_data
+
+
+class TestPercentile(TestCase):
+    def test_percentile(self):
+        self.assertIsNone(benchmark.percentile([], 50))
+        self.assertEqual(benchmark.percentile([3], 99), 3)
+        samples = list(range(1, 101))  # 1..100
+        self.assertEqual(benchmark.percentile(samples, 0), 1)
+        self.assertEqual(benchmark.percentile(samples, 100), 100)
+        self.assertAlmostEqual(benchmark.percentile(samples, 50), 50.5)
+        self.assertAlmostEqual(benchmark.percentile(samples, 95), 95.05)
+        self.assertAlmostEqual(benchmark.percentile(list(reversed(samples)), 99), 99.01)
+
+
+class TestMeasure(TestCase):
+    def test_failed_attempts(self):
+        calls = []
+        def operation(i):
+            calls.append(i)
+            if len(calls) % 2 == 1:  # every other call fails
+                raise RuntimeError()
+        r = benchmark.measure("test", operation, 5, retryable=(RuntimeError,))
+        s = r.summary()
+        self.assertEqual(s["operations"], 5)
+        self.assertEqual(s["attempts"], 10)
+        self.assertEqual(s["failed_attempt_ratio"], 0.5)
+        self.assertEqual(len(r.latencies), 5)
+
+    def test_prepare(self):
+        got = []
+        benchmark.measure("test", got.append, 3, prepare=lambda i: i * 10)
+        self.assertEqual(got, [0, 10, 20])
+
+    def test_concurrency(self):
+        r = benchmark.measure("test", lambda i: None, 100, concurrency=4)
+        self.assertEqual(r.summary()["operations"], 100)
+
+    def test_rsa_counts(self):
+        with open(test_data("broker.key"), "r") as f:
+            key = crypto.load_key(f.read())
+        with open(test_data("broker.crt"), "r") as f:
+            cert = crypto.load_certificate(f.read())
+        def operation(i):
+            signature = crypto.signature_create(key, b"hello")
+            crypto.signature_validate(cert, signature, b"hello")
+            crypto.signature_validate(cert, signature, b"hello")
+        s = benchmark.measure("test", operation, 2).summary()
+        self.assertEqual(s["rsa_sign"], 2)
+        self.assertEqual(s["rsa_verify"], 4)
+        self.assertEqual(s["rsa_verify_per_op"], 2)
+        # not counted outside of the benchmarks
+        counts = dict(crypto.operation_counts)
+        operation(0)
+        self.assertEqual(crypto.operation_counts, counts)
+
+
+class TestOutput(TestCase):
+    @staticmethod
+    def _result(name: str, latency: float) -> benchmark.BenchmarkResult:
+        r = benchmark.BenchmarkResult(name)
+        r.latencies = [latency] * 10
+        r.attempts = 10
+        r.elapsed = latency * 10
+        return r
+
+    def test_write_and_compare(self):
+        with TemporaryDirectory() as temp:
+            old = Path(temp, "old.json")
+            new = Path(temp, "new.json")
+            benchmark.write_json(old, [self._result("list", 0.1), self._result("add", 0.2)])
+            benchmark.write_json(new, [self._result("list", 0.1), self._result("add", 0.3)])
+            benchmark.write_csv(Path(temp, "new.csv"), [self._result("list", 0.1)])
+            with open(Path(temp, "new.csv")) as f:
+                lines = f.readlines()
+            self.assertEqual(len(lines), 2)
+            self.assertTrue(lines[0].startswith("name,"))
+            old = benchmark.load_json(old)
+            new = benchmark.load_json(new)
+        self.assertIn("python", old["metadata"])
+        self.assertIn("cpu_count", old["metadata"])
+        self.assertEqual(benchmark.compare(old, old), [])
+        regressions = benchmark.compare(old, new, threshold=0.1)
+        self.assertTrue(all(r.name == "add" for r in regressions))
+        metrics = {r.metric for r in regressions}
+        self.assertIn("p50", metrics)
+        self.assertIn("throughput", metrics)
+        # faster is not a regression
+        self.assertEqual(benchmark.compare(new, old), [])
+
+    def test_no_successful_operations(self):
+        failed = benchmark.BenchmarkResult("add")
+        failed.attempts = failed.failed_attempts = 10
+        failed.elapsed = 1.0
+        with TemporaryDirectory() as temp:
+            path = Path(temp, "failed.json")
+            benchmark.write_json(path, [failed])
+            text = path.read_text()
+            failed = benchmark.load_json(path)
+        self.assertNotIn("NaN", text)
+        self.assertIsNone(failed["results"][0]["p50"])
+        self.assertIsNone(failed["results"][0]["mean"])
+        ok = {"results": [self._result("add", 0.1).summary()]}
+        # the null metrics are missing, the others are compared
+        self.assertEqual([r.metric for r in benchmark.compare(ok, failed)],
+                         ["throughput", "failed_attempt_ratio"])
+        self.assertEqual(benchmark.compare(failed, ok), [])
@@ -1,8 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from defs import BW_PERIOD
 from django.core.exceptions import ValidationError
 from ipaddress import ip_address
 from unittest import TestCase
 from util import conversion
+import random
 
 
 class TestConversions(TestCase):
@@ -36,6 +38,50 @@ class TestConversions(TestCase):
             else:
                 self.assertEqual(conversion.ia_str_to_int(s), val)
 
+    def test_ia_str_to_int_same_as_slow_path(self):
+        # the fast path must return the same values and raise the same errors
+        rng = random.Random(0)
+        alphabet = "0123456789abcdefABCDEFxX-:+_ \n\u0661"
+        cases = ["1-ff00:0:111", "1-0:0:1", "65536-1:2:3", "1-4294967296", "1-00000000001",
+                 "0x1-1", "1-0x1:0:0", "1-+1:2:3", "1-1_0", "1-1\n", "\u0661-1", "1-fffff:0:1"]
+        cases += ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 16)))
+                  for _ in range(3000)]
+        # and almost valid ones
+        isds = ["0", "1", "65535", "65536", "000001", "+1", " 1", "1_0", "0x1", "\u0661"]
+        groups = ["0", "ff00", "FFFF", "10000", "00ff", "+f", "f_f", "0x1", "", " 1"]
+        for _ in range(3000):
+            if rng.random() < 0.3:
+                as_part = rng.choice(["1", "4294967295", "4294967296", "00000000001", "+1"])
+            else:
+                as_part = ":".join(rng.choice(groups) for _ in range(3))
+            cases.append(f"{rng.choice(isds)}-{as_part}")
+        for s in cases:
+            with self.subTest(s=s):
+                try:
+                    expected = conversion._ia_str_to_int_slow(s)
+                except ValueError as ex:
+                    with self.assertRaises(ValueError) as raised:
+                        conversion.ia_str_to_int(s)
+                    self.assertEqual(str(raised.exception), str(ex))
+                else:
+                    self.assertEqual(conversion.ia_str_to_int(s), expected)
+
+    def test_ia_int_to_str(self):
+        for s in ["1-ff00:0:111", "0-0", "65535-ffff:ffff:ffff", "1-4294967295", "1-1:0:0"]:
+            with self.subTest(s=s):
+                self.assertEqual(conversion.ia_int_to_str(conversion.ia_str_to_int(s)), s)
+        self.assertEqual(conversion.ia_int_to_str(conversion.ia_str_to_int("1-0:0:1")), "1-1")
+        self.assertRaises(ValueError, conversion.ia_int_to_str, -1)
+        self.assertRaises(ValueError, conversion.ia_int_to_str, 1 << 64)
+
+    def test_bulk(self):
+        self.assertEqual(conversion.ia_strs_to_ints(["1-1", "1-0:0:1"]), [(1 << 48) | 1] * 2)
+        self.assertRaises(ValueError, conversion.ia_strs_to_ints, ["1-1", "1"])
+        self.assertEqual(conversion.invalid_ias(["1-1", "1", "65536-1", "1"]), {
+            "1": "expected ISD-AS",
+            "65536-1": "ISD out of range: 65536",
+        })
+
 
 class TestIPConversion(TestCase):
     cases = [ # tuples of (string, raises?, ip, port)
@@ -196,6 +242,31 @@ class TestTimeConversion(TestCase):
         ts = conversion.pb_timestamp_from_seconds(123456789)
         t = conversion.time_from_pb_timestamp(ts)
         self.assertEqual(int(t.timestamp()), ts.seconds)
+        ts.nanos = 999999999
+        t = conversion.time_from_pb_timestamp(ts)
+        self.assertEqual(t, datetime(1973, 11, 29, 21, 33, 10, tzinfo=timezone.utc))
+        for seconds in (0, 1, 1648843200, 1648843201, 2**33 + 7):
+            ts = conversion.pb_timestamp_from_seconds(seconds)
+            ts.nanos = 123456000
+            t = conversion.time_from_pb_timestamp(ts)
+            self.assertEqual(t.tzinfo, timezone.utc)
+            self.assertEqual(t.microsecond, 123456)
+            self.assertEqual(conversion.epoch_from_time(t), seconds)
+
+    def test_epoch(self):
+        t = datetime(2022, 4, 1, 20, 0, 0, 500000, tzinfo=timezone.utc)
+        s = conversion.epoch_from_time(t)
+        self.assertEqual(s, 1648843200)
+        self.assertEqual(conversion.epoch_from_pb_timestamp(conversion.pb_timestamp_from_time(t)), s)
+        self.assertEqual(conversion.time_from_epoch(s), t.replace(microsecond=0))
+        self.assertEqual(conversion.time_from_epoch(s).tzinfo, timezone.utc)
+
+    def test_bw_slot(self):
+        self.assertEqual(conversion.bw_slot(1000, 1000, 10), 0)
+        self.assertEqual(conversion.bw_slot(1030, 1000, 10), 3)
+        self.assertIsNone(conversion.bw_slot(1031, 1000, 10))
+        self.assertIsNone(conversion.bw_slot(990, 1000, 10))
+        self.assertEqual(conversion.bw_slot(1000 + 2 * BW_PERIOD, 1000), 2)
 
 
 class TestValidators(TestCase):
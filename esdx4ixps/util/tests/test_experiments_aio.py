@@ -0,0 +1,77 @@
+from unittest import TestCase
+from util import experiments_aio
+
+import math
+import random
+
+
+class TestArrivals(TestCase):
+    def test_poisson_arrivals(self):
+        arrivals = experiments_aio.poisson_arrivals(10000, rate=100, rng=random.Random(1))
+        self.assertEqual(len(arrivals), 10000)
+        self.assertEqual(arrivals, sorted(arrivals))
+        # the mean inter-arrival time is 1/rate
+        self.assertAlmostEqual(arrivals[-1] / len(arrivals), 0.01, delta=0.001)
+
+    def test_bursty_arrivals(self):
+        arrivals = experiments_aio.bursty_arrivals(5, burst_size=2, burst_interval=3)
+        self.assertEqual(arrivals, [0, 0, 3, 3, 6])
+        arrivals = experiments_aio.bursty_arrivals(
+            100, burst_size=10, burst_interval=1, jitter=0.5, rng=random.Random(1))
+        for i, t in enumerate(arrivals):
+            self.assertGreaterEqual(t, i // 10)
+            self.assertLess(t, i // 10 + 0.5)
+
+
+class TestRetryPolicy(TestCase):
+    def test_delay(self):
+        p = experiments_aio.RetryPolicy(attempts=5)
+        self.assertEqual(p.delay(1), 0)
+        p = experiments_aio.RetryPolicy(attempts=5, backoff=0.1, backoff_factor=2, max_backoff=0.3)
+        self.assertAlmostEqual(p.delay(1), 0.1)
+        self.assertAlmostEqual(p.delay(2), 0.2)
+        self.assertAlmostEqual(p.delay(3), 0.3)  # capped
+        self.assertAlmostEqual(p.delay(4), 0.3)
+
+
+class TestLatencyHistogram(TestCase):
+    def test_empty(self):
+        h = experiments_aio.LatencyHistogram()
+        self.assertEqual(h.count, 0)
+        self.assertTrue(math.isnan(h.percentile(50)))
+
+    def test_percentiles(self):
+        h = experiments_aio.LatencyHistogram(buckets_per_decade=100)
+        for i in range(1, 1001):
+            h.record(i / 1000)  # 1ms to 1s
+        self.assertEqual(h.count, 1000)
+        self.assertAlmostEqual(h.mean(), 0.5005)
+        # buckets are ~2.3% wide with 100 buckets per decade
+        self.assertAlmostEqual(h.percentile(50), 0.5, delta=0.5 * 0.025)
+        self.assertAlmostEqual(h.percentile(99), 0.99, delta=0.99 * 0.025)
+        self.assertEqual(h.percentile(100), 1.0)
+        self.assertEqual(h.min, 0.001)
+
+    def test_out_of_range(self):
+        h = experiments_aio.LatencyHistogram(min_value=0.001, max_value=1)
+        h.record(0)
+        h.record(10)
+        self.assertEqual(h.counts[0], 1)
+        self.assertEqual(h.counts[-1], 1)
+        self.assertEqual(h.percentile(100), 10)
+
+    def test_merge(self):
+        h1 = experiments_aio.LatencyHistogram()
+        h2 = experiments_aio.LatencyHistogram()
+        h1.record(0.01)
+        h2.record(0.02)
+        h2.record(0.03)
+        h1.merge(h2)
+        self.assertEqual(h1.count, 3)
+        self.assertAlmostEqual(h1.sum, 0.06)
+        self.assertEqual(h1.max, 0.03)
+        self.assertRaises(
+            ValueError,
+            h1.merge,
+            experiments_aio.LatencyHistogram(buckets_per_decade=3),
+        )
@@ -0,0 +1,81 @@
+from unittest import TestCase
+from urllib.request import urlopen
+from util import metrics
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.enabled = metrics.is_enabled()
+        metrics.set_enabled(True)
+        metrics.registry.clear()
+
+    def tearDown(self):
+        metrics.set_enabled(self.enabled)
+        metrics.registry.clear()
+
+    def test_counters_and_timers(self):
+        metrics.inc("requests_total", method="A")
+        metrics.inc("requests_total", 2, method="A")
+        metrics.inc("requests_total", method="B")
+        with metrics.timer("work_seconds", stage="x"):
+            pass
+        with metrics.timer("work_seconds", stage="x"):
+            pass
+        snap = metrics.registry.snapshot()
+        self.assertEqual(snap['requests_total{method="A"}'], 3)
+        self.assertEqual(snap['requests_total{method="B"}'], 1)
+        self.assertEqual(snap['work_seconds_count{stage="x"}'], 2)
+        self.assertGreaterEqual(snap['work_seconds_sum{stage="x"}'], 0)
+
+    def test_timer_with_exception(self):
+        with self.assertRaises(ValueError):
+            with metrics.timer("work_seconds"):
+                raise ValueError()
+        self.assertEqual(metrics.registry.snapshot()["work_seconds_count"], 1)
+
+    def test_timed(self):
+        @metrics.timed("fcn_seconds", fcn="f")
+        def f(x):
+            return x + 1
+        self.assertEqual(f(1), 2)
+        self.assertEqual(f.__name__, "f")
+        self.assertEqual(metrics.registry.snapshot()['fcn_seconds_count{fcn="f"}'], 1)
+
+    def test_disabled(self):
+        metrics.set_enabled(False)
+        metrics.inc("requests_total")
+        with metrics.timer("work_seconds"):
+            pass
+        @metrics.timed("fcn_seconds")
+        def f():
+            return 42
+        self.assertEqual(f(), 42)
+        self.assertEqual(metrics.registry.snapshot(), {})
+
+    def test_render(self):
+        metrics.registry.describe("requests_total", "Number of requests")
+        metrics.inc("requests_total", method='a"b')
+        metrics.registry.observe("work_seconds", 0.003)
+        metrics.registry.observe("work_seconds", 100)
+        text = metrics.render()
+        self.assertIn("# HELP requests_total Number of requests\n", text)
+        self.assertIn("# TYPE requests_total counter\n", text)
+        self.assertIn('requests_total{method="a\\"b"} 1\n', text)
+        self.assertIn("# TYPE work_seconds histogram\n", text)
+        self.assertIn('work_seconds_bucket{le="0.0025"} 0\n', text)
+        self.assertIn('work_seconds_bucket{le="0.005"} 1\n', text)
+        self.assertIn('work_seconds_bucket{le="10"} 1\n', text)
+        self.assertIn('work_seconds_bucket{le="+Inf"} 2\n', text)
+        self.assertIn("work_seconds_count 2\n", text)
+
+    def test_http_server(self):
+        metrics.inc("requests_total")
+        server = metrics.start_http_server("localhost:0")
+        try:
+            port = server.server_address[1]
+            with urlopen(f"http://localhost:{port}/metrics") as r:
+                text = r.read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn("requests_total 1\n", text)
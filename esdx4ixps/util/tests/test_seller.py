@@ -0,0 +1,65 @@
+from unittest import TestCase
+from util import conversion
+from util.experiments import MarketClient
+from util.seller import SellerAgent
+from util.standalone import InProcessMarket
+
+
+SELLER = "1-ff00:0:110"
+BUYER = "1-ff00:0:111"
+
+
+class TestSellerAgent(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.market = InProcessMarket().start()
+        cls.seller = MarketClient(SELLER, cls.market.service_address)
+        cls.buyer = MarketClient(BUYER, cls.market.service_address)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.market.stop()
+
+    def setUp(self):
+        self.market.reset()
+
+    def _buy(self, offer_id: int, bw_profile: str):
+        offer = [o for o in self.buyer.list() if o.id == offer_id][0]
+        self.buyer.buy_offer(offer, bw_profile, conversion.time_from_pb_timestamp(offer.specs.notbefore))
+
+    def test_sell_and_poll(self):
+        reoffered = []
+
+        def on_sale(sale):
+            # offer again the sold bandwidth of the first slot
+            specs = self.seller.create_simplified_offer(str(sale.bw_profile[0]))
+            reoffered.append(specs)
+            return [specs]
+
+        with SellerAgent(SELLER, self.seller.key, self.market.service_address,
+                         on_sale=on_sale, max_workers=2) as agent:
+            specs = [self.seller.create_simplified_offer("3,3") for _ in range(4)]
+            specs.append(self.seller.create_simplified_offer("3,3"))
+            specs[-1].iaid = BUYER
+            failures = agent.sell_many(specs)
+            self.assertEqual([f.specs for f in failures], [specs[-1]])
+            lineages = agent.active_lineages()
+            self.assertEqual(len(lineages), 4)
+            self.assertEqual(len(self.seller.list()), 4)
+            self.assertEqual(agent.poll(), [])
+
+            sold = lineages[1]
+            self._buy(sold.offer_id, "1,2")
+            sales = agent.poll()
+            self.assertEqual(len(sales), 1)
+            self.assertIs(sales[0].lineage, sold)
+            self.assertEqual(sales[0].bw_profile, [1, 2])
+            self.assertEqual(sold.bw_profile, [2, 1])
+            self.assertEqual(sold.sold(), [1, 2])
+            # the derived offer is followed
+            self._buy(sold.offer_id, "2,0")
+            self.assertEqual([s.bw_profile for s in agent.poll()], [[2, 0]])
+            self.assertEqual(sold.bw_profile, [0, 1])
+            self.assertEqual(len(reoffered), 2)
+            self.assertEqual(len(agent.active_lineages()), 6)
+            self.assertEqual(agent.poll(), [])
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from util import conversion
+from util.experiments import MarketClient
+from util.standalone import InProcessMarket
+
+
+class TestInProcessMarket(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.market = InProcessMarket().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.market.stop()
+
+    def setUp(self):
+        self.market.reset()
+
+    def test_concurrent_purchases(self):
+        seller = MarketClient("1-ff00:0:110", self.market.service_address)
+        buyer = MarketClient("1-ff00:0:111", self.market.service_address)
+        n = 20
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            offers = list(executor.map(
+                lambda _: seller.sell_offer(seller.create_simplified_offer(str(n))), range(4)))
+        self.assertEqual(len(buyer.list()), 4)
+
+        def buy(_):
+            return buyer.buy_equivalent_offer(
+                offers[0], "1", conversion.time_from_pb_timestamp(offers[0].specs.notbefore))
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            contracts = list(executor.map(buy, range(n)))
+        self.assertEqual(len({c.contract_id for c in contracts}), n)
+        listed = {o.specs.bw_profile for o in buyer.list()}
+        self.assertEqual(listed, {"0", str(n)})
@@ -0,0 +1,125 @@
+from defs import BW_PERIOD
+from google.protobuf.timestamp_pb2 import Timestamp
+from unittest import TestCase
+from util import crypto
+from util import serialize
+from util.test import test_data
+from util.verification import ContractVerifier, ContractVerificationError
+
+import market_pb2
+
+
+def _load(name: str):
+    with open(test_data(name), "r") as f:
+        return f.read()
+
+
+class TestContractVerifier(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.broker_key = crypto.load_key(_load("broker.key"))
+        cls.buyer_key = crypto.load_key(_load("1-ff00_0_111.key"))
+        cls.verifier = ContractVerifier(
+            _load("broker.crt"),
+            {"1-ff00:0:111": crypto.load_certificate(_load("1-ff00_0_111.crt"))},
+        )
+
+    def _offer(self, bw_profile: str="2,2,2,2") -> market_pb2.OfferSpecification:
+        o = market_pb2.OfferSpecification(
+            iaid="1-ff00:0:110",
+            notbefore=Timestamp(seconds=1648843200),
+            notafter=Timestamp(seconds=1648843200 + 4 * BW_PERIOD),
+            reachable_paths="*",
+            qos_class=1,
+            price_per_unit=0.05,
+            bw_profile=bw_profile,
+            br_address_template="10.1.1.1:50000-50010",
+            br_mtu=1500,
+            br_link_to="PARENT",
+        )
+        o.signature = crypto.signature_create(
+            self.broker_key, serialize.offer_specification_serialize_to_bytes(o, False))
+        return o
+
+    def _contract(self, offer, requested_offer=None, bw_profile="1,2", slot=1,
+                  br_address="10.1.1.1:50003") -> market_pb2.Contract:
+        """ signs the contract as the buyer and the broker do """
+        requested_offer = offer if requested_offer is None else requested_offer
+        starting_on = offer.notbefore.seconds + slot * BW_PERIOD
+        po_bytes = serialize.purchase_order_fields_serialize_to_bytes(
+            serialize.offer_specification_serialize_to_bytes(requested_offer, True),
+            "1-ff00:0:111",
+            bw_profile,
+            starting_on,
+        )
+        buyer_signature = crypto.signature_create(self.buyer_key, po_bytes)
+        contract_bytes = serialize.contract_fields_serialize_to_bytes(
+            po_bytes, buyer_signature, 1648840000, br_address)
+        return market_pb2.Contract(
+            contract_id=1,
+            contract_timestamp=Timestamp(seconds=1648840000),
+            contract_signature=crypto.signature_create(self.broker_key, contract_bytes),
+            offer=offer,
+            br_address=br_address,
+            buyer_iaid="1-ff00:0:111",
+            buyer_starting_on=Timestamp(seconds=starting_on),
+            buyer_bw_profile=bw_profile,
+            buyer_signature=buyer_signature,
+        )
+
+    def test_verify(self):
+        offer = self._offer()
+        c = self._contract(offer)
+        self.verifier.verify(c)
+        # tampered fields
+        cases = {
+            "br_address": "10.1.1.1:50004",
+            "buyer_bw_profile": "1,1",
+            "contract_signature": b"bad",
+        }
+        for field, value in cases.items():
+            bad = market_pb2.Contract()
+            bad.CopyFrom(c)
+            setattr(bad, field, value)
+            self.assertRaises(ContractVerificationError, self.verifier.verify, bad)
+        bad = market_pb2.Contract()
+        bad.CopyFrom(c)
+        bad.offer.bw_profile = "2,2,2,3"
+        self.assertRaisesRegex(ContractVerificationError, "offer", self.verifier.verify, bad)
+        bad.buyer_iaid = "1-ff00:0:112"
+        self.assertRaisesRegex(ContractVerificationError, "unknown buyer", self.verifier.verify, bad)
+
+    def test_profile_and_address(self):
+        offer = self._offer()
+        for kwargs in [
+            {"bw_profile": "3"},
+            {"bw_profile": "1,1,1,1", "slot": 1},
+            {"bw_profile": "0,0"},
+            {"br_address": "10.1.1.1:50011"},
+            {"br_address": "10.1.1.2:50003"},
+        ]:
+            c = self._contract(offer, **kwargs)
+            self.assertRaises(ContractVerificationError, self.verifier.verify, c)
+        c = self._contract(offer)
+        c.buyer_starting_on.seconds += 1
+        self.assertRaisesRegex(ContractVerificationError, "aligned", self.verifier.verify, c)
+
+    def test_purchase_equivalent(self):
+        requested = self._offer("2,2,2,2")
+        derived = self._offer("2,1,1,2")
+        c = self._contract(derived, requested_offer=requested, bw_profile="1,1")
+        self.assertRaises(ContractVerificationError, self.verifier.verify, c)
+        self.verifier.verify(c, requested)
+
+    def test_verify_many(self):
+        offer = self._offer()
+        good = self._contract(offer)
+        bad = market_pb2.Contract()
+        bad.CopyFrom(good)
+        bad.br_address = "10.1.1.1:50004"
+        contracts = [good, bad, good, good, bad]
+        for workers in (1, 2):
+            errors = self.verifier.verify_many(contracts, max_workers=workers)
+            self.assertEqual([e is None for e in errors], [True, False, True, True, False])
+            self.assertIn("contract: invalid signature", errors[1])
+        self.assertRaises(ValueError, self.verifier.verify_many, contracts, [None])
@@ -0,0 +1,200 @@
+from concurrent.futures import ProcessPoolExecutor
+from cryptography import x509
+from typing import Iterable, List, Mapping, Optional, Union
+from util import conversion
+from util import crypto
+from util import serialize
+
+import market_pb2
+import os
+import threading
+
+
+# Offline verification of the contracts issued by the market, e.g. by a buyer that received one,
+# or by a seller auditing all the contracts of its offers. Nothing is requested from the market:
+# only the certificates of the broker and of the buyers are needed.
+
+
+class ContractVerificationError(ValueError):
+    pass
+
+
+class ContractVerifier:
+    """
+    Verifies the whole chain of a contract: the offer signed by the broker, the purchase order
+    signed by the buyer, and the contract signed by the broker. Also checks that the purchased
+    bandwidth profile fits in the offer, and the BR address in its template.
+    The public keys are extracted once per certificate and kept.
+    certificates: IA -> certificate of the buyers, as x509.Certificate, PEM or DER.
+    """
+    def __init__(
+        self,
+        broker_certificate: Union[x509.Certificate, str, bytes],
+        certificates: Mapping[str, Union[x509.Certificate, str, bytes]]=None,
+    ):
+        self._keys = {}  # PEM -> public key
+        self._keys_lock = threading.Lock()
+        self._broker_pem = self._pem(broker_certificate)
+        self._pems = {}  # IA -> PEM
+        for ia, cert in (certificates or {}).items():
+            self.add_certificate(ia, cert)
+
+    def __getstate__(self):
+        # the keys cannot be pickled: the worker processes extract their own
+        return {"_broker_pem": self._broker_pem, "_pems": self._pems}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._keys = {}
+        self._keys_lock = threading.Lock()
+
+    def add_certificate(self, ia: str, cert: Union[x509.Certificate, str, bytes]):
+        self._pems[ia] = self._pem(cert)
+
+    def _pem(self, cert: Union[x509.Certificate, str, bytes]) -> str:
+        if not isinstance(cert, x509.Certificate):
+            cert = crypto.load_certificate(cert)
+        pem = crypto.certificate_to_pem(cert)
+        with self._keys_lock:
+            self._keys.setdefault(pem, cert.public_key())
+        return pem
+
+    def _key(self, pem: str):
+        key = self._keys.get(pem)
+        if key is None:
+            key = crypto.load_certificate(pem).public_key()
+            with self._keys_lock:
+                key = self._keys.setdefault(pem, key)
+        return key
+
+    def verify(
+        self,
+        contract: market_pb2.Contract,
+        requested_offer: Optional[market_pb2.OfferSpecification]=None,
+    ):
+        """
+        Raises ContractVerificationError if the contract is not valid.
+        requested_offer: the offer specified in the purchase request, if it is not the one in the
+        contract. This happens with PurchaseEquivalent, where the contract contains the offer
+        derived from the requested one, but the signatures of the buyer and the broker are done
+        on the requested one.
+        """
+        offer = contract.offer
+        pem = self._pems.get(contract.buyer_iaid)
+        if pem is None:
+            raise ContractVerificationError(f"unknown buyer {contract.buyer_iaid}")
+        try:
+            _check_profile(contract)
+            _check_br_address(contract)
+        except ContractVerificationError:
+            raise
+        except ValueError as ex:
+            raise ContractVerificationError(f"malformed contract: {ex}") from ex
+        broker_key = self._key(self._broker_pem)
+        signed_offers = [offer] if requested_offer is None else [offer, requested_offer]
+        for o in signed_offers:
+            try:
+                crypto.signature_validate_with_key(
+                    broker_key, o.signature, serialize.offer_specification_serialize_to_bytes(o, False))
+            except ValueError as ex:
+                raise ContractVerificationError(f"offer: {ex}") from ex
+        purchase_order_bytes = serialize.purchase_order_fields_serialize_to_bytes(
+            serialize.offer_specification_serialize_to_bytes(signed_offers[-1], True),
+            contract.buyer_iaid,
+            contract.buyer_bw_profile,
+            contract.buyer_starting_on.seconds,
+        )
+        try:
+            crypto.signature_validate_with_key(
+                self._key(pem), contract.buyer_signature, purchase_order_bytes)
+        except ValueError as ex:
+            raise ContractVerificationError(f"purchase order: {ex}") from ex
+        contract_bytes = serialize.contract_fields_serialize_to_bytes(
+            purchase_order_bytes,
+            contract.buyer_signature,
+            contract.contract_timestamp.seconds,
+            contract.br_address,
+        )
+        try:
+            crypto.signature_validate_with_key(broker_key, contract.contract_signature, contract_bytes)
+        except ValueError as ex:
+            raise ContractVerificationError(f"contract: {ex}") from ex
+
+    def verify_many(
+        self,
+        contracts: Iterable[market_pb2.Contract],
+        requested_offers: Optional[Iterable[Optional[market_pb2.OfferSpecification]]]=None,
+        max_workers: Optional[int]=None,
+    ) -> List[Optional[str]]:
+        """
+        Verifies the contracts in a pool of processes. Returns, for each contract, None if it is
+        valid or the reason why it is not.
+        requested_offers: as in verify, one per contract.
+        """
+        contracts = list(contracts)
+        requested_offers = [None] * len(contracts) if requested_offers is None \
+            else list(requested_offers)
+        if len(requested_offers) != len(contracts):
+            raise ValueError("one requested offer per contract expected")
+        max_workers = max_workers or os.cpu_count() or 1
+        if max_workers == 1 or len(contracts) < 2:
+            return [self._verify_or_error(c, o) for c, o in zip(contracts, requested_offers)]
+        tasks = [(c.SerializeToString(), None if o is None else o.SerializeToString())
+                 for c, o in zip(contracts, requested_offers)]
+        with ProcessPoolExecutor(
+                max_workers=max_workers, initializer=_init_worker, initargs=(self,)) as pool:
+            chunksize = max(1, len(tasks) // (4 * max_workers))
+            return list(pool.map(_verify_in_worker, tasks, chunksize=chunksize))
+
+    def _verify_or_error(
+        self,
+        contract: market_pb2.Contract,
+        requested_offer: Optional[market_pb2.OfferSpecification],
+    ) -> Optional[str]:
+        try:
+            self.verify(contract, requested_offer)
+            return None
+        except ValueError as ex:
+            return str(ex)
+
+
+def _check_profile(contract: market_pb2.Contract):
+    """ same rules as Offer.purchase: the purchased profile must fit in the offered one """
+    offer = contract.offer
+    slot = conversion.bw_slot(contract.buyer_starting_on.seconds, offer.notbefore.seconds)
+    if slot is None:
+        raise ContractVerificationError("starting_on not aligned to a slot of the offer")
+    offered = conversion.csv_to_intlist(offer.bw_profile)[slot:]
+    bought = conversion.csv_to_intlist(contract.buyer_bw_profile)
+    if len(bought) > len(offered):
+        raise ContractVerificationError("bandwidth profile longer than the offer")
+    if any(b < 0 or b > o for b, o in zip(bought, offered)) or sum(bought) == 0:
+        raise ContractVerificationError("bandwidth profile not contained in the offer")
+
+
+def _check_br_address(contract: market_pb2.Contract):
+    ip, port = conversion.ip_port_from_str(contract.br_address)
+    template_ip, min_port, max_port = conversion.ip_port_range_from_str(
+        contract.offer.br_address_template)
+    if ip != template_ip or not min_port <= port <= max_port:
+        raise ContractVerificationError(
+            f"BR address {contract.br_address} not in {contract.offer.br_address_template}")
+
+
+_worker_verifier: Optional[ContractVerifier] = None
+
+
+def _init_worker(verifier: ContractVerifier):
+    global _worker_verifier
+    _worker_verifier = verifier
+
+
+def _verify_in_worker(task) -> Optional[str]:
+    contract_bytes, offer_bytes = task
+    contract = market_pb2.Contract()
+    contract.ParseFromString(contract_bytes)
+    offer = None
+    if offer_bytes is not None:
+        offer = market_pb2.OfferSpecification()
+        offer.ParseFromString(offer_bytes)
+    return _worker_verifier._verify_or_error(contract, offer)